@@ -0,0 +1,164 @@
+"""
+Memory-aware admission control for generation batches
+
+Each batch reserves its estimated peak working memory (activations and VAE
+decode buffers; model weights are budgeted by the tiered model cache)
+against ADMISSION_MEMORY_BUDGET_MB. Batches that do not fit are split,
+switched to sliced attention/VAE, or wait in the queue until running
+batches release their reservations.
+"""
+
+import logging
+import threading
+import torch
+from config import *
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ATTENTION_HEADS = 8  # SD 1.x attention heads at the highest-resolution blocks
+FEATURE_CHANNELS = 320  # SD 1.x UNet channels at latent resolution
+ACTIVATION_FACTOR = 12  # Live feature maps at the UNet's peak, in units of one full-resolution map
+VAE_DECODE_CHANNELS = 128  # VAE decoder channels at output resolution
+VAE_DECODE_FACTOR = 3  # Live decoder feature maps at its peak
+
+
+class Reservation:
+    """Memory held by one admitted batch"""
+
+    def __init__(self, nbytes, estimated):
+        self.nbytes = nbytes
+        self.estimated = estimated
+
+
+class AdmissionController:
+    def __init__(self, budget_mb=ADMISSION_MEMORY_BUDGET_MB, device=None):
+        """
+        Initialize the controller
+
+        Args:
+            budget_mb: Memory that running batches may reserve in total
+            device: Inference device; sets the activation dtype (defaults to cuda when available)
+        """
+        self.budget = budget_mb * 1024 * 1024
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.dtype_bytes = 2 if self.device == "cuda" else 4
+        self.reserved = 0
+        self.correction = 1.0  # Measured / estimated peak, learned from finished batches
+        self.admitted = 0
+        self.split = 0
+        self.sliced = 0
+        self.oversized = 0
+        self.lock = threading.Lock()
+
+    def estimate(self, params_list, sliced=False):
+        """
+        Estimate the peak working memory of running params_list as one batch
+
+        Steps change how long memory is held, not how much, so the estimate
+        depends on resolution, batch size, guidance and slicing.
+
+        Returns:
+            int: Estimated bytes
+        """
+        size = params_list[0]["size"]
+        batch = len(params_list)
+        latent_pixels = (size // 8) ** 2
+        # Classifier-free guidance runs the conditional and unconditional pass together
+        guided = params_list[0].get("guidance_scale", DEFAULT_GUIDANCE_SCALE) > 1
+        unet_batch = batch * 2 if guided else batch
+        # Unsliced runs never hold more than half the heads' attention maps at once
+        heads_at_once = 1 if sliced else ATTENTION_HEADS // 2
+        attention = latent_pixels ** 2 * heads_at_once * unet_batch * self.dtype_bytes
+        features = latent_pixels * FEATURE_CHANNELS * ACTIVATION_FACTOR * unet_batch * self.dtype_bytes
+        # The VAE decodes one image at a time when sliced
+        vae_batch = 1 if sliced else batch
+        vae = size * size * VAE_DECODE_CHANNELS * VAE_DECODE_FACTOR * vae_batch * self.dtype_bytes
+        return int((max(attention, vae) + features) * self.correction)
+
+    def try_reserve(self, params_list, sliced=False, force=False):
+        """
+        Reserve memory for a batch if it fits in the remaining budget
+
+        Args:
+            params_list: Job parameters of the batch
+            sliced: Whether the batch runs with sliced attention and VAE
+            force: Reserve even over budget (used when nothing else is running)
+
+        Returns:
+            Reservation: Or None if it does not fit
+        """
+        estimated = self.estimate(params_list, sliced)
+        with self.lock:
+            if not force and self.reserved + estimated > self.budget:
+                return None
+            self.reserved += estimated
+            self.admitted += len(params_list)
+            if force and estimated > self.budget:
+                self.oversized += 1
+                logger.warning(f"Admitting a batch estimated at {estimated / 1024 / 1024:.0f} MB, "
+                               f"over the {self.budget / 1024 / 1024:.0f} MB budget")
+            if sliced:
+                self.sliced += 1
+        return Reservation(estimated, estimated / self.correction)
+
+    def admit(self, params_list):
+        """
+        Decide how much of a batch can run now
+
+        Tries the whole batch, then smaller leading parts of it, then the
+        first job with sliced attention and VAE.
+
+        Returns:
+            tuple: (jobs admitted, sliced, Reservation), or (0, False, None) to wait
+        """
+        for count in range(len(params_list), 0, -1):
+            reservation = self.try_reserve(params_list[:count])
+            if reservation is not None:
+                decision = "admitted" if count == len(params_list) else "split"
+                if decision == "split":
+                    with self.lock:
+                        self.split += 1
+                metrics.increment("admission_decisions_total", decision=decision)
+                return count, False, reservation
+        reservation = self.try_reserve(params_list[:1], sliced=True)
+        if reservation is None:
+            with self.lock:
+                idle = self.reserved == 0
+            if not idle:
+                metrics.increment("admission_decisions_total", decision="waited")
+                return 0, False, None
+            # Nothing to wait for: run the smallest form rather than block forever
+            reservation = self.try_reserve(params_list[:1], sliced=True, force=True)
+        metrics.increment("admission_decisions_total", decision="sliced")
+        return 1, True, reservation
+
+    def release(self, reservation, results=()):
+        """
+        Return a finished batch's memory to the budget
+
+        Args:
+            reservation: Reservation from try_reserve/admit
+            results: The batch's results; a measured peak_memory_mb in their
+                metadata corrects later estimates
+        """
+        peaks = [result.get("metadata", {}).get("peak_memory_mb") for result in results]
+        peaks = [peak for peak in peaks if peak]
+        with self.lock:
+            self.reserved -= reservation.nbytes
+            if peaks and reservation.estimated > 0:
+                ratio = min(max(max(peaks) * 1024 * 1024 / reservation.estimated, 0.25), 4.0)
+                self.correction = 0.8 * self.correction + 0.2 * ratio
+
+    def stats(self):
+        """Get admission statistics"""
+        with self.lock:
+            return {
+                "budget_mb": self.budget / 1024 / 1024,
+                "reserved_mb": self.reserved / 1024 / 1024,
+                "estimate_correction": round(self.correction, 3),
+                "admitted": self.admitted,
+                "split_batches": self.split,
+                "sliced_batches": self.sliced,
+                "oversized_batches": self.oversized,
+            }
@@ -1,15 +1,33 @@
-from flask import Flask, request, jsonify, send_from_directory, abort, send_file
+from flask import Flask, Request, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 import os
+import io
 import time
+import math
 import logging
 import re
-from datetime import datetime, timedelta
-import psutil
-import glob
+import uuid
+import json
+import random
+from datetime import datetime
+from werkzeug.exceptions import RequestEntityTooLarge
 from config import *
-from speech_service import SpeechService
+from speech_service import SpeechService, AudioTooLargeError
 from image_service import ImageService
+from image_catalog import ImageCatalog
+from image_encoder import ImageEncoder, OUTPUT_FORMATS
+from thumbnail_cache import ThumbnailCache
+from job_queue import JobQueue, QueueFullError
+from admission import AdmissionController
+from quality_tiers import TierPlanner, resolve_tier
+from result_cache import ResultCache, make_cache_key, seed_from_key
+from preloader import ModelPreloader
+from worker_pool import InferenceWorkerPool
+from cpu_backend import configure_threads
+from streaming_transcriber import StreamingTranscriber, StreamLimitError
+from rate_limiter import RateLimiter
+from metrics_sampler import MetricsSampler
+import metrics
 
 # Configure logging
 logging.basicConfig(
@@ -22,20 +40,193 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class InMemoryUploadRequest(Request):
+    """Keep multipart uploads in memory instead of spooling them to temp files"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Bodies are capped by MAX_CONTENT_LENGTH, so memory use is bounded
+        return io.BytesIO()
+
 app = Flask(__name__)
+app.request_class = InMemoryUploadRequest
+# Stop reading request bodies early once they exceed the audio limit
+# (plus headroom for multipart framing)
+app.config['MAX_CONTENT_LENGTH'] = (MAX_AUDIO_UPLOAD_MB + 1) * 1024 * 1024
 CORS(app)
 
-# Initialize services
-speech_service = SpeechService()
-image_service = ImageService()
+# Services are built by create_app() in the serving process. Spawned
+# inference workers re-import the entry module (and with it this one), so
+# nothing is constructed or started at import time
+speech_service = None
+image_catalog = None
+image_encoder = None
+image_service = None
+streaming_transcriber = None
+inference_pool = None
+inference_backend = None
+result_cache = None
+thumbnail_cache = None
+tier_planner = None
+admission = None
+job_queue = None
+preloader = None
+metrics_sampler = None
+rate_limiter = None
+
+def generation_batch_key(params):
+    """Jobs with the same style, sampling settings and size can share a pipeline call"""
+    return (params["style"], params["steps"], params["size"], params["scheduler"], params["guidance_scale"],
+            params["refine"])
+
+def format_generation_result(result):
+    """Build the client-facing payload for a successful generation"""
+    return {
+        "success": True,
+        "filename": result["filename"],
+        "image_url": f"/images/{result['filename']}",
+        "image_path": f"/images/{result['filename']}",  # For frontend compatibility
+        "thumbnail_url": f"/images/{result['filename']}/thumbnail",
+        "prompt": result["prompt"],
+        "style": result["style"],
+        "metadata": result.get("metadata", {})
+    }
+
+def run_generation_batch(batch_params, progress):
+    """Job handler: generate a batch of compatible images and clean up old ones"""
+    first = batch_params[0]
+    results = inference_backend.generate_batch(
+        [params["prompt"] for params in batch_params],
+        first["style"],
+        steps=first["steps"],
+        size=first["size"],
+        seeds=[params["seed"] for params in batch_params],
+        images_dir=IMAGES_DIR,
+        progress=progress,
+        output_formats=[params["format"] for params in batch_params],
+        sliced=first.get("sliced", False),
+        scheduler=first["scheduler"],
+        guidance_scale=first["guidance_scale"],
+        refine=first["refine"]
+    )
+    
+    # Live step timings drive latency-budgeted tier selection (draft-then-refine
+    # runs a different schedule, so it is not counted)
+    timings = next((result["metadata"]["timings"] for result in results if result["success"]), None)
+    if timings is not None and not first["refine"]:
+        tier_planner.observe(first["style"], first["size"], first["guidance_scale"], first["steps"],
+                             len(batch_params), timings["denoise_seconds"], timings["total_seconds"])
+    
+    responses = []
+    for params, result in zip(batch_params, results):
+        if result["success"]:
+            result["metadata"]["quality"] = params["quality"]
+            # The job completes now; the file is catalogued and cached once
+            # the encoder has written it
+            image_encoder.when_written(result["filename"], lambda params=params, result=result:
+                                       record_generated_image(params, result))
+            responses.append(format_generation_result(result))
+        else:
+            responses.append(result)
+    
+    return responses
 
-# Rate limiting
-REQUEST_COUNTS = {}
-RATE_LIMIT_WINDOW = 60  # 1 minute
-MAX_REQUESTS_PER_WINDOW = 10
+def record_generated_image(params, result):
+    """Catalog and cache a generated image once its file has been written"""
+    image_catalog.add(result["filename"], prompt=result["prompt"], style=result["style"],
+                      dimensions=result.get("metadata", {}).get("size"))
+    if result_cache is not None and params["cache_key"] is not None:
+        result_cache.put(params["cache_key"], result["filepath"], {
+            "prompt": result["prompt"],
+            "style": result["style"],
+            "metadata": result.get("metadata", {})
+        })
+    # Clean up old images
+    image_service.cleanup_old_images()
 
-# Create images directory
-os.makedirs(IMAGES_DIR, exist_ok=True)
+def lookup_cached_generation(params):
+    """Return a finished result for params from the result cache, or None"""
+    if result_cache is None or params["cache_key"] is None:
+        return None
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    cached = result_cache.get(params["cache_key"], IMAGES_DIR,
+                              f"generated_{timestamp}_{params['style']}_{uuid.uuid4().hex[:8]}")
+    if cached is None:
+        return None
+    filename = cached["filename"]
+    image_catalog.add(filename, prompt=cached["prompt"], style=cached["style"],
+                      dimensions=cached.get("metadata", {}).get("size"))
+    image_service.cleanup_old_images()
+    metadata = dict(cached.get("metadata", {}))
+    metadata["cached"] = True
+    return format_generation_result({
+        "filename": filename,
+        "prompt": cached["prompt"],
+        "style": cached["style"],
+        "metadata": metadata
+    })
+
+def create_app():
+    """
+    Build the services behind the routes and start their background work
+    
+    Call once in the serving process (run.py, ``python app.py`` or
+    ``gunicorn "app:create_app()"``); later calls return the same app.
+    
+    Returns:
+        Flask: The application
+    """
+    global speech_service, image_catalog, image_encoder, image_service, streaming_transcriber
+    global inference_pool, inference_backend, result_cache, thumbnail_cache, tier_planner
+    global admission, job_queue, preloader, metrics_sampler, rate_limiter
+    if job_queue is not None:
+        return app
+    
+    # Create images directory
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    
+    speech_service = SpeechService()
+    image_catalog = ImageCatalog()
+    image_encoder = ImageEncoder()
+    image_service = ImageService(catalog=image_catalog, encoder=image_encoder)
+    streaming_transcriber = StreamingTranscriber(speech_service)
+    
+    # Run inference in a pool of worker processes when configured, otherwise
+    # in this process; both expose the same generation interface
+    inference_pool = InferenceWorkerPool() if INFERENCE_WORKERS > 0 else None
+    inference_backend = inference_pool if inference_pool is not None else image_service
+    
+    result_cache = ResultCache() if RESULT_CACHE_ENABLED else None
+    thumbnail_cache = ThumbnailCache()
+    tier_planner = TierPlanner()
+    
+    # Batches reserve their estimated peak memory; those that do not fit wait in the queue
+    admission = AdmissionController()
+    # One queue worker per inference slot: ImageService serializes in-process
+    # generation, and a worker waiting on it (or on a busy pool) would hold an
+    # admission reservation for work that is not running
+    if inference_pool is None and GENERATION_WORKERS != 1:
+        logger.warning(f"GENERATION_WORKERS={GENERATION_WORKERS} ignored: in-process inference runs one batch at a time")
+    queue_workers = INFERENCE_WORKERS if inference_pool is not None else 1
+    job_queue = JobQueue(run_generation_batch, batch_key=generation_batch_key,
+                         num_workers=queue_workers, admission=admission)
+    
+    # Load and warm configured models in the background; /ready reports progress
+    preloader = ModelPreloader(inference_backend, speech_service)
+    
+    # Sample system and queue metrics in the background so /status never blocks
+    metrics_sampler = MetricsSampler(inference_backend.get_memory_usage, job_queue.stats)
+    
+    # Rate limiting
+    rate_limiter = RateLimiter()
+    
+    if inference_pool is not None:
+        inference_pool.start()
+    else:
+        configure_threads()
+    job_queue.start()
+    preloader.start()
+    metrics_sampler.start()
+    return app
 
 def setup_logging():
     """Setup logging configuration"""
@@ -84,11 +275,9 @@ def transcribe_audio():
     try:
         # Check rate limit
         client_ip = request.remote_addr
-        if not check_rate_limit(client_ip):
-            return jsonify({
-                "success": False,
-                "error": "Rate limit exceeded. Please wait before making another request."
-            }), 429
+        allowed, retry_after = check_rate_limit(client_ip, "transcribe")
+        if not allowed:
+            return rate_limit_response(retry_after)
         
         # Check if audio file is present
         if 'audio' not in request.files:
@@ -106,8 +295,14 @@ def transcribe_audio():
                 "error": "No file selected"
             }), 400
         
-        # Read audio data
-        audio_data = audio_file.read()
+        # Read audio data, stopping as soon as it exceeds the size limit
+        try:
+            audio_data = speech_service.read_upload(audio_file.stream)
+        except AudioTooLargeError:
+            return jsonify({
+                "success": False,
+                "error": "Invalid audio file or file too large"
+            }), 413
         
         # Validate audio data
         if not speech_service.validate_audio(audio_data):
@@ -135,6 +330,9 @@ def transcribe_audio():
                 "error": result.get("error", "Failed to transcribe audio")
             }), 500
             
+    except RequestEntityTooLarge:
+        # Flask rejects bodies over MAX_CONTENT_LENGTH when the form is parsed
+        raise
     except Exception as e:
         logger.error(f"Error in transcribe_audio: {e}")
         return jsonify({
@@ -142,21 +340,108 @@ def transcribe_audio():
             "error": "Internal server error"
         }), 500
 
-def check_rate_limit(client_ip):
-    """Check if client has exceeded rate limit"""
-    global REQUEST_COUNTS
-    current_time = time.time()
+@app.route('/transcribe-stream', methods=['POST'])
+def start_transcription_stream():
+    """Start a streaming transcription session"""
+    client_ip = request.remote_addr
+    allowed, retry_after = check_rate_limit(client_ip, "transcribe_stream")
+    if not allowed:
+        return rate_limit_response(retry_after)
+    
+    session = streaming_transcriber.create_session()
+    return jsonify({
+        "success": True,
+        "session_id": session.id,
+        "chunk_url": f"/transcribe-stream/{session.id}/chunk",
+        "finish_url": f"/transcribe-stream/{session.id}/finish"
+    }), 201
+
+@app.route('/transcribe-stream/<session_id>/chunk', methods=['POST'])
+def add_transcription_chunk(session_id):
+    """
+    Append an audio chunk to a stream and return the partial transcript
     
-    # Clean old entries
-    REQUEST_COUNTS = {ip: timestamp for ip, timestamp in REQUEST_COUNTS.items() 
-                     if current_time - timestamp < RATE_LIMIT_WINDOW}
+    The chunk is either a multipart 'audio' file in a container format, or a
+    raw request body of 16-bit little-endian mono PCM (?format=pcm_s16le&sample_rate=16000)
+    """
+    client_ip = request.remote_addr
+    allowed, retry_after = check_rate_limit(client_ip, "transcribe_chunk")
+    if not allowed:
+        return rate_limit_response(retry_after)
     
-    # Check if client has made too many requests
-    if client_ip in REQUEST_COUNTS:
-        return False
+    session = streaming_transcriber.get(session_id)
+    if session is None:
+        return jsonify({
+            "success": False,
+            "error": "Stream not found"
+        }), 404
     
-    REQUEST_COUNTS[client_ip] = current_time
-    return True
+    try:
+        if 'audio' in request.files:
+            audio_file = request.files['audio']
+            audio_data = audio_file.read()
+            audio_format = audio_file.filename.rsplit('.', 1)[1].lower() if '.' in audio_file.filename else 'wav'
+            samples = speech_service.decode_chunk(audio_data, audio_format)
+        else:
+            sample_rate = int(request.args.get('sample_rate', 16000))
+            samples = speech_service.decode_chunk(request.get_data(), 'pcm_s16le', sample_rate)
+        session.add_audio(samples)
+    except StreamLimitError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 413
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error decoding stream chunk: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Invalid audio chunk"
+        }), 400
+    
+    return jsonify({
+        "success": True,
+        **session.snapshot()
+    }), 200
+
+@app.route('/transcribe-stream/<session_id>/finish', methods=['POST'])
+def finish_transcription_stream(session_id):
+    """Flush the stream and return the final transcript"""
+    session = streaming_transcriber.get(session_id)
+    if session is None:
+        return jsonify({
+            "success": False,
+            "error": "Stream not found"
+        }), 404
+    
+    session.finish()
+    result = session.snapshot(wait=True)
+    streaming_transcriber.close(session_id)
+    return jsonify({
+        "success": True,
+        **result
+    }), 200
+
+def check_rate_limit(client_ip, endpoint):
+    """Check if client has exceeded the rate limit for an endpoint"""
+    allowed, retry_after = rate_limiter.check(client_ip, endpoint)
+    if not allowed:
+        metrics.increment("requests_rejected_total", endpoint=endpoint, reason="rate_limit")
+    return allowed, retry_after
+
+def rate_limit_response(retry_after):
+    """429 response telling the client when its next token is available"""
+    response = jsonify({
+        "success": False,
+        "error": "Rate limit exceeded. Please wait before making another request.",
+        "retry_after": round(retry_after, 1)
+    })
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response, 429
 
 # Removed old functions - now handled by services
 
@@ -166,11 +451,9 @@ def generate_image_api():
     try:
         # Check rate limit
         client_ip = request.remote_addr
-        if not check_rate_limit(client_ip):
-            return jsonify({
-                "success": False,
-                "error": "Rate limit exceeded. Please wait before making another request."
-            }), 429
+        allowed, retry_after = check_rate_limit(client_ip, "generate")
+        if not allowed:
+            return rate_limit_response(retry_after)
         
 
         # Get request data
@@ -199,34 +482,120 @@ def generate_image_api():
                 "error": str(e)
             }), 400
         
-        # Check memory usage
-        memory_usage = image_service.get_memory_usage()
-        if memory_usage["cpu_memory_mb"] > MAX_MEMORY_USAGE_MB:
+        # Resolve the style up front so compatible jobs can be batched together
+        if style is None:
+            style = image_service.detect_visual_style(prompt)[0]
+        elif style not in MODEL_PATHS:
             return jsonify({
                 "success": False,
-                "error": "Server is currently overloaded. Please try again later."
-            }), 503
+                "error": f"Unknown style: {style}"
+            }), 400
         
-        # Generate image using image service
-        result = image_service.generate_image(prompt, style, IMAGES_DIR)
+        output_format = data.get('format', IMAGE_FORMAT)
+        if not isinstance(output_format, str) or output_format not in OUTPUT_FORMATS:
+            return jsonify({
+                "success": False,
+                "error": f"Unknown format: {output_format} (supported: {', '.join(OUTPUT_FORMATS)})"
+            }), 400
         
-        if result["success"]:
-            # Clean up old images
-            image_service.cleanup_old_images()
+        seed = data.get('seed')
+        if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int) or seed < 0):
             return jsonify({
-                "success": True,
-                "filename": result["filename"],
-                "image_url": f"/images/{result['filename']}",
-                "image_path": f"/images/{result['filename']}",  # For frontend compatibility
-                "prompt": result["prompt"],
-                "style": result["style"],
-                "metadata": result.get("metadata", {})
-            })
+                "success": False,
+                "error": "Seed must be a non-negative integer"
+            }), 400
+        
+        refine = data.get('refine', False)
+        if not isinstance(refine, bool):
+            return jsonify({
+                "success": False,
+                "error": "refine must be true or false"
+            }), 400
+        
+        quality = data.get('quality')
+        latency_budget = data.get('latency_budget')
+        predicted_seconds = None
+        if quality is not None:
+            if not isinstance(quality, str) or quality not in QUALITY_TIERS:
+                return jsonify({
+                    "success": False,
+                    "error": f"Unknown quality: {quality} (supported: {', '.join(QUALITY_TIERS)})"
+                }), 400
+        elif latency_budget is not None:
+            if isinstance(latency_budget, bool) or not isinstance(latency_budget, (int, float)) or latency_budget <= 0:
+                return jsonify({
+                    "success": False,
+                    "error": "latency_budget must be a positive number of seconds"
+                }), 400
+            # The budget covers the wait for jobs already queued, not just this job's run
+            queue_wait = tier_planner.estimate_wait(job_queue.waiting_params(), job_queue.num_workers,
+                                                    job_queue.max_batch_size)
+            quality, predicted_seconds = tier_planner.choose(style, IMAGE_SIZE, latency_budget, queue_wait)
         else:
+            quality = DEFAULT_QUALITY_TIER
+        tier = resolve_tier(quality)
+        
+        generation_settings = (NEGATIVE_PROMPT, style, tier["steps"],
+                               tier["guidance_scale"], IMAGE_SIZE)
+        # Only requests pinned to a seed have one right answer to cache and share;
+        # unseeded repeats get a fresh image unless DERIVE_UNSEEDED_SEEDS is set
+        cacheable = seed is not None or DERIVE_UNSEEDED_SEEDS
+        if seed is None:
+            if DERIVE_UNSEEDED_SEEDS:
+                seed = seed_from_key(prompt, *generation_settings)
+            else:
+                seed = random.randrange(2 ** 31)
+        params = {
+            "prompt": prompt,
+            "style": style,
+            "quality": quality,
+            "scheduler": tier["scheduler"],
+            "steps": tier["steps"],
+            "guidance_scale": tier["guidance_scale"],
+            "size": IMAGE_SIZE,
+            "seed": seed,
+            "preview": bool(data.get('preview', False)),
+            "refine": refine,
+            "format": output_format,
+            "cache_key": make_cache_key(prompt, *generation_settings, seed, output_format, tier["scheduler"],
+                                        refine) if cacheable else None
+        }
+        
+        # Serve repeats straight from the result cache
+        cached_result = lookup_cached_generation(params)
+        if cached_result is not None:
+            job = job_queue.add_completed(params, cached_result)
             return jsonify({
+                "success": True,
+                **job_queue.describe(job)
+            }), 200
+        
+        # Queue the generation; workers pick it up as soon as one is free.
+        # Identical seeded requests already in flight share the existing job
+        try:
+            job = job_queue.submit(params, dedup_key=params["cache_key"])
+        except QueueFullError:
+            metrics.increment("requests_rejected_total", endpoint="generate", reason="queue_full")
+            response = jsonify({
                 "success": False,
-                "error": result.get("error", "Failed to generate image")
-            }), 500
+                "error": "Server is currently overloaded. Please try again later."
+            })
+            response.headers['Retry-After'] = '10'
+            return response, 503
+        
+        # Start pulling the model into RAM while the job waits its turn
+        inference_backend.prefetch(style)
+        
+        return jsonify({
+            "success": True,
+            "job_id": job.id,
+            "status": job.status,
+            "queue_position": job_queue.position(job),
+            "quality": quality,
+            "predicted_seconds": predicted_seconds,
+            "status_url": f"/jobs/{job.id}",
+            "events_url": f"/jobs/{job.id}/events"
+        }), 202
             
     except Exception as e:
         logger.error(f"Error in generate_image_api: {e}")
@@ -235,66 +604,185 @@ def generate_image_api():
             "error": "Internal server error"
         }), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get job status; pass ?wait=<seconds> to long-poll until it finishes"""
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "wait must be a number of seconds"
+        }), 400
+    wait = max(0.0, min(wait, MAX_LONG_POLL_SECONDS))
+    
+    job = job_queue.wait(job_id, wait)
+    if job is None:
+        return jsonify({
+            "success": False,
+            "error": "Job not found"
+        }), 404
+    
+    return jsonify({
+        "success": True,
+        **job_queue.describe(job)
+    }), 200
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_job_events(job_id):
+    """Server-sent event stream of job state, step progress and previews"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({
+            "success": False,
+            "error": "Job not found"
+        }), 404
+    
+    def generate():
+        version = -1
+        while True:
+            current = job.wait_for_change(version, SSE_KEEPALIVE_SECONDS)
+            if current == version:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            version = current
+            payload = job_queue.describe(job)
+            event = job.status if job.finished else "progress"
+            yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+            if job.finished:
+                return
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({
+            "success": False,
+            "error": "Job not found"
+        }), 404
+    
+    return jsonify({
+        "success": True,
+        **job_queue.describe(job)
+    }), 200
+
+# The pattern admits no path separators, so it doubles as the traversal check
+IMAGE_FILENAME_PATTERN = re.compile(r'^generated_\d{8}_\d{6}(_[a-zA-Z0-9_]+)?\.(png|webp|jpg|jpeg)$')
+
+def find_image(filename):
+    """
+    Resolve a generated image filename to its path
+    
+    Returns:
+        tuple: (path, None) or (None, error response)
+    """
+    if not IMAGE_FILENAME_PATTERN.match(filename):
+        return None, (jsonify({'error': 'Invalid filename format'}), 400)
+    file_path = os.path.join(IMAGES_DIR, filename)
+    if image_catalog.get(filename) is not None:
+        return file_path, None
+    # Results are returned before their files are written (and catalogued);
+    # wait for the encoder
+    if image_encoder.wait(filename) and os.path.exists(file_path):
+        return file_path, None
+    return None, (jsonify({'error': 'Image not found'}), 404)
+
+def send_immutable(file_path, **kwargs):
+    """Send a file that never changes with a strong ETag, conditional GET and Range support"""
+    response = send_file(file_path, conditional=True, etag=True, max_age=IMAGE_CACHE_MAX_AGE, **kwargs)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/images/<filename>')
 def serve_image(filename):
-    """Enhanced image serving with security checks"""
-    # Validate filename
-    if not re.match(r'^generated_\d{8}_\d{6}(_[a-zA-Z0-9_]+)?\.png$', filename):
-        return jsonify({'error': 'Invalid filename format'}), 400
-    file_path = os.path.join(IMAGES_DIR, filename)
-    # Security check - ensure file is within images directory
-    if not os.path.abspath(file_path).startswith(os.path.abspath(IMAGES_DIR)):
-        return jsonify({'error': 'Access denied'}), 403
-    if not os.path.exists(file_path):
-        return jsonify({'error': 'Image not found'}), 404
-    logger.info(f"Serving image: {filename}")
-    return send_from_directory(IMAGES_DIR, filename)
+    """Serve a generated image with long-lived caching headers"""
+    file_path, error = find_image(filename)
+    if error is not None:
+        return error
+    return send_immutable(file_path)
+
+@app.route('/images/<filename>/thumbnail')
+def serve_thumbnail(filename):
+    """Serve a resized variant of a generated image (?size= longest side in pixels)"""
+    try:
+        size = int(request.args.get('size', 256))
+    except ValueError:
+        size = None
+    if size not in THUMBNAIL_SIZES:
+        return jsonify({
+            'error': f"size must be one of {', '.join(str(allowed) for allowed in THUMBNAIL_SIZES)}"
+        }), 400
+    
+    file_path, error = find_image(filename)
+    if error is not None:
+        return error
+    try:
+        thumbnail_path = thumbnail_cache.get(file_path, size)
+    except Exception as e:
+        logger.error(f"Error creating thumbnail for {filename}: {e}")
+        return jsonify({'error': 'Error creating thumbnail'}), 500
+    return send_immutable(thumbnail_path)
 
 @app.route('/download/<filename>')
 def download_image(filename):
-    """Force download of the image file with security checks"""
-    # Validate filename (allow underscores in style)
-    if not re.match(r'^generated_\d{8}_\d{6}(_[a-zA-Z0-9_]+)?\.png$', filename):
-        return jsonify({'error': 'Invalid filename format'}), 400
-    file_path = os.path.join(IMAGES_DIR, filename)
-    # Security check - ensure file is within images directory
-    if not os.path.abspath(file_path).startswith(os.path.abspath(IMAGES_DIR)):
-        return jsonify({'error': 'Access denied'}), 403
-    if not os.path.exists(file_path):
-        return jsonify({'error': 'Image not found'}), 404
+    """Force download of the image file"""
+    file_path, error = find_image(filename)
+    if error is not None:
+        return error
     logger.info(f"Downloading image: {filename}")
-    return send_file(file_path, as_attachment=True)
+    return send_immutable(file_path, as_attachment=True)
 
 @app.route('/status', methods=['GET'])
 def get_status():
     """Get server status and system information"""
     try:
-        # Get system information
-        cpu_percent = psutil.cpu_percent(interval=1)
-        memory = psutil.virtual_memory()
-        disk = psutil.disk_usage('/')
-        
-        # Get memory usage from services
-        image_memory = image_service.get_memory_usage()
+        # System information comes from the latest background sample
+        sample = metrics_sampler.latest()
+        if sample is None:
+            return jsonify({'error': 'Metrics not sampled yet'}), 503
         
         status_data = {
             'server_status': 'running',
             'timestamp': datetime.now().isoformat(),
-            'memory_usage_mb': image_memory["cpu_memory_mb"],
-            'memory_percent': memory.percent,
-            'cpu_percent': cpu_percent,
-            'disk_percent': disk.percent,
-            'models_loaded': list(image_service.model_cache.keys()),
-            'is_generating': image_service.generation_lock,
-            'images_count': len(glob.glob(os.path.join(IMAGES_DIR, "generated_*.png"))),
+            'sampled_at': datetime.fromtimestamp(sample["timestamp"]).isoformat(),
+            'memory_usage_mb': sample["memory_usage_mb"],
+            'memory_percent': sample["memory_percent"],
+            'cpu_percent': sample["cpu_percent"],
+            'disk_percent': sample["disk_percent"],
+            'models_loaded': inference_backend.get_loaded_models(),
+            'is_generating': inference_backend.is_generating(),
+            'inference_workers': inference_pool.status() if inference_pool is not None else None,
+            'queue': job_queue.stats(),
+            'admission': admission.stats(),
+            'quality_tiers': tier_planner.stats(),
+            'result_cache': result_cache.stats() if result_cache is not None else None,
+            'image_encoder': image_encoder.stats(),
+            'thumbnail_cache': thumbnail_cache.stats(),
+            'embedding_cache': inference_backend.get_embedding_cache_stats(),
+            'model_tiers': inference_backend.get_model_tier_stats(),
+            'inference_backend': inference_backend.get_inference_backend_stats(),
+            'images_count': image_catalog.count(),
             'speech_model_loaded': speech_service.model_loaded,
+            'transcription_streams': streaming_transcriber.stats(),
+            'transcription_batches': speech_service.scheduler.stats(),
+            'transcription_cache': speech_service.cache.stats() if speech_service.cache is not None else None,
+            'rate_limits': rate_limiter.stats(),
+            'preload': preloader.status(),
             'supported_audio_formats': speech_service.get_supported_formats()
         }
         
         # Add GPU information if available
-        if image_memory["gpu_memory_mb"] > 0:
+        if sample["gpu_memory_mb"] > 0:
             status_data['gpu_available'] = True
-            status_data['gpu_memory_mb'] = image_memory["gpu_memory_mb"]
+            status_data['gpu_memory_mb'] = sample["gpu_memory_mb"]
         else:
             status_data['gpu_available'] = False
         
@@ -304,6 +792,31 @@ def get_status():
         logger.error(f"Error in status endpoint: {e}")
         return jsonify({'error': 'Error getting status'}), 500
 
+@app.route('/status/history', methods=['GET'])
+def get_status_history():
+    """Get sampled system and queue metrics as time series"""
+    since = request.args.get('since')
+    try:
+        since = float(since) if since else None
+    except ValueError:
+        return jsonify({
+            "success": False,
+            "error": "since must be a Unix timestamp"
+        }), 400
+    
+    return jsonify({
+        "success": True,
+        "interval_seconds": metrics_sampler.interval,
+        "series": metrics_sampler.history(since)
+    }), 200
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Stage latency histograms and counters in Prometheus text format"""
+    if not metrics.enabled:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/cleanup', methods=['POST'])
 def manual_cleanup():
     """Manual cleanup endpoint"""
@@ -328,31 +841,35 @@ def manual_cleanup():
 
 @app.route('/images', methods=['GET'])
 def get_image_history():
-    """Get list of generated images"""
+    """Get generated images, newest first, one page at a time"""
     try:
-        image_files = []
-        for ext in ["*.png", "*.jpg", "*.jpeg"]:
-            image_files.extend(glob.glob(os.path.join(IMAGES_DIR, ext)))
-        
-        # Sort by modification time (newest first)
-        image_files.sort(key=os.path.getmtime, reverse=True)
+        try:
+            limit = min(max(int(request.args.get('limit', 20)), 1), MAX_HISTORY_PAGE_SIZE)
+            cursor = request.args.get('cursor')
+            cursor = int(cursor) if cursor else None
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": "limit and cursor must be integers"
+            }), 400
         
-        images = []
-        for filepath in image_files[:20]:  # Limit to 20 most recent
-            filename = os.path.basename(filepath)
-            stat = os.stat(filepath)
-            
-            images.append({
-                "filename": filename,
-                "url": f"/images/{filename}",
-                "created_at": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                "size_bytes": stat.st_size
-            })
+        records, next_cursor = image_catalog.page(limit=limit, cursor=cursor)
+        images = [{
+            "filename": record["filename"],
+            "url": f"/images/{record['filename']}",
+            "thumbnail_url": f"/images/{record['filename']}/thumbnail",
+            "prompt": record["prompt"],
+            "style": record["style"],
+            "dimensions": record["dimensions"],
+            "created_at": datetime.fromtimestamp(record["created_at"]).isoformat(),
+            "size_bytes": record["size_bytes"]
+        } for record in records]
         
         return jsonify({
             "success": True,
             "images": images,
-            "total_count": len(image_files)
+            "total_count": image_catalog.count(),
+            "next_cursor": next_cursor
         }), 200
         
     except Exception as e:
@@ -397,6 +914,17 @@ def health_check():
         'timestamp': datetime.now().isoformat()
     }), 200
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness endpoint: 200 only once the configured models are warm"""
+    preload_status = preloader.status()
+    return jsonify({
+        'status': 'ready' if preload_status['ready'] else 'warming',
+        'models': preload_status['models'],
+        'errors': preload_status['errors'],
+        'timestamp': datetime.now().isoformat()
+    }), 200 if preload_status['ready'] else 503
+
 @app.route('/', methods=['GET'])
 def root():
     """Root endpoint with API information"""
@@ -404,15 +932,31 @@ def root():
         'service': 'AI Image Generation API',
         'version': '1.0.0',
         'endpoints': {
-            'POST /generate-image': 'Generate image from text prompt',
+            'POST /transcribe-audio': 'Transcribe an uploaded audio file',
+            'POST /transcribe-stream': 'Start a streaming transcription session',
+            'POST /transcribe-stream/<session_id>/chunk': 'Append audio and get the partial transcript',
+            'POST /transcribe-stream/<session_id>/finish': 'Finish a stream and get the final transcript',
+            'POST /generate-image': 'Queue image generation from text prompt',
+            'GET /jobs/<job_id>': 'Get generation job status (supports ?wait= long-polling)',
+            'GET /jobs/<job_id>/events': 'Stream job progress and previews (server-sent events)',
+            'POST /jobs/<job_id>/cancel': 'Cancel a queued or running job',
             'GET /images/<filename>': 'Serve generated image',
+            'GET /images/<filename>/thumbnail': 'Serve a resized variant of a generated image (?size=)',
+            'GET /images': 'Get image history (cursor-paginated)',
             'GET /status': 'Get server status and resource usage',
+            'GET /status/history': 'Get sampled resource and queue metrics over time (?since=)',
+            'GET /metrics': 'Stage latencies and counters in Prometheus text format',
             'POST /cleanup': 'Manual cleanup of models and images',
-            'GET /health': 'Health check endpoint'
+            'GET /health': 'Health check endpoint',
+            'GET /ready': 'Readiness check (200 once configured models are warm)'
         },
         'documentation': 'See /status for detailed information'
     }), 200
 
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({'error': 'Request body too large'}), 413
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Endpoint not found'}), 404
@@ -426,12 +970,15 @@ if __name__ == '__main__':
     # Setup logging
     setup_logging()
     
+    # Build and start the services
+    create_app()
+    
     # Record start time
     app.start_time = time.time()
     
     logger.info("Starting AI Image Generation Server")
-    logger.info(f"Configuration: MAX_MODELS_IN_MEMORY={MAX_MODELS_IN_MEMORY}, "
-                f"IMAGE_SIZE={IMAGE_SIZE}, DEFAULT_INFERENCE_STEPS={DEFAULT_INFERENCE_STEPS}")
+    logger.info(f"Configuration: DEVICE_TIER_MAX_MB={DEVICE_TIER_MAX_MB}, WARM_TIER_MAX_MB={WARM_TIER_MAX_MB}, "
+                f"IMAGE_SIZE={IMAGE_SIZE}, DEFAULT_INFERENCE_STEPS={DEFAULT_INFERENCE_STEPS}, CPU_BACKEND={CPU_BACKEND}")
     
     # Start server
     app.run(host=HOST, port=PORT, debug=DEBUG_MODE, threaded=THREADED) 
@@ -0,0 +1,328 @@
+"""
+Offline CPU benchmarks for ImageService, SpeechService and the Flask endpoints
+
+Builds tiny random-weight models (see tiny_models.py), points the backend
+configuration at them and reports latency percentiles, throughput and
+peak RSS per scenario as JSON, so runs can be compared between commits.
+
+Usage (from backend/):
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --scenarios image_service_single http_generate_image
+"""
+
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+import psutil
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from tiny_models import build_tiny_stable_diffusion, build_tiny_whisper
+
+SAMPLE_RATE = 16000
+
+
+def configure_backend(workdir, image_size, steps, cpu_backend):
+    """
+    Point config at tiny models and a scratch directory
+
+    Backend modules copy settings with ``from config import *`` when they
+    are imported, so this has to run before any of them is imported.
+
+    Returns:
+        str: Path of the tiny Whisper checkpoint
+    """
+    import config
+
+    models_dir = os.path.join(workdir, "models")
+    config.MODEL_PATHS = {
+        style: build_tiny_stable_diffusion(os.path.join(models_dir, style), seed=index)
+        for index, style in enumerate(config.MODEL_PATHS)
+    }
+    config.IMAGES_DIR = os.path.join(workdir, "images")
+    config.LOGS_DIR = os.path.join(workdir, "logs")
+    config.OTHERS_DIR = os.path.join(workdir, "others")
+    config.RESULT_CACHE_DIR = os.path.join(config.IMAGES_DIR, "cache")
+    config.THUMBNAIL_CACHE_DIR = os.path.join(config.IMAGES_DIR, "thumbnails")
+    config.IMAGE_CATALOG_DB_PATH = os.path.join(config.OTHERS_DIR, "image_catalog.sqlite3")
+    config.RATE_LIMIT_DB_PATH = os.path.join(config.OTHERS_DIR, "rate_limits.sqlite3")
+    config.COMPONENT_HASH_INDEX_PATH = os.path.join(config.OTHERS_DIR, "component_hashes.json")
+    config.CPU_EXPORT_DIR = os.path.join(config.OTHERS_DIR, "cpu_exports")
+    config.APP_LOG_PATH = os.path.join(config.LOGS_DIR, "app.log")
+
+    config.IMAGE_SIZE = image_size
+    config.DEFAULT_INFERENCE_STEPS = steps
+    # HTTP requests run the default quality tier, whose steps were fixed at import
+    config.QUALITY_TIERS = dict(config.QUALITY_TIERS, **{
+        config.DEFAULT_QUALITY_TIER: dict(config.QUALITY_TIERS[config.DEFAULT_QUALITY_TIER], steps=steps)})
+    config.CPU_BACKEND = cpu_backend
+    # Measure the work itself: nothing preloaded, nothing served from result caches
+    config.PRELOAD_MODELS = []
+    config.PRELOAD_SPEECH_MODEL = False
+    config.RESULT_CACHE_ENABLED = False
+    config.TRANSCRIPTION_CACHE_ENABLED = False
+    config.RATE_LIMITS = {endpoint: (10 ** 9, 10 ** 9) for endpoint in config.RATE_LIMITS}
+    config.MAX_QUEUE_SIZE = 10 ** 6
+    # Spawned inference workers would re-import config without these overrides
+    config.INFERENCE_WORKERS = 0
+
+    os.makedirs(config.LOGS_DIR, exist_ok=True)
+    return build_tiny_whisper(os.path.join(models_dir, "whisper_tiny.pt"))
+
+
+class PeakRSS:
+    """Track the peak resident set size of this process while active"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            self.stopped.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.process.memory_info().rss
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+        return False
+
+
+def measure(call, iterations, warmup, concurrency=1, items_per_call=1):
+    """
+    Time repeated calls and summarize them
+
+    Args:
+        call: Zero-argument callable performing one operation
+        iterations: Timed calls
+        warmup: Untimed calls made first
+        concurrency: Threads issuing calls at once
+        items_per_call: Work items (images, clips) produced per call
+
+    Returns:
+        dict: Latency percentiles, throughput and peak RSS
+    """
+    for _ in range(warmup):
+        call()
+
+    latencies = []
+    lock = threading.Lock()
+
+    def timed_call(_):
+        start = time.perf_counter()
+        call()
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    rss_before = psutil.Process().memory_info().rss
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        if concurrency == 1:
+            for index in range(iterations):
+                timed_call(index)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(timed_call, range(iterations)))
+        wall_seconds = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "items_per_call": items_per_call,
+        "latency_ms": {
+            "mean": float(latencies_ms.mean()),
+            "p50": float(np.percentile(latencies_ms, 50)),
+            "p90": float(np.percentile(latencies_ms, 90)),
+            "p99": float(np.percentile(latencies_ms, 99)),
+            "min": float(latencies_ms.min()),
+            "max": float(latencies_ms.max()),
+        },
+        "throughput_per_s": iterations * items_per_call / wall_seconds,
+        "wall_seconds": wall_seconds,
+        "rss_before_mb": rss_before / 1024 / 1024,
+        "peak_rss_mb": rss.peak / 1024 / 1024,
+    }
+
+
+def make_tone(seconds, frequency=440.0):
+    """A voiced-looking test signal (random Whisper weights can produce NaNs on white noise)"""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t)
+    return (0.3 * envelope * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def to_wav_bytes(samples):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes((samples * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def build_scenarios(app_module, args):
+    """Map scenario names to (callable, items_per_call, concurrency)"""
+    image_service = app_module.image_service
+    speech_service = app_module.speech_service
+    client = app_module.app.test_client()
+    counter = itertools.count()
+    clip = make_tone(args.audio_seconds)
+    wav_bytes = to_wav_bytes(clip)
+
+    def unique_prompt():
+        # Distinct prompts so text encoding is measured, not the embedding cache
+        return f"benchmark prompt {next(counter)}"
+
+    def image_service_single():
+        result = image_service.generate_batch([unique_prompt()], args.style)[0]
+        assert result["success"], result
+
+    def image_service_batch():
+        results = image_service.generate_batch([unique_prompt() for _ in range(args.batch_size)], args.style)
+        assert all(result["success"] for result in results), results
+
+    def speech_transcribe_array():
+        assert speech_service.transcribe_array(clip)["success"]
+
+    def speech_process_audio():
+        assert speech_service.process_audio(wav_bytes, "wav")["success"]
+
+    def http_generate_image():
+        response = client.post("/generate-image", json={"prompt": unique_prompt(), "style": args.style})
+        assert response.status_code == 202, response.get_json()
+        job_id = response.get_json()["job_id"]
+        while True:
+            job = client.get(f"/jobs/{job_id}?wait=30").get_json()
+            if job["status"] in ("completed", "failed", "cancelled"):
+                break
+        assert job["status"] == "completed", job
+
+    def http_transcribe_audio():
+        response = client.post("/transcribe-audio", data={"audio": (io.BytesIO(wav_bytes), "clip.wav")},
+                               content_type="multipart/form-data")
+        assert response.status_code == 200, response.get_json()
+
+    return {
+        "image_service_single": (image_service_single, 1, 1),
+        "image_service_batch": (image_service_batch, args.batch_size, 1),
+        "speech_transcribe_array": (speech_transcribe_array, 1, 1),
+        "speech_process_audio": (speech_process_audio, 1, 1),
+        "http_generate_image": (http_generate_image, 1, args.concurrency),
+        "http_transcribe_audio": (http_transcribe_audio, 1, args.concurrency),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run offline CPU benchmarks with tiny random models")
+    parser.add_argument("--scenarios", nargs="*", help="Scenario names to run (default: all)")
+    parser.add_argument("--iterations", type=int, default=10, help="Timed calls per scenario")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed calls per scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="Client threads for HTTP scenarios")
+    parser.add_argument("--batch-size", type=int, default=4, help="Prompts per call in image_service_batch")
+    parser.add_argument("--image-size", type=int, default=64, help="Generated image size in pixels")
+    parser.add_argument("--steps", type=int, default=4, help="Denoising steps per image")
+    parser.add_argument("--audio-seconds", type=float, default=3.0, help="Length of the test audio clip")
+    parser.add_argument("--style", default="dreamshaper", help="Image model style to benchmark")
+    parser.add_argument("--cpu-backend", default="eager",
+                        help="CPU inference backend: eager, compile, onnx, openvino or auto")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "speech_to_image_bench"),
+                        help="Directory for tiny models, images and databases")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output_path = os.path.abspath(args.output) if args.output else None
+    os.makedirs(args.workdir, exist_ok=True)
+    whisper_checkpoint = configure_backend(args.workdir, args.image_size, args.steps, args.cpu_backend)
+    # app.py logs to a relative app.log
+    os.chdir(args.workdir)
+
+    import torch
+    import app as app_module
+    app_module.create_app()
+    app_module.speech_service.load_model(whisper_checkpoint)
+
+    scenarios = build_scenarios(app_module, args)
+    selected = args.scenarios or list(scenarios)
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(unknown)} (available: {', '.join(scenarios)})")
+
+    results = {}
+    for name in selected:
+        call, items_per_call, concurrency = scenarios[name]
+        print(f"Running {name}...", file=sys.stderr)
+        results[name] = measure(call, args.iterations, args.warmup, concurrency, items_per_call)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "cpu_count": os.cpu_count(),
+            "torch_threads": torch.get_num_threads(),
+            "inference_backend": app_module.image_service.get_inference_backend_stats(),
+        },
+        "settings": {
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "image_size": args.image_size,
+            "steps": args.steps,
+            "batch_size": args.batch_size,
+            "audio_seconds": args.audio_seconds,
+            "style": args.style,
+            "cpu_backend": args.cpu_backend,
+        },
+        "scenarios": results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if output_path:
+        with open(output_path, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    app_module.job_queue.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Tiny randomly initialised Stable Diffusion and Whisper models for offline benchmarks
+
+The architectures match the real models (CLIP text encoder, conditional
+UNet, KL VAE, Whisper encoder/decoder) so every code path runs, but with a
+handful of channels each, so they build in seconds and run on any CPU.
+"""
+
+import json
+import os
+import torch
+from diffusers import StableDiffusionPipeline, UNet2DConditionModel, AutoencoderKL, PNDMScheduler
+from transformers import CLIPTextConfig, CLIPTextModel, CLIPTokenizer
+from transformers.models.clip.tokenization_clip import bytes_to_unicode
+from whisper.model import Whisper, ModelDimensions
+
+
+def _build_tokenizer(path):
+    """Byte-level CLIP tokenizer without merges, so any prompt tokenizes"""
+    chars = list(bytes_to_unicode().values())
+    vocab = {char: index for index, char in enumerate(chars)}
+    for char in chars:
+        vocab[char + "</w>"] = len(vocab)
+    vocab["<|startoftext|>"] = len(vocab)
+    vocab["<|endoftext|>"] = len(vocab)
+
+    tokenizer_dir = os.path.join(path, "tokenizer_files")
+    os.makedirs(tokenizer_dir, exist_ok=True)
+    with open(os.path.join(tokenizer_dir, "vocab.json"), "w") as f:
+        json.dump(vocab, f)
+    with open(os.path.join(tokenizer_dir, "merges.txt"), "w") as f:
+        f.write("#version: 0.2\n")
+    tokenizer = CLIPTokenizer(os.path.join(tokenizer_dir, "vocab.json"),
+                              os.path.join(tokenizer_dir, "merges.txt"), model_max_length=77)
+    return tokenizer, vocab
+
+
+def build_tiny_stable_diffusion(path, seed=0):
+    """
+    Save a tiny Stable Diffusion pipeline that model_loader can load
+
+    Args:
+        path: Directory to write the pipeline to (skipped if it already exists)
+        seed: Seed for the random weights
+
+    Returns:
+        str: path
+    """
+    if os.path.exists(os.path.join(path, "model_index.json")):
+        return path
+    torch.manual_seed(seed)
+    os.makedirs(path, exist_ok=True)
+
+    tokenizer, vocab = _build_tokenizer(path)
+    text_encoder = CLIPTextModel(CLIPTextConfig(
+        vocab_size=len(vocab), hidden_size=32, intermediate_size=37, num_hidden_layers=2,
+        num_attention_heads=4, max_position_embeddings=77, pad_token_id=1,
+        bos_token_id=vocab["<|startoftext|>"], eos_token_id=vocab["<|endoftext|>"]
+    ))
+    unet = UNet2DConditionModel(
+        block_out_channels=(32, 64), layers_per_block=1, sample_size=8, in_channels=4, out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+        cross_attention_dim=32, attention_head_dim=4, norm_num_groups=32
+    )
+    vae = AutoencoderKL(
+        block_out_channels=(32, 64), in_channels=3, out_channels=3, latent_channels=4,
+        down_block_types=("DownEncoderBlock2D",) * 2, up_block_types=("UpDecoderBlock2D",) * 2,
+        norm_num_groups=32
+    )
+    pipe = StableDiffusionPipeline(
+        vae=vae, text_encoder=text_encoder, tokenizer=tokenizer, unet=unet,
+        scheduler=PNDMScheduler(skip_prk_steps=True), safety_checker=None,
+        feature_extractor=None, requires_safety_checker=False
+    )
+    pipe.save_pretrained(path, safe_serialization=True)
+    return path
+
+
+def build_tiny_whisper(path, seed=0):
+    """
+    Save a tiny Whisper checkpoint loadable with whisper.load_model(path)
+
+    The vocabulary size is the real multilingual one so the stock tokenizer
+    and decoding logic work unchanged.
+
+    Args:
+        path: Checkpoint file to write (skipped if it already exists)
+        seed: Seed for the random weights
+
+    Returns:
+        str: path
+    """
+    if os.path.exists(path):
+        return path
+    torch.manual_seed(seed)
+    dims = ModelDimensions(
+        n_mels=80, n_audio_ctx=1500, n_audio_state=64, n_audio_head=2, n_audio_layer=1,
+        n_vocab=51865, n_text_ctx=448, n_text_state=64, n_text_head=2, n_text_layer=1
+    )
+    model = Whisper(dims)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    torch.save({"dims": dims.__dict__, "model_state_dict": model.state_dict()}, path)
+    return path
@@ -0,0 +1,216 @@
+"""
+Registry of pipeline components shared between styles with identical weights
+
+Every style in MODEL_PATHS is a diffusers Stable Diffusion folder. Each
+component (unet, vae, text_encoder, tokenizer, scheduler) is identified by a
+hash of its files, and loaded at most once however many styles use it.
+Safetensors weights are memory-mapped and assigned to the module without a
+copy, so loading a component mostly costs page faults on first use.
+"""
+
+import os
+import json
+import glob
+import hashlib
+import logging
+import importlib
+import threading
+from accelerate import init_empty_weights
+from safetensors.torch import load_file
+from config import *
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Components with weights, and the components rebuilt per pipeline
+WEIGHTED_COMPONENTS = ("unet", "vae", "text_encoder")
+STATEFUL_COMPONENTS = ("scheduler",)
+
+
+def _hash_files(paths, chunk_size=8 * 1024 * 1024):
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(os.path.basename(path).encode("utf-8"))
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _component_class(library, class_name):
+    return getattr(importlib.import_module(library), class_name)
+
+
+class ComponentRegistry:
+    def __init__(self, index_path=COMPONENT_HASH_INDEX_PATH):
+        """
+        Initialize an empty registry
+
+        Args:
+            index_path: JSON file remembering file hashes across restarts, keyed
+                by path, size and mtime, so multi-gigabyte weights are hashed once
+        """
+        self.index_path = index_path
+        self.hash_index = {}
+        self.components = {}  # (name, fingerprint) -> loaded module
+        self.users = {}  # (name, fingerprint) -> set of styles using it
+        self.lock = threading.RLock()
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                self.hash_index = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def _weight_files(self, folder, device):
+        """Safetensors files of a component, preferring the fp16 variant on GPU"""
+        files = sorted(glob.glob(os.path.join(folder, "*.safetensors")))
+        fp16 = [path for path in files if ".fp16." in os.path.basename(path)]
+        full = [path for path in files if ".fp16." not in os.path.basename(path)]
+        if device == "cuda" and fp16:
+            return fp16
+        return full or fp16
+
+    def _fingerprint(self, folder, device):
+        """Hash of the weights and configuration a component is loaded from"""
+        paths = self._weight_files(folder, device)
+        if paths:
+            paths += glob.glob(os.path.join(folder, "*.json"))
+        else:
+            paths = [path for path in glob.glob(os.path.join(folder, "*")) if os.path.isfile(path)]
+        stats = [(path, os.stat(path)) for path in sorted(paths)]
+        index_key = "|".join(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}" for path, stat in stats)
+        with self.lock:
+            cached = self.hash_index.get(index_key)
+        if cached is not None:
+            return cached
+        fingerprint = _hash_files(paths)
+        with self.lock:
+            self.hash_index[index_key] = fingerprint
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.index_path)), exist_ok=True)
+                with open(self.index_path, "w", encoding="utf-8") as f:
+                    json.dump(self.hash_index, f)
+            except OSError as e:
+                logger.warning(f"Could not persist component hashes: {e}")
+        return fingerprint
+
+    def component_keys(self, style, device):
+        """
+        Identify the components a style is built from
+
+        Returns:
+            dict: Component name -> (library, class name, folder, fingerprint)
+        """
+        model_path = MODEL_PATHS[style]
+        with open(os.path.join(model_path, "model_index.json"), "r", encoding="utf-8") as f:
+            model_index = json.load(f)
+        keys = {}
+        for name in WEIGHTED_COMPONENTS + ("tokenizer",) + STATEFUL_COMPONENTS:
+            library, class_name = model_index[name]
+            folder = os.path.join(model_path, name)
+            keys[name] = (library, class_name, folder, self._fingerprint(folder, device))
+        return keys
+
+    def _load_weighted(self, library, class_name, folder, device, dtype):
+        """Build a module on the meta device and assign memory-mapped weights to it"""
+        cls = _component_class(library, class_name)
+        weight_files = self._weight_files(folder, device)
+        if not weight_files:
+            # Legacy .bin checkpoints cannot be memory-mapped
+            return cls.from_pretrained(folder, torch_dtype=dtype, low_cpu_mem_usage=LOW_CPU_MEM_USAGE)
+
+        if library == "transformers":
+            config = cls.config_class.from_pretrained(folder)
+            with init_empty_weights():
+                module = cls(config)
+        else:
+            with init_empty_weights():
+                module = cls.from_config(cls.load_config(folder))
+
+        state_dict = {}
+        for path in weight_files:
+            state_dict.update(load_file(path, device="cpu"))
+        missing, _ = module.load_state_dict(state_dict, strict=False, assign=True)
+        if missing:
+            raise RuntimeError(f"{folder} is missing weights: {', '.join(missing[:5])}")
+        if hasattr(module, "tie_weights"):
+            module.tie_weights()
+        return module.to(dtype=dtype).eval()
+
+    def acquire(self, style, device, dtype):
+        """
+        Get the components for a style, loading only those not already resident
+
+        Args:
+            style: Key of MODEL_PATHS
+            device: Device the pipeline will run on
+            dtype: Weight dtype
+
+        Returns:
+            dict: Component name -> module, ready for StableDiffusionPipeline(**components)
+        """
+        components = {}
+        for name, (library, class_name, folder, fingerprint) in self.component_keys(style, device).items():
+            cls = _component_class(library, class_name)
+            key = (name, fingerprint)
+            with self.lock:
+                component = self.components.get(key)
+                if component is None:
+                    if name in WEIGHTED_COMPONENTS:
+                        component = self._load_weighted(library, class_name, folder, device, dtype)
+                    elif name == "tokenizer":
+                        component = cls.from_pretrained(folder)
+                    else:
+                        component = cls.load_config(folder)
+                    self.components[key] = component
+                    metrics.increment("model_component_loads_total", component=name, result="loaded")
+                else:
+                    metrics.increment("model_component_loads_total", component=name, result="shared")
+                    logger.info(f"Reusing {name} for {style} (shared with {', '.join(sorted(self.users[key]))})")
+                self.users.setdefault(key, set()).add(style)
+
+            # Schedulers keep per-call state, so each pipeline gets its own
+            components[name] = cls.from_config(component) if name in STATEFUL_COMPONENTS else component
+        return components
+
+    def release(self, style, keep=()):
+        """
+        Stop tracking a style's use of its components
+
+        Components no other style uses are dropped (and freed once the
+        pipeline holding them is gone), except those listed in keep.
+
+        Args:
+            style: Style being unloaded
+            keep: Component keys to retain, e.g. those of the style loading next
+        """
+        with self.lock:
+            for key in list(self.users):
+                self.users[key].discard(style)
+                if not self.users[key] and key not in keep:
+                    del self.users[key]
+                    self.components.pop(key, None)
+
+    def weight_bytes(self, style, device):
+        """On-disk size of a style's weights, as an estimate of its memory footprint"""
+        model_path = MODEL_PATHS[style]
+        return sum(os.path.getsize(path) for name in WEIGHTED_COMPONENTS
+                   for path in self._weight_files(os.path.join(model_path, name), device))
+
+    def keys_for(self, style, device):
+        """Registry keys of a style's components, for release(keep=...)"""
+        return {(name, fingerprint) for name, (_, _, _, fingerprint) in self.component_keys(style, device).items()}
+
+    def stats(self):
+        """Get resident components and the styles sharing them"""
+        with self.lock:
+            return {
+                f"{name}:{fingerprint[:12]}": sorted(self.users.get((name, fingerprint), ()))
+                for name, fingerprint in self.components
+            }
+
+
+registry = ComponentRegistry()
@@ -9,18 +9,74 @@ import os
 BACKEND_DIR = r"C:\D\project\Project\backend"
 
 # Memory Management Settings
-MAX_MODELS_IN_MEMORY = 1  # Number of models to keep in memory simultaneously
-MODEL_TIMEOUT = 300  # Seconds before unloading unused models (5 minutes)
-MAX_MEMORY_USAGE_MB = 8000  # Maximum memory usage before rejecting requests (8GB)
+DEVICE_TIER_MAX_MB = 4500  # Models kept ready on the inference device (GPU memory, or RAM without a GPU)
+WARM_TIER_MAX_MB = 4500  # Models demoted to CPU RAM for fast promotion; beyond this they are dropped to disk
+# Without a GPU both tiers are RAM under one budget (DEVICE_TIER_MAX_MB + WARM_TIER_MAX_MB):
+# the defaults hold two fp32 SD 1.5 pipelines (~4.1GB each), so switching between two styles never reloads
+MODEL_TIMEOUT = 300  # Seconds before an unused model is demoted from the device tier (5 minutes)
+ADMISSION_MEMORY_BUDGET_MB = 3000  # Peak working memory (activations, VAE buffers) running generations may reserve; others wait in the queue
 
 # Image Management Settings
 MAX_IMAGES_TO_KEEP = 10  # Maximum number of generated images to keep
-IMAGE_QUALITY = 85  # JPEG quality for saved images (1-100)
+IMAGE_QUALITY = 85  # JPEG/WebP quality for saved images (1-100)
 IMAGE_SIZE = 512  # Size of generated images (512x512 for lower memory usage)
+IMAGE_FORMAT = "png"  # Default output format: "png", "png_fast", "webp" or "jpeg"
+PNG_COMPRESS_LEVEL = 6  # zlib level for "png" ("png_fast" uses 1)
+ENCODER_WORKERS = 2  # Threads encoding and writing generated images in the background
+ENCODE_WAIT_SECONDS = 10  # How long image requests wait for a file that is still being encoded
 
 # Generation Settings
 DEFAULT_INFERENCE_STEPS = 20  # Reduced from default 50 for faster generation
 DEFAULT_GUIDANCE_SCALE = 7.5  # Standard guidance scale
+NEGATIVE_PROMPT = "blurry, low quality, distorted, deformed"
+EMBEDDING_CACHE_SIZE = 128  # Text embeddings cached per loaded model (LRU)
+
+# Preloading Settings
+PRELOAD_MODELS = ["realistic_vision"]  # Image models loaded and warmed at startup (never demoted for being idle)
+PRELOAD_SPEECH_MODEL = True  # Load and warm the Whisper model at startup
+WARMUP_INFERENCE_STEPS = 1  # Steps for the dummy warm-up generation
+WARMUP_IMAGE_SIZE = 64  # Size of the dummy warm-up image
+
+# Job Queue Settings
+GENERATION_WORKERS = 1  # Worker threads draining the generation queue (in-process inference always uses 1)
+MAX_QUEUE_SIZE = 20  # Pending jobs allowed before new requests get a 503
+JOB_RESULT_TTL = 600  # Seconds to keep finished jobs available for polling
+MAX_LONG_POLL_SECONDS = 30  # Upper bound for the ?wait= parameter on GET /jobs/<id>
+
+# Inference Worker Pool Settings
+INFERENCE_WORKERS = 0  # Inference processes, each with its own pipelines (0 = run in the server process)
+TORCH_THREADS_PER_WORKER = 4  # torch intra-op threads pinned in each inference process
+WORKER_HEARTBEAT_INTERVAL = 5  # Seconds between worker heartbeats / health checks
+WORKER_HEARTBEAT_TIMEOUT = 60  # Restart a worker whose last heartbeat is older than this
+
+# Progress Streaming Settings
+PREVIEW_EVERY_STEPS = 5  # Decode a low-resolution latent preview every N denoising steps
+SSE_KEEPALIVE_SECONDS = 15  # Interval for keep-alive comments on idle event streams
+
+# Micro-batching Settings
+MAX_BATCH_SIZE = 4  # Maximum prompts run together in one pipeline call
+BATCH_WINDOW_MS = 50  # How long a worker waits to fill a batch with compatible jobs
+
+# Audio Upload Settings
+MAX_AUDIO_UPLOAD_MB = 10  # Uploads larger than this are rejected while still being read
+
+# Batched Transcription Settings
+TRANSCRIBE_MAX_BATCH_SIZE = 8  # Maximum clips decoded together in one Whisper call
+TRANSCRIBE_BATCH_WINDOW_MS = 30  # How long to wait for concurrent clips to join a batch
+
+# Transcription Cache Settings
+TRANSCRIPTION_CACHE_ENABLED = True  # Reuse transcripts for re-submitted recordings
+TRANSCRIPTION_CACHE_MAX_BYTES = 4 * 1024 * 1024  # Memory budget for cached transcripts (4MB)
+TRANSCRIPTION_CACHE_TRIM_LEVEL = 0.002  # Edge samples quieter than this are ignored when fingerprinting
+
+# Streaming Transcription Settings
+STREAM_FRAME_MS = 30  # Frame length used for silence detection
+STREAM_SILENCE_RMS = 0.01  # Frames with RMS below this count as silence
+STREAM_MIN_SILENCE_MS = 400  # Silence needed before a segment is cut
+STREAM_MIN_SEGMENT_SECONDS = 1.0  # Shortest segment sent to Whisper
+STREAM_MAX_SEGMENT_SECONDS = 25  # Force a cut before Whisper's 30s window
+STREAM_MAX_SECONDS = 300  # Maximum total audio per stream
+STREAM_SESSION_TTL = 300  # Seconds before an idle stream is discarded
 
 # Cleanup Settings
 CLEANUP_INTERVAL = 60  # Seconds between automatic cleanups
@@ -38,17 +94,75 @@ MODEL_PATHS = {
     "realistic_vision": os.path.join(BACKEND_DIR, "models", "realistic_vision_model", "realistic_vision_model")
 }
 
+# Quality Tier Settings
+QUALITY_TIERS = {  # Tier -> scheduler (None keeps the model's own), denoising steps and guidance scale, fastest first
+    "draft": {"scheduler": "dpmpp_2m", "steps": 8, "guidance_scale": 6.0},
+    "standard": {"scheduler": None, "steps": DEFAULT_INFERENCE_STEPS, "guidance_scale": DEFAULT_GUIDANCE_SCALE},
+    "high": {"scheduler": "euler_a", "steps": 40, "guidance_scale": DEFAULT_GUIDANCE_SCALE},
+}
+DEFAULT_QUALITY_TIER = "standard"  # Tier for requests without "quality" or "latency_budget"
+LCM_LORA_PATH = os.path.join(BACKEND_DIR, "models", "lcm_lora_sdv1_5")  # LCM-LoRA weights; when present "draft" uses LCM_DRAFT_SETTINGS
+LCM_DRAFT_SETTINGS = {"scheduler": "lcm", "steps": 4, "guidance_scale": 1.0}
+TIER_TIMING_SMOOTHING = 0.3  # Weight of the newest generation in the measured step timings
+
+# Draft-then-Refine Settings
+REFINE_DRAFT_STEPS = 6  # Denoising steps of the draft
+REFINE_DRAFT_SCALE = 0.5  # Draft resolution relative to the final image (1.0 = same size, no latent upscale)
+REFINE_STRENGTH = 0.55  # Share of the schedule the refine pass re-runs from the draft latents
+DRAFT_QUALITY = 80  # JPEG quality of the draft published while refining
+
 # Directories
 IMAGES_DIR = os.path.join(BACKEND_DIR, "images")
 LOGS_DIR = os.path.join(BACKEND_DIR, "logs")
 OTHERS_DIR = os.path.join(BACKEND_DIR, "others")
 
+# Result Cache Settings
+RESULT_CACHE_ENABLED = True  # Reuse images for identical prompt/settings/seed requests
+DERIVE_UNSEEDED_SEEDS = False  # Derive a seed from the settings of requests without one, so their repeats hit the cache too (otherwise each gets a random seed)
+RESULT_CACHE_DIR = os.path.join(IMAGES_DIR, "cache")
+RESULT_CACHE_MAX_BYTES = 500 * 1024 * 1024  # Disk budget for cached images (500MB)
+
+# Image Serving Settings
+IMAGE_CACHE_MAX_AGE = 365 * 24 * 3600  # Cache-Control max-age for generated images (they never change)
+THUMBNAIL_SIZES = (64, 128, 256, 512)  # Allowed values for ?size= on GET /images/<filename>/thumbnail
+THUMBNAIL_FORMAT = "webp"  # Output format of resized variants
+THUMBNAIL_CACHE_DIR = os.path.join(IMAGES_DIR, "thumbnails")
+THUMBNAIL_CACHE_MAX_BYTES = 100 * 1024 * 1024  # Disk budget for resized variants (100MB)
+
+# Model Component Settings
+COMPONENT_HASH_INDEX_PATH = os.path.join(OTHERS_DIR, "component_hashes.json")  # Weight hashes, so shared components are detected without rehashing
+
+# CPU Inference Settings (used when no GPU is available)
+CPU_BACKEND = "auto"  # "eager", "compile" (torch.compile), "onnx" (ONNX Runtime), "openvino", or "auto" (openvino, then onnx, then eager)
+CPU_INTRA_OP_THREADS = 0  # Threads inside each operator in the server process (0 = torch default; workers use TORCH_THREADS_PER_WORKER)
+CPU_INTER_OP_THREADS = 1  # Operators run in parallel
+CPU_CHANNELS_LAST = True  # NHWC memory format for the UNet and VAE (eager and compile backends)
+CPU_BF16_AUTOCAST = True  # bfloat16 autocast on CPUs with native bf16 support (eager and compile backends)
+CPU_EXPORT_DIR = os.path.join(OTHERS_DIR, "cpu_exports")  # ONNX exports of the UNet, text encoder and VAE decoder, per weight hash
+
+# Image Catalog Settings
+IMAGE_CATALOG_DB_PATH = os.path.join(OTHERS_DIR, "image_catalog.sqlite3")  # Persisted index of generated images
+MAX_HISTORY_PAGE_SIZE = 100  # Upper bound for the ?limit= parameter on GET /images
+
+# Rate Limiting Settings
+RATE_LIMIT_BACKEND = "memory"  # "memory" (per process) or "sqlite" (shared by every server process)
+RATE_LIMIT_DB_PATH = os.path.join(OTHERS_DIR, "rate_limits.sqlite3")
+RATE_LIMITS = {  # Endpoint -> (burst capacity, tokens refilled per second), per client
+    "transcribe": (5, 5 / 60),
+    "transcribe_stream": (5, 5 / 60),
+    "transcribe_chunk": (20, 4),  # Streams send a chunk every few hundred milliseconds
+    "generate": (3, 3 / 60),
+}
+
 # Example for log file
 APP_LOG_PATH = os.path.join(LOGS_DIR, "app.log")
 
 # Performance Monitoring
 ENABLE_MEMORY_MONITORING = True  # Enable memory usage tracking
 LOG_MEMORY_USAGE = True  # Log memory usage in responses
+METRICS_ENABLED = True  # Record stage latencies and counters for GET /metrics (no-op when off)
+METRICS_SAMPLE_INTERVAL = 5  # Seconds between background system/queue metric samples
+METRICS_HISTORY_SIZE = 720  # Samples kept for GET /status/history (1 hour at 5s)
 
 # Optimization Flags
 ENABLE_ATTENTION_SLICING = True
@@ -58,15 +172,59 @@ ENABLE_SEQUENTIAL_CPU_OFFLOAD = True
 LOW_CPU_MEM_USAGE = True
 
 # Style Detection Weights
+# Keywords match whole words (case-insensitive; multi-word phrases match any
+# whitespace). Japanese and Chinese keywords match anywhere, since those
+# scripts do not separate words with spaces.
 DREAMSHAPER_KEYWORDS = {
+    # English
     'anime': 3, 'cartoon': 3, 'fantasy': 2, 'magical': 2, 'mystical': 2,
     'ethereal': 2, 'glowing': 2, 'sparkles': 2, 'vibrant': 1, 'stylized': 2,
-    'art': 1, 'illustration': 2, 'drawing': 2, 'painting': 1, 'colorful': 1, 'bright': 1
+    'art': 1, 'illustration': 2, 'drawing': 2, 'painting': 1, 'colorful': 1, 'bright': 1,
+    # Spanish / Portuguese
+    'dibujos animados': 3, 'caricatura': 3, 'desenho animado': 3, 'fantasía': 2, 'fantasia': 2,
+    'mágico': 2, 'mágica': 2, 'místico': 2, 'ilustración': 2, 'ilustração': 2,
+    'dibujo': 2, 'desenho': 2, 'pintura': 1, 'arte': 1, 'colorido': 1,
+    # French
+    'dessin animé': 3, 'fantastique': 2, 'magique': 2, 'mystique': 2, 'féerique': 2,
+    'dessin': 2, 'peinture': 1, 'coloré': 1,
+    # German
+    'zeichentrick': 3, 'märchenhaft': 2, 'magisch': 2, 'mystisch': 2,
+    'zeichnung': 2, 'gemälde': 1, 'kunst': 1, 'bunt': 1,
+    # Hindi
+    'एनीमे': 3, 'कार्टून': 3, 'जादुई': 2, 'रहस्यमय': 2, 'चित्रण': 2, 'चित्रकारी': 1, 'कला': 1, 'रंगीन': 1,
+    # Japanese
+    'アニメ': 3, '漫画': 3, 'マンガ': 3, 'ファンタジー': 2, '魔法': 2, 'イラスト': 2, '絵画': 1,
+    # Chinese
+    '动漫': 3, '卡通': 3, '奇幻': 2, '魔幻': 2, '插画': 2, '绘画': 1, '艺术': 1,
 }
 
 REALISTIC_KEYWORDS = {
+    # English
     'realistic': 3, 'photorealistic': 3, 'cinematic': 3, 'photography': 3,
     'photo': 2, 'documentary': 2, 'lifelike': 2, 'natural': 1, 'real': 1,
     'professional': 1, 'portrait': 1, 'landscape': 1, 'film': 2, 'movie': 2,
-    'dramatic lighting': 1, 'film photography': 2
-} 
\ No newline at end of file
+    'dramatic lighting': 1, 'film photography': 2,
+    # Spanish / Portuguese
+    'realista': 3, 'fotorrealista': 3, 'fotorrealismo': 3, 'cinematográfico': 3, 'cinematográfica': 3,
+    'fotografía': 3, 'fotografia': 3, 'foto': 2, 'documental': 2, 'documentário': 2,
+    'retrato': 1, 'paisaje': 1, 'paisagem': 1, 'película': 2, 'filme': 2,
+    # French
+    'réaliste': 3, 'photoréaliste': 3, 'cinématographique': 3, 'photographie': 3,
+    'documentaire': 2, 'paysage': 1,
+    # German
+    'realistisch': 3, 'fotorealistisch': 3, 'filmisch': 3, 'fotografie': 3,
+    'dokumentarisch': 2, 'porträt': 1, 'landschaft': 1,
+    # Hindi
+    'यथार्थवादी': 3, 'वास्तविक': 2, 'फोटो': 2, 'तस्वीर': 2, 'सिनेमाई': 3, 'फ़िल्म': 2, 'फिल्म': 2,
+    # Japanese
+    '写実的': 3, 'リアル': 3, '写真': 3, '映画的': 3, 'ポートレート': 1, '風景': 1,
+    # Chinese
+    '写实': 3, '逼真': 3, '照片': 3, '摄影': 3, '电影感': 3, '肖像': 1, '风景': 1,
+}
+
+DEFAULT_STYLE = "realistic_vision"  # Chosen when no keyword matches or scores tie
+STYLE_EMBEDDING_FALLBACK = False  # Route prompts without keyword matches on cached CLIP embeddings of a loaded model
+STYLE_PROTOTYPES = {  # Descriptions whose embeddings represent each style for the fallback
+    "dreamshaper": "fantasy illustration, anime, stylized digital painting, magical art",
+    "realistic_vision": "realistic photograph, cinematic photo, natural lighting, lifelike portrait",
+}
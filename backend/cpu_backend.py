@@ -0,0 +1,403 @@
+"""
+CPU-optimised inference backends for GPU-less deployments
+
+"eager" runs the torch pipeline without attention slicing, in channels-last
+memory format and under bfloat16 autocast where the CPU supports it;
+"compile" also runs the UNet and VAE decoder through torch.compile. "onnx" and
+"openvino" export the UNet, text encoder and VAE decoder to ONNX once per
+weight hash (under CPU_EXPORT_DIR) and run them with ONNX Runtime or OpenVINO
+behind modules with the interface the diffusers pipeline calls. A backend
+that is not installed or fails for a model falls back to the next one in its
+chain, ending with eager.
+"""
+
+import os
+import time
+import shutil
+import logging
+import threading
+import importlib.util
+from contextlib import nullcontext
+import torch
+from config import *
+import metrics
+from tiered_model_cache import module_bytes
+
+logger = logging.getLogger(__name__)
+
+BACKEND_CHAINS = {
+    "auto": ("openvino", "onnx", "eager"),
+    "openvino": ("openvino", "eager"),
+    "onnx": ("onnx", "eager"),
+    "compile": ("compile", "eager"),
+    "eager": ("eager",),
+}
+
+EXPORTED_COMPONENTS = ("text_encoder", "unet", "vae")
+ONNX_OPSET = 17
+CLIP_SEQUENCE_LENGTH = 77
+
+
+def _installed(backend):
+    if backend == "openvino":
+        return importlib.util.find_spec("openvino") is not None
+    if backend == "onnx":
+        return importlib.util.find_spec("onnxruntime") is not None
+    if backend == "compile":
+        return hasattr(torch, "compile")
+    return True
+
+
+def bf16_supported():
+    """Whether this CPU runs bfloat16 natively (AVX512-BF16 or AMX)"""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def configure_threads(intra_op=CPU_INTRA_OP_THREADS, inter_op=CPU_INTER_OP_THREADS):
+    """
+    Size torch's thread pools for this process
+
+    Args:
+        intra_op: Threads inside each operator (0 keeps torch's default)
+        inter_op: Operators run in parallel (0 keeps torch's default); only
+            settable before torch starts any parallel work
+    """
+    if intra_op > 0:
+        torch.set_num_threads(intra_op)
+    if inter_op > 0:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError as e:
+            logger.warning(f"Could not set inter-op threads: {e}")
+
+
+def _to_numpy(tensor):
+    return tensor.detach().cpu().float().numpy()
+
+
+def _dir_bytes(folder):
+    return sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+
+
+# Graphs exported to ONNX: the component's forward pass reduced to tensors in and out
+
+class _UNetGraph(torch.nn.Module):
+    def __init__(self, unet):
+        super().__init__()
+        self.unet = unet
+
+    def forward(self, sample, timestep, encoder_hidden_states):
+        return self.unet(sample, timestep, encoder_hidden_states, return_dict=False)[0]
+
+
+class _TextEncoderGraph(torch.nn.Module):
+    def __init__(self, text_encoder):
+        super().__init__()
+        self.text_encoder = text_encoder
+
+    def forward(self, input_ids):
+        return self.text_encoder(input_ids, return_dict=False)[0]
+
+
+class _VaeDecoderGraph(torch.nn.Module):
+    def __init__(self, vae):
+        super().__init__()
+        self.vae = vae
+
+    def forward(self, latents):
+        return self.vae.decode(latents, return_dict=False)[0]
+
+
+def _export_spec(name, module):
+    """Graph, dummy inputs, input names and dynamic axes used to export a component"""
+    config = module.config
+    if name == "unet":
+        return (_UNetGraph(module),
+                (torch.randn(2, config.in_channels, config.sample_size, config.sample_size),
+                 torch.tensor([999.0, 999.0]),
+                 torch.randn(2, CLIP_SEQUENCE_LENGTH, config.cross_attention_dim)),
+                ["sample", "timestep", "encoder_hidden_states"],
+                {"sample": {0: "batch", 2: "height", 3: "width"}, "timestep": {0: "batch"},
+                 "encoder_hidden_states": {0: "batch", 1: "sequence"}})
+    if name == "text_encoder":
+        return (_TextEncoderGraph(module),
+                (torch.zeros(1, CLIP_SEQUENCE_LENGTH, dtype=torch.long),),
+                ["input_ids"],
+                {"input_ids": {0: "batch", 1: "sequence"}})
+    return (_VaeDecoderGraph(module),
+            (torch.randn(1, config.latent_channels, 64, 64),),
+            ["latents"],
+            {"latents": {0: "batch", 2: "height", 3: "width"}})
+
+
+class _OnnxRuntimeSession:
+    def __init__(self, path, threads):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = max(CPU_INTER_OP_THREADS, 1)
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def run(self, inputs):
+        return self.session.run(None, inputs)
+
+
+class _OpenVinoModel:
+    def __init__(self, path, threads):
+        import openvino
+        core = openvino.Core()
+        self.model = core.compile_model(core.read_model(path), "CPU",
+                                        {"INFERENCE_NUM_THREADS": threads, "PERFORMANCE_HINT": "LATENCY"})
+
+    def run(self, inputs):
+        results = self.model(inputs)
+        return [results[output] for output in self.model.outputs]
+
+
+RUNTIMES = {"onnx": _OnnxRuntimeSession, "openvino": _OpenVinoModel}
+
+
+class _ExportedModule(torch.nn.Module):
+    """
+    Stand-in for a pipeline component running in an exported runtime
+
+    Holds no torch parameters; footprint_bytes stands in for them in the
+    tiered model cache's accounting. Outputs are tuples, as the pipeline
+    requests with return_dict=False. Calls using inputs the export has no
+    slot for run on the eager module instead, which stays resident for them,
+    so footprint_bytes counts both the export and the eager weights.
+    """
+
+    def __init__(self, runtime, eager, footprint_bytes):
+        super().__init__()
+        self.runtime = runtime
+        self.config = eager.config
+        # Not registered as a submodule: its parameters belong to the registry
+        self.__dict__["eager"] = eager
+        self.footprint_bytes = footprint_bytes
+        self.lock = threading.Lock()  # Runtimes reuse one inference request
+
+    @property
+    def dtype(self):
+        return torch.float32
+
+    @property
+    def device(self):
+        return torch.device("cpu")
+
+    def _run(self, **inputs):
+        with self.lock:
+            return [torch.from_numpy(output) for output in self.runtime.run(inputs)]
+
+
+class _ExportedUNet(_ExportedModule):
+    def forward(self, sample, timestep, encoder_hidden_states, timestep_cond=None, **kwargs):
+        # The export takes sample, timestep and text embeddings only
+        if timestep_cond is not None or any(value is not None for key, value in kwargs.items()
+                                            if key != "return_dict"):
+            return self.eager(sample, timestep, encoder_hidden_states, timestep_cond=timestep_cond, **kwargs)
+        timestep = torch.as_tensor(timestep, dtype=torch.float32).reshape(-1).expand(sample.shape[0])
+        return (self._run(sample=_to_numpy(sample), timestep=_to_numpy(timestep),
+                          encoder_hidden_states=_to_numpy(encoder_hidden_states))[0],)
+
+
+class _ExportedTextEncoder(_ExportedModule):
+    def forward(self, input_ids, attention_mask=None, output_hidden_states=None, **kwargs):
+        # The export returns the last hidden state only (e.g. no clip skip)
+        if output_hidden_states or attention_mask is not None:
+            return self.eager(input_ids, attention_mask=attention_mask,
+                              output_hidden_states=output_hidden_states, **kwargs)
+        return (self._run(input_ids=input_ids.detach().cpu().long().numpy())[0],)
+
+
+class _ExportedVaeDecoder(_ExportedModule):
+    def __init__(self, runtime, eager, footprint_bytes):
+        super().__init__(runtime, eager, footprint_bytes)
+        self.use_slicing = False
+
+    def enable_slicing(self):
+        self.use_slicing = True
+
+    def disable_slicing(self):
+        self.use_slicing = False
+
+    def decode(self, latents, return_dict=False, generator=None):
+        if self.use_slicing and latents.shape[0] > 1:
+            return (torch.cat([self._run(latents=_to_numpy(latent))[0] for latent in latents.split(1)]),)
+        return (self._run(latents=_to_numpy(latents))[0],)
+
+
+WRAPPERS = {"unet": _ExportedUNet, "text_encoder": _ExportedTextEncoder, "vae": _ExportedVaeDecoder}
+
+
+class CpuBackend:
+    def __init__(self, requested=CPU_BACKEND, export_dir=CPU_EXPORT_DIR,
+                 channels_last=CPU_CHANNELS_LAST, bf16_autocast=CPU_BF16_AUTOCAST):
+        """
+        Initialize the backend selection
+
+        Args:
+            requested: Key of BACKEND_CHAINS
+            export_dir: Directory holding ONNX exports, one folder per component hash
+            channels_last: Use NHWC memory format in the torch backends
+            bf16_autocast: Autocast to bfloat16 in the torch backends when the CPU supports it
+        """
+        if requested not in BACKEND_CHAINS:
+            raise ValueError(f"Unknown CPU backend: {requested} (supported: {', '.join(BACKEND_CHAINS)})")
+        self.requested = requested
+        self.export_dir = export_dir
+        self.channels_last = channels_last
+        self.bf16 = bf16_autocast and bf16_supported()
+        self.active = {}  # style -> backend it was loaded with
+        self.failures = {}  # backend -> last error that made a load fall back
+        self.modules = {}  # (backend, component, fingerprint) -> module shared by styles
+        self.lock = threading.Lock()
+        self.export_lock = threading.Lock()
+
+    def optimize(self, pipe, style, fingerprints):
+        """
+        Apply the first working backend of the requested chain to a CPU pipeline
+
+        Args:
+            pipe: Pipeline built from registry components
+            style: Style being loaded
+            fingerprints: Component name -> weight hash, so exports and compiled
+                modules are shared between styles like the weights are
+
+        Returns:
+            StableDiffusionPipeline: The pipeline, with pipe.cpu_backend set
+        """
+        for backend in BACKEND_CHAINS[self.requested]:
+            if not _installed(backend):
+                continue
+            try:
+                if backend in RUNTIMES:
+                    self._apply_exported(pipe, backend, fingerprints)
+                else:
+                    self._apply_torch(pipe, backend, fingerprints)
+            except Exception as e:
+                logger.warning(f"CPU backend {backend} failed for {style}, falling back: {e}")
+                with self.lock:
+                    self.failures[backend] = str(e)
+                continue
+            pipe.cpu_backend = backend
+            with self.lock:
+                self.active[style] = backend
+            logger.info(f"Running {style} on the {backend} CPU backend")
+            return pipe
+        raise RuntimeError(f"No CPU backend could run {style}")
+
+    @property
+    def name(self):
+        """Backend new loads resolve to: the first installed one in the requested chain that has not failed"""
+        with self.lock:
+            failed = set(self.failures)
+        for backend in BACKEND_CHAINS[self.requested]:
+            if _installed(backend) and backend not in failed:
+                return backend
+        return "eager"
+
+    def _shared(self, key, build):
+        with self.lock:
+            module = self.modules.get(key)
+        if module is None:
+            module = build()
+            with self.lock:
+                module = self.modules.setdefault(key, module)
+        return module
+
+    def _apply_torch(self, pipe, backend, fingerprints):
+        if self.channels_last:
+            # Shared modules are converted once; converting again is a no-op
+            pipe.unet.to(memory_format=torch.channels_last)
+            pipe.vae.to(memory_format=torch.channels_last)
+        if backend == "compile":
+            import torch._dynamo
+            # Graphs that fail to compile (e.g. no C++ toolchain) run eagerly
+            torch._dynamo.config.suppress_errors = True
+            unet = pipe.unet
+            pipe.unet = self._shared(("compile", "unet", fingerprints["unet"]), lambda: torch.compile(unet))
+            if not getattr(pipe.vae, "decoder_compiled", False):
+                pipe.vae.decoder = torch.compile(pipe.vae.decoder)
+                pipe.vae.decoder_compiled = True
+
+    def _apply_exported(self, pipe, backend, fingerprints):
+        threads = torch.get_num_threads()
+        # Build every replacement before swapping any, so a failure leaves the pipeline intact
+        replacements = {}
+        for name in EXPORTED_COMPONENTS:
+            component = getattr(pipe, name)
+
+            def build(name=name, component=component):
+                path = self._export(name, component, fingerprints[name])
+                # The runtime holds its own copy of the weights next to the eager fallback
+                return WRAPPERS[name](RUNTIMES[backend](path, threads), component,
+                                      _dir_bytes(os.path.dirname(path)) + module_bytes(component))
+
+            replacements[name] = self._shared((backend, name, fingerprints[name]), build)
+        for name, module in replacements.items():
+            setattr(pipe, name, module)
+
+    def _export(self, name, module, fingerprint):
+        """Export a component to ONNX unless an export of the same weights exists"""
+        folder = os.path.join(self.export_dir, f"{name}-{fingerprint[:16]}")
+        path = os.path.join(folder, "model.onnx")
+        with self.export_lock:
+            if os.path.exists(path):
+                return path
+            graph, dummy_inputs, input_names, dynamic_axes = _export_spec(name, module)
+            staging = f"{folder}.tmp"
+            shutil.rmtree(staging, ignore_errors=True)
+            os.makedirs(staging)
+            start_time = time.perf_counter()
+            with metrics.stage("model_export"), torch.no_grad():
+                torch.onnx.export(graph, dummy_inputs, os.path.join(staging, "model.onnx"),
+                                  input_names=input_names, output_names=["output"],
+                                  dynamic_axes=dynamic_axes, opset_version=ONNX_OPSET,
+                                  do_constant_folding=True)
+            # Weights over 2GB go to external data files next to the graph
+            os.replace(staging, folder)
+            logger.info(f"Exported {name} to ONNX in {time.perf_counter() - start_time:.1f}s")
+        return path
+
+    def retain(self, live_components):
+        """
+        Drop compiled and exported modules whose weights no loaded style uses
+
+        Args:
+            live_components: (component name, fingerprint) pairs still resident in the registry
+        """
+        with self.lock:
+            for key in list(self.modules):
+                if key[1:] not in live_components:
+                    del self.modules[key]
+
+    def autocast(self, pipe):
+        """Context for running a pipeline: bfloat16 autocast on the torch backends when enabled"""
+        if self.bf16 and getattr(pipe, "cpu_backend", None) in ("eager", "compile"):
+            return torch.autocast("cpu", dtype=torch.bfloat16)
+        return nullcontext()
+
+    def stats(self):
+        """Get the requested, resolved and active backends"""
+        resolved = self.name
+        with self.lock:
+            return {
+                "requested": self.requested,
+                "resolved": resolved,
+                "installed": [backend for backend in ("openvino", "onnx", "compile") if _installed(backend)],
+                "active": dict(self.active),
+                "failures": dict(self.failures),
+                "bf16_autocast": self.bf16,
+                "channels_last": self.channels_last,
+                "intra_op_threads": torch.get_num_threads(),
+                "inter_op_threads": torch.get_num_interop_threads(),
+            }
+
+
+# Selected once when the configuration is loaded
+backend = CpuBackend()
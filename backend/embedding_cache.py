@@ -0,0 +1,88 @@
+"""
+Bounded LRU cache of CLIP text embeddings for a loaded pipeline
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+import torch
+from config import *
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    def __init__(self, pipe, max_entries=EMBEDDING_CACHE_SIZE):
+        """
+        Initialize the cache for one pipeline
+
+        Args:
+            pipe: Stable Diffusion pipeline whose text encoder produces the embeddings
+            max_entries: Maximum number of unpinned prompts to keep
+        """
+        self.pipe = pipe
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.pinned = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _encode(self, text):
+        """Run the text encoder for a single prompt"""
+        with torch.no_grad(), metrics.stage("text_encode"):
+            # The text encoder may sit on another device than the rest of a
+            # pipeline that is parked in RAM
+            prompt_embeds, _ = self.pipe.encode_prompt(
+                text, self.pipe.text_encoder.device, num_images_per_prompt=1, do_classifier_free_guidance=False
+            )
+        return prompt_embeds
+
+    def pin(self, text):
+        """Precompute an embedding that is never evicted (e.g. the negative prompt)"""
+        embeds = self._encode(text)
+        with self.lock:
+            self.pinned[text] = embeds
+        return embeds
+
+    def get(self, text):
+        """
+        Get the embedding for a prompt, encoding it on a miss
+
+        Returns:
+            torch.Tensor: Embedding of shape (1, seq_len, hidden) on the pipeline device
+        """
+        with self.lock:
+            embeds = self.pinned.get(text)
+            if embeds is None:
+                embeds = self.entries.get(text)
+                if embeds is not None:
+                    self.entries.move_to_end(text)
+            if embeds is not None:
+                self.hits += 1
+        metrics.increment("cache_lookups_total", cache="embedding",
+                          result="miss" if embeds is None else "hit")
+        if embeds is None:
+            embeds = self._encode(text)
+            with self.lock:
+                self.misses += 1
+                self.entries[text] = embeds
+                self.entries.move_to_end(text)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return embeds.to(self.pipe.device)
+
+    def get_batch(self, texts):
+        """Get stacked embeddings for a list of prompts"""
+        return torch.cat([self.get(text) for text in texts], dim=0)
+
+    def stats(self):
+        """Get cache statistics"""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.entries),
+                "pinned": len(self.pinned),
+            }
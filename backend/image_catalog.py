@@ -0,0 +1,174 @@
+"""
+Catalog of generated images, kept in memory and persisted in SQLite
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import *
+from image_encoder import IMAGE_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+
+class ImageCatalog:
+    def __init__(self, images_dir=IMAGES_DIR, db_path=IMAGE_CATALOG_DB_PATH):
+        """
+        Initialize the catalog and reconcile it with the images on disk
+
+        Args:
+            images_dir: Directory generated images are served from
+            db_path: SQLite database persisting the catalog across restarts
+        """
+        self.images_dir = images_dir
+        self.entries = OrderedDict()  # filename -> record, oldest first
+        self.lock = threading.Lock()
+        os.makedirs(images_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS images ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT UNIQUE NOT NULL, prompt TEXT, "
+            "style TEXT, dimensions TEXT, created_at REAL NOT NULL, size_bytes INTEGER NOT NULL)"
+        )
+        self._reconcile()
+
+    def _reconcile(self):
+        """
+        Load the persisted catalog and sync it with the directory once at startup
+
+        Files written while the server was down are added without a prompt;
+        rows whose file disappeared are dropped.
+        """
+        on_disk = {name for name in os.listdir(self.images_dir)
+                   if name.lower().endswith(IMAGE_EXTENSIONS)}
+        rows = self.db.execute(
+            "SELECT id, filename, prompt, style, dimensions, created_at, size_bytes FROM images ORDER BY id"
+        ).fetchall()
+
+        missing = []
+        for row in rows:
+            record = self._record(row)
+            if record["filename"] in on_disk:
+                self.entries[record["filename"]] = record
+            else:
+                missing.append((record["filename"],))
+        if missing:
+            self.db.executemany("DELETE FROM images WHERE filename = ?", missing)
+
+        untracked = []
+        for name in on_disk - set(self.entries):
+            stat = os.stat(os.path.join(self.images_dir, name))
+            untracked.append((stat.st_mtime, name, stat.st_size))
+        for created_at, name, size_bytes in sorted(untracked):
+            self._insert(name, None, None, None, created_at, size_bytes)
+
+        logger.info(f"Image catalog loaded {len(self.entries)} images "
+                    f"({len(untracked)} untracked, {len(missing)} missing)")
+
+    @staticmethod
+    def _record(row):
+        image_id, filename, prompt, style, dimensions, created_at, size_bytes = row
+        return {
+            "id": image_id,
+            "filename": filename,
+            "prompt": prompt,
+            "style": style,
+            "dimensions": dimensions,
+            "created_at": created_at,
+            "size_bytes": size_bytes,
+        }
+
+    def _insert(self, filename, prompt, style, dimensions, created_at, size_bytes):
+        """Persist and index a record (caller holds the lock or is the constructor)"""
+        cursor = self.db.execute(
+            "INSERT OR REPLACE INTO images (filename, prompt, style, dimensions, created_at, size_bytes) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (filename, prompt, style, dimensions, created_at, size_bytes)
+        )
+        self.entries.pop(filename, None)
+        self.entries[filename] = self._record(
+            (cursor.lastrowid, filename, prompt, style, dimensions, created_at, size_bytes)
+        )
+
+    def add(self, filename, prompt=None, style=None, dimensions=None):
+        """
+        Record a newly written image
+
+        Args:
+            filename: Image filename inside images_dir
+            prompt: Prompt the image was generated from
+            style: Model style used
+            dimensions: Image size, e.g. "512x512"
+        """
+        try:
+            size_bytes = os.path.getsize(os.path.join(self.images_dir, filename))
+        except OSError as e:
+            logger.warning(f"Not cataloguing missing image {filename}: {e}")
+            return
+        with self.lock:
+            self._insert(filename, prompt, style, dimensions, time.time(), size_bytes)
+
+    def get(self, filename):
+        """Get the record of a catalogued image, or None"""
+        with self.lock:
+            return self.entries.get(filename)
+
+    def remove(self, filename):
+        """Delete an image file and its catalog entry"""
+        with self.lock:
+            self.entries.pop(filename, None)
+            self.db.execute("DELETE FROM images WHERE filename = ?", (filename,))
+        try:
+            os.remove(os.path.join(self.images_dir, filename))
+        except FileNotFoundError:
+            pass
+
+    def trim(self, max_images):
+        """
+        Delete the oldest images beyond max_images
+
+        Returns:
+            list: Filenames that were removed
+        """
+        with self.lock:
+            excess = max(0, len(self.entries) - max_images)
+            oldest = [filename for filename, _ in zip(self.entries, range(excess))]
+        for filename in oldest:
+            self.remove(filename)
+        return oldest
+
+    def count(self):
+        """Number of catalogued images"""
+        with self.lock:
+            return len(self.entries)
+
+    def page(self, limit=20, cursor=None):
+        """
+        Get catalogued images newest first
+
+        Args:
+            limit: Maximum number of records to return
+            cursor: next_cursor from the previous page, or None for the newest images
+
+        Returns:
+            tuple: (records, next_cursor or None when there are no older images)
+        """
+        with self.lock:
+            if cursor is None:
+                rows = self.db.execute(
+                    "SELECT id, filename, prompt, style, dimensions, created_at, size_bytes "
+                    "FROM images ORDER BY id DESC LIMIT ?", (limit + 1,)
+                ).fetchall()
+            else:
+                rows = self.db.execute(
+                    "SELECT id, filename, prompt, style, dimensions, created_at, size_bytes "
+                    "FROM images WHERE id < ? ORDER BY id DESC LIMIT ?", (cursor, limit + 1)
+                ).fetchall()
+        records = [self._record(row) for row in rows[:limit]]
+        next_cursor = records[-1]["id"] if len(rows) > limit else None
+        return records, next_cursor
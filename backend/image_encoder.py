@@ -0,0 +1,159 @@
+"""
+Background encoding of generated images into their output formats
+"""
+
+import io
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import *
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Output format -> (file extension, PIL format, save options)
+OUTPUT_FORMATS = {
+    "png": ("png", "PNG", {"compress_level": PNG_COMPRESS_LEVEL}),
+    "png_fast": ("png", "PNG", {"compress_level": 1}),
+    "webp": ("webp", "WEBP", {"quality": IMAGE_QUALITY, "method": 4}),
+    "jpeg": ("jpg", "JPEG", {"quality": IMAGE_QUALITY}),
+}
+
+# Files are written with the extensions above; ".jpeg" is also recognised on disk
+IMAGE_EXTENSIONS = tuple(sorted({f".{extension}" for extension, _, _ in OUTPUT_FORMATS.values()} | {".jpeg"}))
+
+
+def file_extension(output_format):
+    """File extension (without the dot) used for an output format"""
+    return OUTPUT_FORMATS[output_format][0]
+
+
+def encode_image(image, output_format):
+    """
+    Encode a PIL image into bytes
+
+    Args:
+        image: PIL image to encode
+        output_format: Key of OUTPUT_FORMATS
+
+    Returns:
+        bytes: Encoded image
+    """
+    _, pil_format, options = OUTPUT_FORMATS[output_format]
+    if pil_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    with metrics.stage("image_encode"):
+        image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def save_image(image, filepath, output_format):
+    """
+    Encode an image and write it atomically, so readers never see a partial file
+
+    Returns:
+        int: Size of the written file in bytes
+    """
+    data = encode_image(image, output_format)
+    tmp_path = filepath + ".tmp"
+    with metrics.stage("file_write"):
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, filepath)
+    return len(data)
+
+
+class ImageEncoder:
+    def __init__(self, num_workers=ENCODER_WORKERS):
+        """
+        Initialize the encoder pool
+
+        Args:
+            num_workers: Threads encoding and writing images (PIL releases the GIL while encoding)
+        """
+        self.executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="image-encoder")
+        self.pending = {}  # filename -> Future
+        self.encoded = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def submit(self, image, filepath, output_format):
+        """
+        Queue an image for encoding and writing
+
+        Args:
+            image: PIL image held in memory until it is written
+            filepath: Destination path
+            output_format: Key of OUTPUT_FORMATS
+
+        Returns:
+            Future: Resolves to the written file size in bytes
+        """
+        filename = os.path.basename(filepath)
+        with self.lock:
+            future = self.executor.submit(self._save, image, filepath, output_format)
+            self.pending[filename] = future
+        future.add_done_callback(lambda _: self._finished(filename, future))
+        return future
+
+    def _save(self, image, filepath, output_format):
+        try:
+            return save_image(image, filepath, output_format)
+        except Exception as e:
+            logger.error(f"Error encoding {os.path.basename(filepath)}: {e}")
+            raise
+
+    def _finished(self, filename, future):
+        with self.lock:
+            if self.pending.get(filename) is future:
+                del self.pending[filename]
+            if future.exception() is None:
+                self.encoded += 1
+            else:
+                self.failed += 1
+
+    def when_written(self, filename, callback):
+        """
+        Call callback() once filename has been written
+
+        Runs immediately when the file is not being encoded (e.g. it was
+        written by an inference worker process). Skipped if encoding failed.
+        """
+        with self.lock:
+            future = self.pending.get(filename)
+        if future is None:
+            callback()
+            return
+
+        def run(done):
+            if done.exception() is None:
+                callback()
+        future.add_done_callback(run)
+
+    def wait(self, filename, timeout=ENCODE_WAIT_SECONDS):
+        """
+        Block until a pending image has been written
+
+        Returns:
+            bool: False if it is still encoding after timeout or encoding failed
+        """
+        with self.lock:
+            future = self.pending.get(filename)
+        if future is None:
+            return True
+        try:
+            future.result(timeout=timeout)
+            return True
+        except Exception:
+            return False
+
+    def stats(self):
+        """Get encoder statistics"""
+        with self.lock:
+            return {
+                "pending": len(self.pending),
+                "encoded": self.encoded,
+                "failed": self.failed,
+            }
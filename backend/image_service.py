@@ -6,95 +6,165 @@ import os
 import logging
 import time
 import gc
+import threading
+import uuid
 import torch
 from PIL import Image
 import io
-import glob
+import base64
 import psutil
 from datetime import datetime
-from diffusers import StableDiffusionPipeline
+from diffusers import StableDiffusionImg2ImgPipeline
 import model_loader
+import cpu_backend
+import quality_tiers
+from tiered_model_cache import TieredModelCache
+import metrics
+import style_router
+from image_encoder import file_extension, save_image
 from config import *
 
 logger = logging.getLogger(__name__)
 
+# Linear approximation of the SD 1.x VAE decoder: maps the 4 latent channels
+# straight to RGB, so previews cost a matrix multiply instead of a VAE pass
+LATENT_RGB_FACTORS = torch.tensor([
+    [0.298, 0.207, 0.208],
+    [0.187, 0.286, 0.173],
+    [-0.158, 0.189, 0.264],
+    [-0.184, -0.271, -0.473],
+])
+
+class GenerationCancelled(Exception):
+    """Raised from the step callback when every job in a batch was cancelled"""
+
+def latents_to_preview(latents):
+    """
+    Build a cheap low-resolution preview from intermediate latents
+    
+    Args:
+        latents: Latent tensor of shape (4, h, w)
+        
+    Returns:
+        str: Base64-encoded JPEG at latent resolution (1/8 of the output size)
+    """
+    rgb = torch.einsum("chw,cr->hwr", latents.float().cpu(), LATENT_RGB_FACTORS)
+    rgb = ((rgb + 1) / 2).clamp(0, 1).mul(255).byte().numpy()
+    buffer = io.BytesIO()
+    Image.fromarray(rgb).save(buffer, "JPEG", quality=70)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+def draft_size(size, vae_scale_factor=8):
+    """
+    Resolution of the draft for a final size: REFINE_DRAFT_SCALE of it, at least
+    8 latent pixels, in whole latent pixels and the multiple of 8 pipelines accept
+    """
+    multiple = max(8, vae_scale_factor)
+    return max(8 * vae_scale_factor, int(size * REFINE_DRAFT_SCALE) // multiple * multiple)
+
+def image_to_draft(image):
+    """Encode a decoded draft as a base64 JPEG for progress updates"""
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, "JPEG", quality=DRAFT_QUALITY)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+class _DraftCallback:
+    """Progress sink for generate_image that only hands the draft to a callback"""
+    
+    def __init__(self, on_draft):
+        self.on_draft = on_draft
+    
+    def preview_mask(self):
+        return [False]
+    
+    def cancelled(self):
+        return [False]
+    
+    def report(self, step, total_steps, eta_seconds, previews=None, phase=None):
+        pass
+    
+    def publish_drafts(self, drafts):
+        self.on_draft(drafts[0])
+
 class ImageService:
-    def __init__(self):
-        """Initialize the image service"""
-        self.model_cache = {}
-        self.model_last_used = {}
-        self.generation_lock = False
+    def __init__(self, catalog=None, encoder=None):
+        """
+        Initialize the image service
+        
+        Args:
+            catalog: Optional ImageCatalog used to find and remove old images
+            encoder: Optional ImageEncoder; without one images are written before returning
+        """
+        # Pipelines move between the device, CPU RAM and disk by byte budget
+        self.models = TieredModelCache(model_loader.load_model, model_loader.unload_model,
+                                       model_loader.estimate_bytes, model_loader.component_keys)
+        # One generation at a time per process: pipelines share components and
+        # switch schedulers and devices in place (the job queue runs one worker)
+        self.generation_lock = threading.Lock()
+        self.catalog = catalog
+        self.encoder = encoder
         
     def get_model(self, style):
-        """Get model with enhanced memory management"""
-        # Unload unused models first
-        self.unload_unused_models()
-        
-        # If we have too many models in memory, unload the least recently used
-        if len(self.model_cache) >= MAX_MODELS_IN_MEMORY:
-            if style not in self.model_cache:
-                # Find least recently used model
-                lru_style = min(self.model_last_used.keys(), key=lambda k: self.model_last_used[k])
-                logger.info(f"Unloading LRU model: {lru_style}")
-                del self.model_cache[lru_style]
-                del self.model_last_used[lru_style]
-                gc.collect()
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-        
-        # Load model if not in cache
-        if style not in self.model_cache:
-            logger.info(f"Loading model: {style}")
-            self.model_cache[style] = model_loader.load_model(style)
-        
-        # Update last used time
-        self.model_last_used[style] = time.time()
-        
-        return self.model_cache[style]
+        """Get a style's pipeline on the inference device"""
+        with metrics.stage("model_fetch"):
+            return self.models.get(style)
+    
+    def prefetch(self, style):
+        """Start loading a style into CPU RAM ahead of a queued request for it"""
+        self.models.prefetch(style)
     
     def unload_unused_models(self):
-        """Unload models that haven't been used recently"""
-        current_time = time.time()
-        models_to_unload = []
+        """Demote models that haven't been used recently and enforce tier budgets"""
+        self.models.rebalance()
+    
+    def warmup(self, style):
+        """Load a model and run a tiny dummy inference so the first request is fast"""
+        with self.generation_lock:
+            pipe = self.get_model(style)
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            pipe = pipe.to(device)
+            with cpu_backend.backend.autocast(pipe):
+                pipe(
+                    prompt_embeds=pipe.embedding_cache.get_batch([""]),
+                    negative_prompt_embeds=pipe.embedding_cache.get_batch([NEGATIVE_PROMPT]),
+                    num_inference_steps=WARMUP_INFERENCE_STEPS,
+                    guidance_scale=DEFAULT_GUIDANCE_SCALE,
+                    width=WARMUP_IMAGE_SIZE,
+                    height=WARMUP_IMAGE_SIZE
+                )
+            logger.info(f"Warmed up model: {style}")
+    
+    def detect_visual_style(self, prompt):
+        """
+        Route a prompt to a style
+        
+        Returns:
+            tuple: (style, model_id, dreamshaper_score, realistic_score, found_dreamshaper, found_realistic)
+        """
+        decision = self.detect_visual_styles([prompt])[0]
+        return (decision["style"], decision["model_id"],
+                decision["scores"]["dreamshaper"], decision["scores"]["realistic_vision"],
+                decision["matches"]["dreamshaper"], decision["matches"]["realistic_vision"])
+    
+    def detect_visual_styles(self, prompts):
+        """
+        Route many prompts to styles in one pass
         
-        for style, last_used in self.model_last_used.items():
-            if current_time - last_used > MODEL_TIMEOUT:
-                models_to_unload.append(style)
+        Prompts without keyword matches fall back to embedding similarity
+        when STYLE_EMBEDDING_FALLBACK is on and a model is already loaded
+        (routing never loads one).
         
-        for style in models_to_unload:
-            if style in self.model_cache:
-                logger.info(f"Unloading unused model: {style}")
-                model_loader.unload_model(self.model_cache[style])
-                del self.model_cache[style]
-                del self.model_last_used[style]
+        Returns:
+            list: One routing decision dict per prompt (see StyleRouter.classify_batch)
+        """
+        embedder = None
+        if STYLE_EMBEDDING_FALLBACK:
+            loaded = list(self.models.resident().values())
+            if loaded:
+                embedder = loaded[0].embedding_cache
+        return style_router.router.classify_batch(prompts, embedder)
     
-    def detect_visual_style(self, prompt):
-        """Enhanced style detection with better scoring"""
-        prompt_lower = prompt.lower()
-        dreamshaper_score = 0
-        realistic_score = 0
-        found_dreamshaper = []
-        found_realistic = []
-        
-        # Check for dreamshaper keywords
-        for keyword, score in DREAMSHAPER_KEYWORDS.items():
-            if keyword in prompt_lower:
-                dreamshaper_score += score
-                found_dreamshaper.append(f"{keyword} (+{score})")
-        
-        # Check for realistic keywords
-        for keyword, score in REALISTIC_KEYWORDS.items():
-            if keyword in prompt_lower:
-                realistic_score += score
-                found_realistic.append(f"{keyword} (+{score})")
-        
-        # Determine style with confidence
-        if dreamshaper_score > realistic_score:
-            return ("dreamshaper", "Lykon/dreamshaper-8", dreamshaper_score, realistic_score, found_dreamshaper, found_realistic)
-        else:
-            return ("realistic_vision", "SG161222/Realistic_Vision_V5.1_noVAE", dreamshaper_score, realistic_score, found_dreamshaper, found_realistic)
-    
-    def generate_image(self, prompt, style=None, images_dir=IMAGES_DIR):
+    def generate_image(self, prompt, style=None, images_dir=IMAGES_DIR, refine=False, seed=None, on_draft=None):
         """
         Generate image from prompt
         
@@ -102,133 +172,324 @@ class ImageService:
             prompt: Text prompt for image generation
             style: Style to use (auto-detected if None)
             images_dir: Directory to save generated images
+            refine: Draft-then-refine: produce a fast draft, then refine its latents
+            seed: Optional seed; with it the final image is reproducible
+            on_draft: With refine, called with the draft (base64 JPEG) as soon as
+                it is decoded, before refining starts
             
         Returns:
-            dict: Generation result with filename and metadata
+            dict: Generation result with filename and metadata (the final image)
         """
-        try:
-            # Check if generation is already in progress
-            if self.generation_lock:
-                return {
-                    "success": False,
-                    "error": "Generation already in progress"
-                }
+        # Auto-detect style if not provided
+        if style is None:
+            style, model_path, dreamshaper_score, realistic_score, found_dreamshaper, found_realistic = self.detect_visual_style(prompt)
+            logger.info(f"Auto-detected style: {style} (dreamshaper: {dreamshaper_score}, realistic: {realistic_score})")
+        
+        progress = _DraftCallback(on_draft) if refine and on_draft is not None else None
+        return self.generate_batch([prompt], style, images_dir=images_dir, refine=refine,
+                                   seeds=[seed] if seed is not None else None, progress=progress)[0]
+    
+    def generate_batch(self, prompts, style, steps=DEFAULT_INFERENCE_STEPS, size=IMAGE_SIZE,
+                       seeds=None, images_dir=IMAGES_DIR, progress=None, output_formats=None,
+                       sliced=False, scheduler=None, guidance_scale=DEFAULT_GUIDANCE_SCALE, refine=False):
+        """
+        Generate one image per prompt in a single batched pipeline call
+        
+        Args:
+            prompts: List of text prompts sharing the same settings
+            style: Style to use for every prompt
+            steps: Number of inference steps
+            size: Width and height of the generated images
+            seeds: Optional per-prompt seeds for reproducible output
+            images_dir: Directory to save generated images
+            progress: Optional progress sink with report(), cancelled(), preview_mask()
+                and publish_drafts()
+            output_formats: Optional per-prompt output formats (default IMAGE_FORMAT)
+            sliced: Run attention one head at a time and decode images one by one,
+                trading speed for a lower memory peak (set by admission control)
+            scheduler: Key of quality_tiers.SCHEDULERS, or None for the model's own
+            guidance_scale: Classifier-free guidance scale (1 or less disables guidance)
+            refine: Denoise a REFINE_DRAFT_STEPS draft at REFINE_DRAFT_SCALE of the size,
+                publish it through progress, then refine its upscaled latents with an
+                img2img pass over the last REFINE_STRENGTH of a steps-step schedule
             
-            self.generation_lock = True
+        Returns:
+            list: One generation result dict per prompt, in order. With an
+            encoder the files may still be being written when this returns
+        """
+        output_formats = output_formats or [IMAGE_FORMAT] * len(prompts)
+        # Serialize access to the shared pipelines; callers queue up here
+        # instead of being rejected while another generation is running
+        with self.generation_lock:
+            return self._generate_batch(prompts, style, steps, size, seeds, images_dir, progress,
+                                        output_formats, sliced, scheduler, guidance_scale, refine)
+    
+    def _make_step_callback(self, progress, start_time, phase=None):
+        """Build a diffusers step callback that reports progress and honours cancellation"""
+        preview_mask = progress.preview_mask() if progress is not None else []
+        last_step_end = [time.perf_counter()]
+        
+        def on_step_end(pipe, step_index, timestep, callback_kwargs):
+            now = time.perf_counter()
+            metrics.observe("stage_duration_seconds", now - last_step_end[0], stage="denoise_step")
+            last_step_end[0] = now
+            if progress is None:
+                return callback_kwargs
             
-            # Auto-detect style if not provided
-            if style is None:
-                style, model_path, dreamshaper_score, realistic_score, found_dreamshaper, found_realistic = self.detect_visual_style(prompt)
-                logger.info(f"Auto-detected style: {style} (dreamshaper: {dreamshaper_score}, realistic: {realistic_score})")
+            cancelled = progress.cancelled()
+            if all(cancelled):
+                raise GenerationCancelled()
             
+            step = step_index + 1
+            # img2img runs only the tail of the schedule
+            total_steps = pipe.num_timesteps
+            elapsed = time.time() - start_time
+            eta_seconds = elapsed / step * (total_steps - step)
+            
+            previews = None
+            if any(preview_mask) and (step % PREVIEW_EVERY_STEPS == 0 or step == total_steps):
+                latents = callback_kwargs["latents"]
+                previews = [
+                    latents_to_preview(latents[index]) if wanted and not cancelled[index] else None
+                    for index, wanted in enumerate(preview_mask)
+                ]
+            progress.report(step, total_steps, eta_seconds, previews, phase)
+            return callback_kwargs
+        
+        return on_step_end
+    
+    def _draft_and_refine(self, pipe, generation_kwargs, seeds, size, steps, progress):
+        """
+        Denoise a fast draft, publish it, and refine its latents at full size
+        
+        Both phases draw their noise from generators seeded with the request
+        seeds, so the final latents are reproducible.
+        
+        Returns:
+            torch.Tensor: Refined latents
+        """
+        def generators():
+            # CPU generators give the same noise regardless of the pipeline device
+            return [torch.Generator("cpu").manual_seed(seed) for seed in seeds] if seeds is not None else None
+        
+        def callback(phase):
+            if progress is None and not metrics.enabled:
+                return None
+            return self._make_step_callback(progress, time.time(), phase)
+        
+        draft = draft_size(size, pipe.vae_scale_factor)
+        draft_kwargs = dict(generation_kwargs, num_inference_steps=REFINE_DRAFT_STEPS,
+                            width=draft, height=draft, generator=generators(),
+                            callback_on_step_end=callback("draft"))
+        with metrics.stage("draft_denoise"):
+            latents = pipe(output_type="latent", **draft_kwargs).images
+        
+        if progress is not None:
+            with metrics.stage("draft_decode"), torch.no_grad():
+                decoded = pipe.vae.decode(latents / pipe.vae.config.scaling_factor, return_dict=False)[0]
+                drafts = pipe.image_processor.postprocess(decoded, output_type="pil")
+            progress.publish_drafts([image_to_draft(draft) for draft in drafts])
+        
+        if draft != size:
+            # Latent upscale: refining adds the detail the small draft lacks
+            latent_size = size // pipe.vae_scale_factor
+            latents = torch.nn.functional.interpolate(latents, size=(latent_size, latent_size), mode="bicubic")
+        
+        # Same components, scheduler and attention settings as the text-to-image pipeline
+        refiner = StableDiffusionImg2ImgPipeline(**pipe.components, requires_safety_checker=False)
+        refine_kwargs = {name: value for name, value in generation_kwargs.items()
+                         if name in ("prompt_embeds", "negative_prompt_embeds", "guidance_scale")}
+        with metrics.stage("refine_denoise"):
+            return refiner(image=latents, strength=REFINE_STRENGTH, num_inference_steps=steps,
+                           generator=generators(), callback_on_step_end=callback("refine"),
+                           output_type="latent", **refine_kwargs).images
+    
+    def _generate_batch(self, prompts, style, steps, size, seeds, images_dir, progress, output_formats,
+                        sliced=False, scheduler=None, guidance_scale=DEFAULT_GUIDANCE_SCALE, refine=False):
+        """Run a batched generation (caller holds generation_lock)"""
+        try:
             # Get model
             pipe = self.get_model(style)
             
-            # Generate image
-            logger.info(f"Generating image with prompt: {prompt[:100]}...")
+            # Generate images
+            logger.info(f"Generating {len(prompts)} image(s) with {style}: {prompts[0][:100]}...")
             
             # Track generation time
             start_time = time.time()
             
             # Set generation parameters
-            generation_kwargs = {
-                "prompt": prompt,
-                "negative_prompt": "blurry, low quality, distorted, deformed",
-                "num_inference_steps": DEFAULT_INFERENCE_STEPS,
-                "guidance_scale": DEFAULT_GUIDANCE_SCALE,
-                "width": IMAGE_SIZE,
-                "height": IMAGE_SIZE
-            }
-            
             # Ensure model is on correct device
             device = "cuda" if torch.cuda.is_available() else "cpu"
             pipe = pipe.to(device)
+            quality_tiers.apply_scheduler(pipe, scheduler)
+            
+            # Reuse cached CLIP embeddings instead of re-encoding every prompt
+            generation_kwargs = {
+                "prompt_embeds": pipe.embedding_cache.get_batch(prompts),
+                "num_inference_steps": steps,
+                "guidance_scale": guidance_scale,
+                "width": size,
+                "height": size
+            }
+            if guidance_scale > 1:
+                generation_kwargs["negative_prompt_embeds"] = pipe.embedding_cache.get_batch(
+                    [NEGATIVE_PROMPT] * len(prompts))
+            if seeds is not None:
+                # CPU generators give the same noise regardless of the pipeline device
+                generation_kwargs["generator"] = [torch.Generator("cpu").manual_seed(seed) for seed in seeds]
+            if progress is not None or metrics.enabled:
+                generation_kwargs["callback_on_step_end"] = self._make_step_callback(progress, start_time)
+            
+            if device == "cuda":
+                # Measured peaks correct the admission controller's estimates
+                torch.cuda.reset_peak_memory_stats()
+                baseline_memory = torch.cuda.memory_allocated()
+            if sliced:
+                pipe.enable_attention_slicing("max")
+                pipe.enable_vae_slicing()
             
-            # Generate image
-            result = pipe(**generation_kwargs)
+            # Denoise to latents, then decode with the VAE separately so each
+            # stage can be timed (there is no safety checker to skip)
+            try:
+                with cpu_backend.backend.autocast(pipe):
+                    denoise_start = time.perf_counter()
+                    if refine:
+                        latents = self._draft_and_refine(pipe, generation_kwargs, seeds, size, steps, progress)
+                    else:
+                        with metrics.stage("denoise"):
+                            latents = pipe(output_type="latent", **generation_kwargs).images
+                    denoise_seconds = time.perf_counter() - denoise_start
+                    with metrics.stage("vae_decode"), torch.no_grad():
+                        decoded = pipe.vae.decode(latents / pipe.vae.config.scaling_factor, return_dict=False)[0]
+                        images = pipe.image_processor.postprocess(decoded, output_type="pil")
+            finally:
+                if sliced:
+                    # Back to the settings model_loader chose
+                    if pipe.default_attention_slice is None:
+                        pipe.disable_attention_slicing()
+                    else:
+                        pipe.enable_attention_slicing(pipe.default_attention_slice)
+                    if device != "cuda":
+                        pipe.disable_vae_slicing()
+            
+            peak_memory_mb = None
+            if device == "cuda":
+                peak_memory_mb = (torch.cuda.max_memory_allocated() - baseline_memory) / 1024 / 1024
             
             # Calculate generation time
             generation_time = time.time() - start_time
-            image = result.images[0]
-            
-            # Save image
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"generated_{timestamp}_{style}.png"
-            filepath = os.path.join(images_dir, filename)
             
             # Ensure directory exists
             os.makedirs(images_dir, exist_ok=True)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             
-            # Save image with quality settings
-            image.save(filepath, "PNG", optimize=True)
+            cancelled = progress.cancelled() if progress is not None else [False] * len(prompts)
+            results = []
+            for index, (prompt, image) in enumerate(zip(prompts, images)):
+                if cancelled[index]:
+                    results.append({"success": False, "cancelled": True, "error": "Generation cancelled"})
+                    continue
+                
+                output_format = output_formats[index]
+                filename = f"generated_{timestamp}_{style}_{uuid.uuid4().hex[:8]}.{file_extension(output_format)}"
+                filepath = os.path.join(images_dir, filename)
+                
+                # Encode off this thread when possible so the next batch can start
+                if self.encoder is not None:
+                    self.encoder.submit(image, filepath, output_format)
+                else:
+                    save_image(image, filepath, output_format)
+                
+                logger.info(f"Image generated successfully: {filename}")
+                
+                results.append({
+                    "success": True,
+                    "filename": filename,
+                    "filepath": filepath,
+                    "style": style,
+                    "prompt": prompt,
+                    "timestamp": timestamp,
+                    "metadata": {
+                        "model": style,
+                        "steps": steps,
+                        "guidance_scale": guidance_scale,
+                        "scheduler": scheduler or "default",
+                        "size": f"{size}x{size}",
+                        "format": output_format,
+                        "seed": seeds[index] if seeds is not None else None,
+                        "batch_size": len(prompts),
+                        "sliced": sliced,
+                        "peak_memory_mb": peak_memory_mb,
+                        "refine": {"draft_steps": REFINE_DRAFT_STEPS,
+                                   "draft_size": draft_size(size, pipe.vae_scale_factor),
+                                   "strength": REFINE_STRENGTH} if refine else None,
+                        "generation_time": f"{generation_time:.2f}s",
+                        "timings": {"denoise_seconds": round(denoise_seconds, 3),
+                                    "total_seconds": round(generation_time, 3)}
+                    }
+                })
             
-            logger.info(f"Image generated successfully: {filename}")
+            return results
             
-            return {
-                "success": True,
-                "filename": filename,
-                "filepath": filepath,
-                "style": style,
-                "prompt": prompt,
-                "timestamp": timestamp,
-                "metadata": {
-                    "model": style,
-                    "steps": DEFAULT_INFERENCE_STEPS,
-                    "guidance_scale": DEFAULT_GUIDANCE_SCALE,
-                    "size": f"{IMAGE_SIZE}x{IMAGE_SIZE}",
-                    "generation_time": f"{generation_time:.2f}s"
-                }
-            }
+        except GenerationCancelled:
+            logger.info(f"Generation cancelled for {len(prompts)} image(s)")
+            return [{"success": False, "cancelled": True, "error": "Generation cancelled"} for _ in prompts]
             
         except Exception as e:
             logger.error(f"Error generating image: {e}")
+            error = str(e)
             
             # Handle specific meta tensor error
             if "meta tensor" in str(e).lower():
                 logger.error("Meta tensor error detected. Trying to reload model...")
                 try:
                     # Clear model cache and try again
-                    if style in self.model_cache:
-                        del self.model_cache[style]
-                    if style in self.model_last_used:
-                        del self.model_last_used[style]
+                    self.models.discard(style)
                     
                     # Force garbage collection
                     gc.collect()
                     if torch.cuda.is_available():
                         torch.cuda.empty_cache()
                     
-                    return {
-                        "success": False,
-                        "error": "Model loading issue. Please try again."
-                    }
+                    error = "Model loading issue. Please try again."
                 except Exception as reload_error:
                     logger.error(f"Error during model reload: {reload_error}")
             
-            return {
-                "success": False,
-                "error": str(e)
-            }
-        finally:
-            self.generation_lock = False
+            return [{"success": False, "error": error} for _ in prompts]
     
     def cleanup_old_images(self, max_images=MAX_IMAGES_TO_KEEP):
         """Remove old generated images to save disk space"""
+        if self.catalog is None:
+            return
         try:
-            image_files = []
-            for ext in ["*.png", "*.jpg", "*.jpeg"]:
-                image_files.extend(glob.glob(os.path.join(IMAGES_DIR, ext)))
-            
-            if len(image_files) > max_images:
-                # Sort by modification time (oldest first)
-                image_files.sort(key=os.path.getmtime)
-                # Remove oldest files
-                for old_file in image_files[:-max_images]:
-                    os.remove(old_file)
-                    logger.info(f"Removed old image: {os.path.basename(old_file)}")
+            # The catalog keeps images in creation order, so no directory scan is needed
+            for filename in self.catalog.trim(max_images):
+                logger.info(f"Removed old image: {filename}")
         except Exception as e:
             logger.error(f"Error during image cleanup: {e}")
     
+    def get_loaded_models(self):
+        """Get the styles currently loaded in memory"""
+        return list(self.models.resident())
+    
+    def get_embedding_cache_stats(self):
+        """Get text embedding cache statistics per loaded model"""
+        return {style: pipe.embedding_cache.stats() for style, pipe in self.models.resident().items()}
+    
+    def get_model_tier_stats(self):
+        """Get model residency per tier"""
+        return self.models.stats()
+    
+    def get_inference_backend_stats(self):
+        """Get the inference device and, on CPU, the active CPU backend per style"""
+        if torch.cuda.is_available():
+            return {"device": "cuda"}
+        return {"device": "cpu", **cpu_backend.backend.stats()}
+    
+    def is_generating(self):
+        """Check whether a generation is currently running"""
+        return self.generation_lock.locked()
+    
     def get_memory_usage(self):
         """Get current memory usage in MB"""
         try:
@@ -243,7 +504,7 @@ class ImageService:
             return {
                 "cpu_memory_mb": memory_mb,
                 "gpu_memory_mb": gpu_memory,
-                "models_loaded": len(self.model_cache)
+                "models_loaded": len(self.models.resident())
             }
         except Exception as e:
             logger.error(f"Error getting memory usage: {e}")
@@ -0,0 +1,453 @@
+"""
+Generation job queue for running image generation on background workers
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from config import *
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another job"""
+
+
+class Job:
+    """A single queued generation request and its outcome"""
+
+    def __init__(self, params):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.dedup_key = None
+        self.subscribers = 1  # Submissions sharing this job through dedup_key
+        self.progress = None
+        self.cancel_requested = False
+        self.version = 0
+        self.changed = threading.Condition()
+        self.done = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("completed", "failed", "cancelled")
+
+    def touch(self):
+        """Record a state or progress change and wake event stream listeners"""
+        with self.changed:
+            self.version += 1
+            self.changed.notify_all()
+
+    def wait_for_change(self, version, timeout):
+        """
+        Block until the job changes past the given version or the timeout elapses
+
+        Returns:
+            int: The current version
+        """
+        with self.changed:
+            if self.version == version:
+                self.changed.wait(timeout)
+            return self.version
+
+    def to_dict(self, queue_position=None):
+        """Serialize the job for API responses"""
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == "queued":
+            data["queue_position"] = queue_position
+        if self.status == "running" and self.progress is not None:
+            data["progress"] = self.progress
+        if self.status == "completed":
+            data["result"] = self.result
+        if self.status == "failed":
+            data["error"] = self.error
+        return data
+
+
+class BatchProgress:
+    """Progress sink handed to the handler for one batch of jobs"""
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    def preview_mask(self):
+        """Which jobs in the batch asked for intermediate previews"""
+        return [bool(job.params.get("preview")) for job in self.jobs]
+
+    def cancelled(self):
+        """Which jobs in the batch have been cancelled"""
+        return [job.cancel_requested for job in self.jobs]
+
+    def report(self, step, total_steps, eta_seconds, previews=None, phase=None):
+        """
+        Publish denoising progress to every job in the batch
+
+        Args:
+            step: Completed denoising steps
+            total_steps: Total denoising steps
+            eta_seconds: Estimated seconds remaining
+            previews: Optional per-job base64 preview images (None where not requested)
+            phase: "draft" or "refine" for draft-then-refine jobs, whose steps restart between phases
+        """
+        for index, job in enumerate(self.jobs):
+            progress = {
+                "step": step,
+                "total_steps": total_steps,
+                "eta_seconds": round(eta_seconds, 2),
+            }
+            if phase is not None:
+                progress["phase"] = phase
+            if previews is not None and previews[index] is not None:
+                progress["preview"] = previews[index]
+            elif job.progress is not None and "preview" in job.progress:
+                # Keep the last preview until a newer one is decoded
+                progress["preview"] = job.progress["preview"]
+            if job.progress is not None and "draft" in job.progress:
+                progress["draft"] = job.progress["draft"]
+            job.progress = progress
+            job.touch()
+
+    def publish_drafts(self, drafts):
+        """
+        Publish the decoded drafts of a draft-then-refine batch
+
+        Args:
+            drafts: Per-job base64 JPEG drafts, shown in progress until the final image is ready
+        """
+        for job, draft in zip(self.jobs, drafts):
+            job.progress = dict(job.progress or {}, draft=draft)
+            job.touch()
+
+
+class JobQueue:
+    def __init__(self, handler, batch_key=None, num_workers=GENERATION_WORKERS,
+                 max_size=MAX_QUEUE_SIZE, result_ttl=JOB_RESULT_TTL,
+                 max_batch_size=MAX_BATCH_SIZE, batch_window_ms=BATCH_WINDOW_MS, admission=None):
+        """
+        Initialize the job queue
+
+        Args:
+            handler: Callable taking a list of job params and a BatchProgress, returning one result dict per job
+            batch_key: Callable mapping job params to a key; jobs with equal keys may share a batch
+            num_workers: Number of worker threads draining the queue
+            max_size: Maximum number of pending jobs
+            result_ttl: Seconds to keep finished jobs around for polling
+            max_batch_size: Maximum number of jobs handed to the handler at once
+            batch_window_ms: How long to wait for compatible jobs before running a partial batch
+            admission: Optional AdmissionController; batches that do not fit its
+                memory budget are split, sliced or held in the queue
+        """
+        self.handler = handler
+        self.batch_key = batch_key
+        self.max_batch_size = max_batch_size if batch_key is not None else 1
+        self.batch_window = batch_window_ms / 1000.0
+        self.admission = admission
+        self.num_workers = num_workers
+        self.max_size = max_size
+        self.result_ttl = result_ttl
+        self.jobs = {}
+        self.inflight = {}  # dedup key -> unfinished job
+        self.pending = deque()
+        self.forming = []  # Batches collecting compatible jobs during the batch window
+        self.running = 0
+        self.condition = threading.Condition()
+        self.workers = []
+        self.stopped = False
+
+    def start(self):
+        """Start the worker threads"""
+        with self.condition:
+            if self.workers:
+                return
+            self.stopped = False
+            for index in range(self.num_workers):
+                worker = threading.Thread(
+                    target=self._worker_loop, name=f"generation-worker-{index}", daemon=True
+                )
+                worker.start()
+                self.workers.append(worker)
+        logger.info(f"Job queue started with {self.num_workers} worker(s)")
+
+    def stop(self):
+        """Signal the worker threads to exit once idle"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        for worker in self.workers:
+            worker.join(timeout=5)
+        self.workers = []
+
+    def submit(self, params, dedup_key=None):
+        """
+        Add a job to the queue
+
+        Args:
+            params: Job parameters passed to the handler
+            dedup_key: Optional key; while a job with the same key is queued or
+                running, that job is returned instead of queueing a duplicate
+                and counts one more subscriber
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            QueueFullError: If the queue is at capacity
+        """
+        with self.condition:
+            self._expire_finished()
+            if dedup_key is not None and dedup_key in self.inflight:
+                job = self.inflight[dedup_key]
+                job.subscribers += 1
+                logger.info(f"Joined in-flight job {job.id} ({job.subscribers} subscribers)")
+                return job
+            if len(self.pending) >= self.max_size:
+                raise QueueFullError("Generation queue is full")
+            job = Job(params)
+            job.dedup_key = dedup_key
+            self.jobs[job.id] = job
+            if dedup_key is not None:
+                self.inflight[dedup_key] = job
+            self.pending.append(job)
+            # Wake every worker: one may be filling a batch this job belongs to
+            self.condition.notify_all()
+        logger.info(f"Queued job {job.id} (pending: {len(self.pending)})")
+        return job
+
+    def add_completed(self, params, result):
+        """Register an already-finished job, e.g. one served from a cache"""
+        job = Job(params)
+        job.result = result
+        job.status = "completed"
+        job.started_at = job.finished_at = time.time()
+        job.done.set()
+        with self.condition:
+            self._expire_finished()
+            self.jobs[job.id] = job
+        return job
+
+    def cancel(self, job_id):
+        """
+        Cancel a job: queued jobs are dropped, running jobs stop at the next step
+
+        A job shared by deduplicated submissions is only cancelled once every
+        subscriber has cancelled it; until then each call drops one subscriber.
+
+        Returns:
+            Job: The job, or None if unknown
+        """
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            if job.subscribers > 1:
+                job.subscribers -= 1
+                logger.info(f"Subscriber left job {job.id} ({job.subscribers} remaining)")
+                return job
+            job.cancel_requested = True
+            if job.status == "queued":
+                self._unqueue(job)
+                job.status = "cancelled"
+                job.finished_at = time.time()
+                if job.dedup_key is not None:
+                    self.inflight.pop(job.dedup_key, None)
+                job.done.set()
+        logger.info(f"Cancellation requested for job {job.id}")
+        job.touch()
+        return job
+
+    def get(self, job_id):
+        """Get a job by id, or None if unknown or expired"""
+        with self.condition:
+            return self.jobs.get(job_id)
+
+    def wait(self, job_id, timeout):
+        """
+        Block until a job finishes or the timeout elapses
+
+        Returns:
+            Job: The job (possibly still unfinished), or None if unknown
+        """
+        job = self.get(job_id)
+        if job is not None and timeout > 0:
+            job.done.wait(timeout)
+        return job
+
+    def position(self, job):
+        """1-based position of a queued job, or None if it is not pending"""
+        with self.condition:
+            for index, waiting_job in enumerate(self._waiting()):
+                if waiting_job is job:
+                    return index + 1
+        return None
+
+    def waiting_params(self):
+        """Params of the jobs still waiting to run, in the order they will be taken"""
+        with self.condition:
+            return [job.params for job in self._waiting()]
+
+    def describe(self, job):
+        """Serialize a job including its current queue position"""
+        return job.to_dict(queue_position=self.position(job))
+
+    def stats(self):
+        """Get queue statistics"""
+        with self.condition:
+            return {
+                "pending": len(self.pending),
+                "running": self.running,
+                "max_size": self.max_size,
+                "workers": self.num_workers,
+            }
+
+    def _worker_loop(self):
+        while True:
+            with self.condition:
+                while True:
+                    while not self.pending and not self.stopped:
+                        self.condition.wait()
+                    if self.stopped:
+                        return
+                    batch = self._take_batch()
+                    if not batch:
+                        # Every job was cancelled during the batch window
+                        continue
+                    admitted = self._admit(batch)
+                    if admitted is not None:
+                        break
+                    # Over the memory budget: back to the front of the queue
+                    # until a running batch releases its reservation
+                    self.pending.extendleft(reversed(batch))
+                    self.condition.wait()
+                batch, reservation = admitted
+                for job in batch:
+                    job.status = "running"
+                    job.started_at = time.time()
+                self.running += len(batch)
+            for job in batch:
+                job.touch()
+
+            try:
+                results = self.handler([job.params for job in batch], BatchProgress(batch))
+            except Exception as e:
+                logger.error(f"Error running batch of {len(batch)} job(s): {e}")
+                results = [{"success": False, "error": str(e)} for _ in batch]
+            if len(results) != len(batch):
+                # zip() would silently leave the jobs without a result running forever
+                logger.error(f"Handler returned {len(results)} result(s) for a batch of {len(batch)} job(s)")
+                results = list(results[:len(batch)])
+                results.extend({"success": False, "error": "No result returned for this job"}
+                               for _ in range(len(batch) - len(results)))
+
+            for job, result in zip(batch, results):
+                if result.get("success"):
+                    job.result = result
+                    job.status = "completed"
+                elif result.get("cancelled"):
+                    job.status = "cancelled"
+                else:
+                    job.error = result.get("error", "Failed to generate image")
+                    job.status = "failed"
+                job.finished_at = time.time()
+
+            with self.condition:
+                self.running -= len(batch)
+                for job in batch:
+                    if job.dedup_key is not None:
+                        self.inflight.pop(job.dedup_key, None)
+                if reservation is not None:
+                    self.admission.release(reservation, results)
+                    self.condition.notify_all()
+            for job in batch:
+                job.done.set()
+                job.touch()
+
+    def _admit(self, batch):
+        """
+        Reserve memory for as much of a batch as fits (caller holds the lock)
+
+        Jobs that do not fit go back to the front of the queue; a job admitted
+        only with sliced attention gets params["sliced"] set.
+
+        Returns:
+            tuple: (admitted jobs, Reservation or None), or None if nothing fits yet
+        """
+        if self.admission is None:
+            return batch, None
+        count, sliced, reservation = self.admission.admit([job.params for job in batch])
+        if reservation is None:
+            return None
+        self.pending.extendleft(reversed(batch[count:]))
+        if sliced:
+            batch[0].params["sliced"] = True
+        return batch[:count], reservation
+
+    def _take_batch(self):
+        """
+        Pop the oldest job plus compatible pending jobs (caller holds the lock)
+
+        Waits up to the batch window for more compatible jobs to arrive, so
+        bursts of similar requests share a single pipeline call. The batch may
+        come back empty if all its jobs were cancelled while it was forming.
+        """
+        batch = [self.pending.popleft()]
+        if self.max_batch_size <= 1:
+            return batch
+
+        key = self.batch_key(batch[0].params)
+        deadline = time.time() + self.batch_window
+        # Jobs in a forming batch are still queued: cancel() must find them here
+        self.forming.append(batch)
+        try:
+            while True:
+                for job in list(self.pending):
+                    if len(batch) >= self.max_batch_size:
+                        break
+                    if self.batch_key(job.params) == key:
+                        self.pending.remove(job)
+                        batch.append(job)
+
+                remaining = deadline - time.time()
+                if len(batch) >= self.max_batch_size or remaining <= 0 or self.stopped:
+                    return batch
+                self.condition.wait(remaining)
+        finally:
+            self.forming = [forming for forming in self.forming if forming is not batch]
+
+    def _waiting(self):
+        """Queued jobs in run order (caller holds the lock)"""
+        # Jobs in a batch that is still forming run before anything pending
+        waiting = [job for batch in self.forming for job in batch]
+        waiting.extend(self.pending)
+        return waiting
+
+    def _unqueue(self, job):
+        """Remove a queued job from the pending queue or a forming batch (caller holds the lock)"""
+        if job in self.pending:
+            self.pending.remove(job)
+            return
+        for batch in self.forming:
+            if job in batch:
+                batch.remove(job)
+                return
+
+    def _expire_finished(self):
+        """Drop finished jobs older than the result TTL (caller holds the lock)"""
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
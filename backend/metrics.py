@@ -0,0 +1,178 @@
+"""
+Stage latency histograms and event counters exposed in Prometheus text format
+
+With METRICS_ENABLED off, the module-level helpers are bound to no-ops and
+timer() returns one shared null context, so instrumented code pays only a
+function call.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import nullcontext
+from config import *
+
+METRIC_PREFIX = "speech_to_image"
+
+# Stage latency buckets in seconds, spanning fast encodes to cold model loads
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+HELP = {
+    "stage_duration_seconds": "Time spent in each request-handling stage",
+    "cache_lookups_total": "Cache lookups by cache and outcome",
+    "requests_rejected_total": "Requests rejected by rate limiting or load shedding",
+    "model_swaps_total": "Image models loaded into or evicted from memory",
+    "model_component_loads_total": "Pipeline components loaded from disk or shared with a loaded style",
+    "style_routes_total": "Prompts routed to each style, by routing method",
+    "admission_decisions_total": "Generation batches admitted, split, sliced or held back by the memory budget",
+}
+
+
+class _Timer:
+    """Context manager observing its elapsed time into a histogram"""
+
+    __slots__ = ("registry", "name", "labels", "start")
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        Initialize an empty registry
+
+        Args:
+            buckets: Upper bounds of the histogram buckets (+Inf is implicit)
+        """
+        self.buckets = buckets
+        self.histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self.counters = {}  # (name, labels) -> value
+        self.lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        """Record one observation in a histogram"""
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(self.buckets) + 2)
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def timer(self, name, **labels):
+        """Context manager timing a block into a histogram"""
+        return _Timer(self, name, labels)
+
+    def increment(self, name, amount=1, **labels):
+        """Increase a counter"""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def drain(self):
+        """
+        Take everything recorded since the last drain and reset it
+
+        Inference workers ship this to the parent process, which merges it
+        into the registry that /metrics reports.
+        """
+        with self.lock:
+            delta = {"histograms": self.histograms, "counters": self.counters}
+            self.histograms = {}
+            self.counters = {}
+        return delta
+
+    def merge(self, delta):
+        """Add a drained delta from another process"""
+        with self.lock:
+            for key, values in delta["histograms"].items():
+                histogram = self.histograms.setdefault(key, [0] * len(values))
+                for index, value in enumerate(values):
+                    histogram[index] += value
+            for key, value in delta["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format"""
+        with self.lock:
+            histograms = {key: list(values) for key, values in self.histograms.items()}
+            counters = dict(self.counters)
+
+        lines = []
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} histogram")
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), values[:-1]):
+                    cumulative += count
+                    lines.append(f"{METRIC_PREFIX}_{name}_bucket"
+                                 f"{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{METRIC_PREFIX}_{name}_sum{_format_labels(labels)} {values[-1]}")
+                lines.append(f"{METRIC_PREFIX}_{name}_count{_format_labels(labels)} {cumulative}")
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{METRIC_PREFIX}_{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class NullRegistry:
+    """Registry used when metrics are disabled; records nothing"""
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def timer(self, name, **labels):
+        return _NULL_TIMER
+
+    def increment(self, name, amount=1, **labels):
+        pass
+
+    def drain(self):
+        return None
+
+    def merge(self, delta):
+        pass
+
+    def render(self):
+        return ""
+
+
+_NULL_TIMER = nullcontext()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+registry = MetricsRegistry() if METRICS_ENABLED else NullRegistry()
+enabled = METRICS_ENABLED
+
+observe = registry.observe
+timer = registry.timer
+increment = registry.increment
+
+
+def stage(name):
+    """Time a request-handling stage, e.g. ``with metrics.stage("audio_decode"):``"""
+    return registry.timer("stage_duration_seconds", stage=name) if enabled else _NULL_TIMER
@@ -0,0 +1,93 @@
+"""
+Background sampler recording system and queue metrics into a ring buffer
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+import psutil
+from config import *
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsSampler:
+    def __init__(self, memory_source, queue_source, interval=METRICS_SAMPLE_INTERVAL,
+                 history_size=METRICS_HISTORY_SIZE):
+        """
+        Initialize the sampler (sampling starts with start())
+
+        Args:
+            memory_source: Callable returning the inference backend's memory usage dict
+            queue_source: Callable returning the job queue's stats dict
+            interval: Seconds between samples
+            history_size: Number of samples kept; older samples are overwritten
+        """
+        self.memory_source = memory_source
+        self.queue_source = queue_source
+        self.interval = interval
+        self.samples = deque(maxlen=history_size)
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """Take a first sample and keep sampling on a background thread"""
+        if self.thread is not None:
+            return
+        # Prime cpu_percent so later non-blocking calls measure since this point
+        psutil.cpu_percent(interval=None)
+        self._record()
+        self.thread = threading.Thread(target=self._run, name="metrics-sampler", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self._record()
+
+    def _record(self):
+        try:
+            sample = self._sample()
+        except Exception as e:
+            logger.error(f"Error sampling metrics: {e}")
+            return
+        with self.lock:
+            self.samples.append(sample)
+
+    def _sample(self):
+        memory = psutil.virtual_memory()
+        image_memory = self.memory_source()
+        queue_stats = self.queue_source()
+        return {
+            "timestamp": time.time(),
+            # CPU usage averaged since the previous sample, without blocking
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "memory_percent": memory.percent,
+            "disk_percent": psutil.disk_usage('/').percent,
+            "memory_usage_mb": image_memory["cpu_memory_mb"],
+            "gpu_memory_mb": image_memory["gpu_memory_mb"],
+            "queue_pending": queue_stats["pending"],
+            "queue_running": queue_stats["running"],
+        }
+
+    def latest(self):
+        """Most recent sample, or None before the first one"""
+        with self.lock:
+            return self.samples[-1] if self.samples else None
+
+    def history(self, since=None):
+        """
+        Get recorded samples as parallel time series
+
+        Args:
+            since: Only include samples taken after this Unix timestamp
+
+        Returns:
+            dict: Metric name -> list of values, aligned with "timestamp"
+        """
+        with self.lock:
+            samples = [sample for sample in self.samples
+                       if since is None or sample["timestamp"] > since]
+        keys = samples[0].keys() if samples else ["timestamp"]
+        return {key: [sample[key] for sample in samples] for key in keys}
@@ -1,11 +1,22 @@
 from diffusers import StableDiffusionPipeline
 import torch
-import os
 import gc
-from config import MODEL_PATHS
+from config import MODEL_PATHS, NEGATIVE_PROMPT
+from embedding_cache import EmbeddingCache
+from component_registry import registry
+import cpu_backend
 
-def load_model(selected_style):
-    device = "cuda" if torch.cuda.is_available() else "cpu"
+def load_model(selected_style, device=None):
+    """
+    Load a style's pipeline
+    
+    Args:
+        selected_style: Key of MODEL_PATHS
+        device: Where to place it; "cpu" loads a GPU pipeline into RAM for
+            later promotion (defaults to the inference device)
+    """
+    inference_device = "cuda" if torch.cuda.is_available() else "cpu"
+    device = device or inference_device
     print(f"🔄 Loading {selected_style} model from local path...")
     print(f"📂 Path: {MODEL_PATHS[selected_style]}")
     
@@ -14,25 +25,36 @@ def load_model(selected_style):
     if torch.cuda.is_available():
         torch.cuda.empty_cache()
     
-    # Load with memory optimizations
-    pipe = StableDiffusionPipeline.from_pretrained(
-        MODEL_PATHS[selected_style],
-        torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+    # Components shared with an already-loaded style (same weight hash) are
+    # reused; the rest are memory-mapped from their safetensors files
+    pipe = StableDiffusionPipeline(
+        **registry.acquire(selected_style, inference_device,
+                           torch.float16 if inference_device == "cuda" else torch.float32),
         safety_checker=None,
-        requires_safety_checker=False,
-        low_cpu_mem_usage=True,  # Reduce CPU memory usage during loading
-        variant="fp16" if device == "cuda" else None  # Use fp16 variant for GPU
+        feature_extractor=None,
+        requires_safety_checker=False
     )
     
-    pipe = pipe.to(device)
-    
-    # Enable memory optimizations (use only compatible ones)
-    pipe.enable_attention_slicing()
+    # Freshly loaded components are in RAM; shared ones stay where they are
+    if device != "cpu":
+        pipe = pipe.to(device)
     
-    # Additional optimizations for lower memory usage
-    if device == "cuda":
+    if inference_device == "cuda":
+        # Enable memory optimizations (use only compatible ones)
+        pipe.enable_attention_slicing()
+        pipe.default_attention_slice = "auto"
         pipe.enable_vae_slicing()  # Slice VAE for lower memory usage
         # Don't use CPU offload as it causes meta tensor issues
+    else:
+        # On CPU slicing only costs speed; admission control slices batches
+        # when memory is short
+        pipe.default_attention_slice = None
+        fingerprints = {name: key[3] for name, key in registry.component_keys(selected_style, "cpu").items()}
+        pipe = cpu_backend.backend.optimize(pipe, selected_style, fingerprints)
+    
+    # Cache text embeddings per model; the constant negative prompt is encoded once here
+    pipe.embedding_cache = EmbeddingCache(pipe)
+    pipe.embedding_cache.pin(NEGATIVE_PROMPT)
     
     print(f"✅ {selected_style.upper()} model loaded successfully!")
     if device == "cuda":
@@ -41,12 +63,26 @@ def load_model(selected_style):
     
     return pipe
 
-def unload_model(pipe):
-    """Safely unload a model to free memory"""
+def estimate_bytes(selected_style):
+    """Expected memory footprint of a style that has not been loaded yet"""
+    return registry.weight_bytes(selected_style, "cuda" if torch.cuda.is_available() else "cpu")
+
+def component_keys(selected_style):
+    """Registry keys of a style's components, to keep across unload_model"""
+    return registry.keys_for(selected_style, "cuda" if torch.cuda.is_available() else "cpu")
+
+def unload_model(pipe, selected_style, keep=()):
+    """
+    Safely unload a model to free memory
+    
+    Components shared with another loaded style, or listed in keep (e.g. the
+    component_keys of the style about to load), stay resident.
+    """
     if pipe is not None:
         try:
-            # Move to CPU first
-            pipe = pipe.to("cpu")
+            # Components still in use elsewhere stay on their device
+            registry.release(selected_style, keep=keep)
+            cpu_backend.backend.retain(set(registry.components))
             # Delete the pipeline
             del pipe
             # Force garbage collection
@@ -59,4 +95,4 @@ def unload_model(pipe):
 
 # Example usage:
 # pipe = load_model("dreamshaper")
-# unload_model(pipe) 
\ No newline at end of file
+# unload_model(pipe, "dreamshaper") 
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""
+Background model preloading and warm-up for readiness checks
+"""
+
+import logging
+import threading
+import time
+from config import *
+
+logger = logging.getLogger(__name__)
+
+
+class ModelPreloader:
+    def __init__(self, image_service, speech_service, image_models=PRELOAD_MODELS,
+                 preload_speech=PRELOAD_SPEECH_MODEL):
+        """
+        Initialize the preloader
+
+        Args:
+            image_service: ImageService whose models should be warmed
+            speech_service: SpeechService whose Whisper model should be warmed
+            image_models: Image model styles to load and warm at startup
+            preload_speech: Whether to load and warm the Whisper model
+        """
+        self.image_service = image_service
+        self.speech_service = speech_service
+        self.targets = [f"image:{style}" for style in image_models]
+        if preload_speech:
+            self.targets.append("speech:whisper")
+        self.state = {target: "pending" for target in self.targets}
+        self.errors = {}
+        self.started_at = None
+        self.finished_at = None
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """Start loading and warming models on a background thread"""
+        if self.thread is not None:
+            return
+        self.started_at = time.time()
+        self.thread = threading.Thread(target=self._run, name="model-preloader", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        for target in self.targets:
+            kind, name = target.split(":", 1)
+            self._set_state(target, "loading")
+            start_time = time.time()
+            try:
+                if kind == "image":
+                    self.image_service.warmup(name)
+                else:
+                    self.speech_service.warmup()
+                self._set_state(target, "warm")
+                logger.info(f"Preloaded {target} in {time.time() - start_time:.2f}s")
+            except Exception as e:
+                logger.error(f"Error preloading {target}: {e}")
+                with self.lock:
+                    self.errors[target] = str(e)
+                self._set_state(target, "failed")
+        self.finished_at = time.time()
+
+    def _set_state(self, target, state):
+        with self.lock:
+            self.state[target] = state
+
+    def is_ready(self):
+        """True once every configured model has been loaded and warmed"""
+        with self.lock:
+            return all(state == "warm" for state in self.state.values())
+
+    def status(self):
+        """Get per-model preload state"""
+        with self.lock:
+            return {
+                "ready": all(state == "warm" for state in self.state.values()),
+                "models": dict(self.state),
+                "errors": dict(self.errors),
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
@@ -0,0 +1,215 @@
+"""
+Named quality tiers and tier selection from live step timings
+
+Each tier in QUALITY_TIERS fixes a scheduler, a step count and a guidance
+scale. With LCM-LoRA weights at LCM_LORA_PATH, "draft" runs a few LCM steps
+without classifier-free guidance instead. TierPlanner learns seconds per
+denoising step from finished generations and picks the best tier whose
+predicted generation time fits a client's latency budget.
+"""
+
+import os
+import logging
+import threading
+import importlib.util
+import torch
+from diffusers import DPMSolverMultistepScheduler, EulerAncestralDiscreteScheduler, LCMScheduler
+from config import *
+import cpu_backend
+
+logger = logging.getLogger(__name__)
+
+SCHEDULERS = {
+    "dpmpp_2m": (DPMSolverMultistepScheduler, {"algorithm_type": "dpmsolver++", "solver_order": 2}),
+    "dpmpp_2m_karras": (DPMSolverMultistepScheduler,
+                        {"algorithm_type": "dpmsolver++", "solver_order": 2, "use_karras_sigmas": True}),
+    "euler_a": (EulerAncestralDiscreteScheduler, {}),
+    "lcm": (LCMScheduler, {}),
+}
+
+LCM_ADAPTER = "lcm"
+
+
+def lcm_available():
+    """Whether LCM-LoRA weights are present and can be applied to this deployment's UNets"""
+    if not os.path.exists(LCM_LORA_PATH) or importlib.util.find_spec("peft") is None:
+        return False
+    # Exported and compiled CPU UNets cannot take LoRA adapters; "auto" runs
+    # eagerly when no exported runtime is installed
+    return torch.cuda.is_available() or cpu_backend.backend.name == "eager"
+
+
+def resolve_tier(name):
+    """
+    Get the generation settings of a tier
+
+    Returns:
+        dict: quality, scheduler, steps and guidance_scale
+    """
+    settings = dict(QUALITY_TIERS[name])
+    if name == "draft" and lcm_available():
+        settings.update(LCM_DRAFT_SETTINGS)
+    return {"quality": name, **settings}
+
+
+def apply_scheduler(pipe, scheduler):
+    """
+    Switch a pipeline to a scheduler for the next call (caller holds the generation lock)
+
+    Schedulers are built once per pipeline from the configuration the model
+    ships with; None restores that original scheduler. "lcm" also enables
+    the LCM-LoRA adapter, which every other scheduler disables.
+
+    Args:
+        pipe: Pipeline from model_loader
+        scheduler: Key of SCHEDULERS, or None
+    """
+    if not hasattr(pipe, "tier_schedulers"):
+        pipe.tier_schedulers = {None: pipe.scheduler}
+    if scheduler not in pipe.tier_schedulers:
+        cls, options = SCHEDULERS[scheduler]
+        pipe.tier_schedulers[scheduler] = cls.from_config(pipe.tier_schedulers[None].config, **options)
+    pipe.scheduler = pipe.tier_schedulers[scheduler]
+
+    # The adapter lives on the UNet, which styles with the same weights share
+    if scheduler == LCM_ADAPTER and not getattr(pipe.unet, "lcm_lora_loaded", False):
+        pipe.load_lora_weights(LCM_LORA_PATH, adapter_name=LCM_ADAPTER)
+        pipe.unet.lcm_lora_loaded = True
+        logger.info("Loaded LCM-LoRA weights")
+    if getattr(pipe.unet, "lcm_lora_loaded", False):
+        if scheduler == LCM_ADAPTER:
+            pipe.enable_lora()
+            pipe.set_adapters([LCM_ADAPTER])
+        else:
+            pipe.disable_lora()
+
+
+class TierPlanner:
+    def __init__(self, smoothing=TIER_TIMING_SMOOTHING, default_tier=DEFAULT_QUALITY_TIER):
+        """
+        Initialize the planner with no measurements
+
+        Args:
+            smoothing: Weight of the newest generation in the moving averages
+            default_tier: Tier chosen before anything has been measured
+        """
+        self.smoothing = smoothing
+        self.default_tier = default_tier
+        self.step_seconds = {}  # (style, size, guided, batch size) -> seconds per denoising step
+        self.overhead_seconds = {}  # (style, size, batch size) -> seconds outside the denoising loop
+        self.lock = threading.Lock()
+
+    def _average(self, table, key, value):
+        previous = table.get(key)
+        table[key] = value if previous is None else (1 - self.smoothing) * previous + self.smoothing * value
+
+    def observe(self, style, size, guidance_scale, steps, batch_size, denoise_seconds, total_seconds):
+        """Record the timings of a finished generation call of batch_size images"""
+        if steps <= 0 or batch_size <= 0:
+            return
+        with self.lock:
+            self._average(self.step_seconds, (style, size, guidance_scale > 1, batch_size), denoise_seconds / steps)
+            self._average(self.overhead_seconds, (style, size, batch_size), max(total_seconds - denoise_seconds, 0.0))
+
+    @staticmethod
+    def _scaled(table, prefix, batch_size):
+        """
+        Timing for a batch size from the nearest measured one (caller holds the lock)
+
+        Batched calls cost roughly in proportion to their size, so a timing
+        measured at another batch size is scaled linearly.
+        """
+        measured = [key[-1] for key in table if key[:-1] == prefix]
+        if not measured:
+            return None
+        nearest = min(measured, key=lambda measured_size: (abs(measured_size - batch_size), measured_size))
+        return table[prefix + (nearest,)] * batch_size / nearest
+
+    def predict(self, style, size, tier, batch_size=1):
+        """
+        Predict how long a tier takes for a style and size
+
+        Args:
+            batch_size: Images generated together in one call
+
+        Returns:
+            float: Seconds, or None if nothing comparable has been measured
+        """
+        settings = resolve_tier(tier)
+        guided = settings["guidance_scale"] > 1
+        with self.lock:
+            step = self._scaled(self.step_seconds, (style, size, guided), batch_size)
+            if step is None:
+                # Guidance doubles the UNet batch, so the other mode is half or twice as fast
+                other = self._scaled(self.step_seconds, (style, size, not guided), batch_size)
+                if other is None:
+                    return None
+                step = other * 2 if guided else other / 2
+            overhead = self._scaled(self.overhead_seconds, (style, size), batch_size) or 0.0
+            return settings["steps"] * step + overhead
+
+    def estimate_wait(self, queued_params, workers, max_batch_size=MAX_BATCH_SIZE):
+        """
+        Estimate how long a new job waits for the jobs queued ahead of it
+
+        Queued jobs are grouped the way the queue batches them (same style,
+        size and tier, up to max_batch_size) and the predicted batch times
+        are spread over the workers. Batches with nothing comparable measured
+        yet count as free, and running batches are not counted.
+
+        Args:
+            queued_params: Params of the jobs waiting in the queue
+            workers: Workers draining the queue
+
+        Returns:
+            float: Seconds
+        """
+        groups = {}
+        for params in queued_params:
+            key = (params["style"], params["size"], params["quality"])
+            groups[key] = groups.get(key, 0) + 1
+        total = 0.0
+        for (style, size, tier), count in groups.items():
+            full_batches, remainder = divmod(count, max_batch_size)
+            for batch_size, batches in ((max_batch_size, full_batches), (remainder, 1)):
+                if batch_size and batches:
+                    total += batches * (self.predict(style, size, tier, batch_size) or 0.0)
+        return total / max(workers, 1)
+
+    def choose(self, style, size, latency_budget, queue_wait=0.0):
+        """
+        Pick the best tier predicted to finish within a latency budget
+
+        Falls back to the fastest tier when none fits, and to the default tier
+        while nothing has been measured for this style and size.
+
+        Args:
+            queue_wait: Seconds the job is expected to wait before it runs (see estimate_wait)
+
+        Returns:
+            tuple: (tier name, predicted seconds until the result or None)
+        """
+        tiers = list(QUALITY_TIERS)
+        predictions = {tier: self.predict(style, size, tier) for tier in tiers}
+        if all(prediction is None for prediction in predictions.values()):
+            return self.default_tier, None
+        predictions = {tier: None if prediction is None else prediction + queue_wait
+                       for tier, prediction in predictions.items()}
+        for tier in reversed(tiers):
+            if predictions[tier] is not None and predictions[tier] <= latency_budget:
+                return tier, predictions[tier]
+        return tiers[0], predictions[tiers[0]]
+
+    def stats(self):
+        """Get the resolved tiers and the measured step timings"""
+        with self.lock:
+            return {
+                "tiers": {tier: resolve_tier(tier) for tier in QUALITY_TIERS},
+                "lcm_available": lcm_available(),
+                "step_seconds": {
+                    f"{style}/{size}/{'guided' if guided else 'unguided'}/x{batch_size}": round(seconds, 4)
+                    for (style, size, guided, batch_size), seconds in self.step_seconds.items()
+                },
+                "overhead_seconds": {f"{style}/{size}/x{batch_size}": round(seconds, 4)
+                                     for (style, size, batch_size), seconds in self.overhead_seconds.items()},
+            }
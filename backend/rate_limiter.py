@@ -0,0 +1,168 @@
+"""
+Per-client, per-endpoint token-bucket rate limiting with pluggable storage
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import *
+
+logger = logging.getLogger(__name__)
+
+
+def _refill(tokens, updated, capacity, refill_rate, now):
+    """Tokens in a bucket after refilling from its last update until now"""
+    return min(capacity, tokens + (now - updated) * refill_rate)
+
+
+class MemoryStore:
+    """Token buckets held in this process, guarded by a lock"""
+
+    def __init__(self):
+        self.buckets = OrderedDict()  # key -> (tokens, updated, idle seconds until full), least recent first
+        self.lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, now):
+        """
+        Take one token from a bucket
+
+        Returns:
+            tuple: (allowed, seconds until a token is available)
+        """
+        with self.lock:
+            tokens, updated, _ = self.buckets.pop(key, (capacity, now, 0))
+            tokens = _refill(tokens, updated, capacity, refill_rate, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now, (capacity - tokens) / refill_rate)
+            self._expire(now)
+        return allowed, 0.0 if allowed else (1 - tokens) / refill_rate
+
+    def _expire(self, now):
+        """
+        Lazily drop buckets that have refilled completely (caller holds the lock)
+
+        A full bucket behaves exactly like a missing one, so forgetting it is
+        free. Only the two least recently used buckets are examined per call,
+        which keeps the cost O(1) while still draining idle clients.
+        """
+        for _ in range(2):
+            if not self.buckets:
+                return
+            key, (_, updated, idle_until_full) = next(iter(self.buckets.items()))
+            if now - updated < idle_until_full:
+                return
+            del self.buckets[key]
+
+    def size(self):
+        with self.lock:
+            return len(self.buckets)
+
+
+class SQLiteStore:
+    """Token buckets in a local SQLite database shared by every worker process"""
+
+    def __init__(self, path=RATE_LIMIT_DB_PATH):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS buckets_full_at ON buckets (full_at)")
+
+    def _connection(self):
+        """One connection per thread; WAL lets processes read while one writes"""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def consume(self, key, capacity, refill_rate, now):
+        """
+        Take one token from a bucket atomically across processes
+
+        Returns:
+            tuple: (allowed, seconds until a token is available)
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens = capacity if row is None else _refill(row[0], row[1], capacity, refill_rate, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            full_at = now + (capacity - tokens) / refill_rate
+            connection.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, full_at)
+            )
+            # Lazily drop a few buckets that have refilled completely
+            connection.execute(
+                "DELETE FROM buckets WHERE key IN "
+                "(SELECT key FROM buckets WHERE full_at <= ? LIMIT 2)", (now,)
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return allowed, 0.0 if allowed else (1 - tokens) / refill_rate
+
+    def size(self):
+        return self._connection().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+
+
+class RateLimiter:
+    def __init__(self, store=None, limits=RATE_LIMITS):
+        """
+        Initialize the rate limiter
+
+        Args:
+            store: Bucket storage backend (defaults to RATE_LIMIT_BACKEND)
+            limits: Mapping of endpoint name to (burst capacity, tokens refilled per second)
+        """
+        if store is None:
+            store = SQLiteStore() if RATE_LIMIT_BACKEND == "sqlite" else MemoryStore()
+        self.store = store
+        self.limits = limits
+        self.rejections = 0
+
+    def check(self, client_id, endpoint):
+        """
+        Consume a token for a client on an endpoint
+
+        Returns:
+            tuple: (allowed, retry_after_seconds)
+        """
+        capacity, refill_rate = self.limits[endpoint]
+        try:
+            allowed, retry_after = self.store.consume(f"{endpoint}:{client_id}", capacity, refill_rate, time.time())
+        except sqlite3.Error as e:
+            # Never fail a request because the limiter's store is unavailable
+            logger.error(f"Rate limiter store error: {e}")
+            return True, 0.0
+        if not allowed:
+            self.rejections += 1
+        return allowed, retry_after
+
+    def stats(self):
+        """Get rate limiter statistics"""
+        return {
+            "backend": type(self.store).__name__,
+            "tracked_buckets": self.store.size(),
+            "rejections": self.rejections,
+            "limits": {endpoint: {"burst": capacity, "per_minute": refill_rate * 60}
+                       for endpoint, (capacity, refill_rate) in self.limits.items()},
+        }
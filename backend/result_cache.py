@@ -0,0 +1,177 @@
+"""
+Content-addressed, disk-backed LRU cache of generated images
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from config import *
+from image_encoder import IMAGE_EXTENSIONS
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(prompt, negative_prompt, style, steps, guidance_scale, size, seed, output_format=None,
+                   scheduler=None, refine=False):
+    """Hash every input that affects the generated file into a cache key"""
+    fields = {
+        "format": output_format,
+        "prompt": prompt,
+        "negative_prompt": negative_prompt,
+        "style": style,
+        "steps": steps,
+        "guidance_scale": guidance_scale,
+        "size": size,
+        "seed": seed,
+    }
+    if scheduler is not None:
+        # Keys (and derived seeds) of the model's own scheduler stay as they were
+        fields["scheduler"] = scheduler
+    if refine:
+        fields["refine"] = True
+    payload = json.dumps(fields, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def seed_from_key(prompt, negative_prompt, style, steps, guidance_scale, size):
+    """Derive a stable seed for requests that did not supply one"""
+    key = make_cache_key(prompt, negative_prompt, style, steps, guidance_scale, size, None)
+    return int(key[:8], 16) & 0x7FFFFFFF
+
+
+class ResultCache:
+    def __init__(self, cache_dir=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES):
+        """
+        Initialize the cache and index any entries already on disk
+
+        Args:
+            cache_dir: Directory holding cached images and their metadata
+            max_bytes: Byte budget for cached images before LRU eviction
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (size in bytes, file extension), oldest first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _image_path(self, key, extension):
+        return os.path.join(self.cache_dir, f"{key}{extension}")
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_index(self):
+        """Rebuild the in-memory LRU order from the files on disk"""
+        found = []
+        for name in os.listdir(self.cache_dir):
+            key, extension = os.path.splitext(name)
+            if extension not in IMAGE_EXTENSIONS:
+                continue
+            if not os.path.exists(self._meta_path(key)):
+                continue
+            stat = os.stat(self._image_path(key, extension))
+            found.append((stat.st_mtime, key, stat.st_size, extension))
+
+        for _, key, size, extension in sorted(found):
+            self.entries[key] = (size, extension)
+            self.total_bytes += size
+        if found:
+            logger.info(f"Result cache loaded {len(found)} entries ({self.total_bytes / 1024 / 1024:.1f} MB)")
+
+    def get(self, key, dest_dir, filename):
+        """
+        Look up a cached result and materialize it as a new image file
+
+        Args:
+            key: Cache key from make_cache_key
+            dest_dir: Directory the image should be served from
+            filename: Filename to give the materialized image (the extension of the cached file is appended)
+
+        Returns:
+            dict: Cached metadata, or None on a miss
+        """
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                metrics.increment("cache_lookups_total", cache="result", result="miss")
+                return None
+            self.entries.move_to_end(key)
+            extension = self.entries[key][1]
+            self.hits += 1
+        metrics.increment("cache_lookups_total", cache="result", result="hit")
+
+        try:
+            with open(self._meta_path(key), "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+            image_path = self._image_path(key, extension)
+            metadata["filename"] = filename + extension
+            dest_path = os.path.join(dest_dir, metadata["filename"])
+            try:
+                os.link(image_path, dest_path)
+            except OSError:
+                shutil.copyfile(image_path, dest_path)
+            # Persist recency so the LRU order survives restarts
+            os.utime(image_path)
+            return metadata
+        except OSError as e:
+            logger.warning(f"Dropping unreadable cache entry {key}: {e}")
+            with self.lock:
+                self._remove(key)
+            return None
+
+    def put(self, key, image_path, metadata):
+        """Store a generated image and its metadata, evicting LRU entries over budget"""
+        try:
+            with self.lock:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    return
+
+            extension = os.path.splitext(image_path)[1]
+            cached_path = self._image_path(key, extension)
+            tmp_path = cached_path + ".tmp"
+            shutil.copyfile(image_path, tmp_path)
+            with open(self._meta_path(key), "w", encoding="utf-8") as f:
+                json.dump(metadata, f)
+            os.replace(tmp_path, cached_path)
+            size = os.path.getsize(cached_path)
+
+            with self.lock:
+                self.entries[key] = (size, extension)
+                self.total_bytes += size
+                while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                    oldest = next(iter(self.entries))
+                    self._remove(oldest)
+                    logger.info(f"Evicted cached result: {oldest}")
+        except OSError as e:
+            logger.error(f"Error writing result cache entry: {e}")
+
+    def _remove(self, key):
+        """Delete an entry from the index and disk (caller holds the lock)"""
+        size, extension = self.entries.pop(key, (0, ".png"))
+        self.total_bytes -= size
+        for path in (self._image_path(key, extension), self._meta_path(key)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def stats(self):
+        """Get cache statistics"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self.entries),
+                "size_mb": self.total_bytes / 1024 / 1024,
+                "max_size_mb": self.max_bytes / 1024 / 1024,
+            }
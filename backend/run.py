@@ -5,11 +5,14 @@ Startup script for the Speech-to-Image SaaS backend
 
 import os
 import sys
-from app import app, setup_logging
 from config import HOST, PORT, DEBUG_MODE, THREADED
 
 def main():
     """Main startup function"""
+    # Imported here rather than at module level: spawned inference workers
+    # re-import this entry script
+    from app import create_app, setup_logging
+    
     # Setup logging
     setup_logging()
     
@@ -29,6 +32,7 @@ def main():
     print(f"📝 Logs directory: {os.path.abspath('logs')}")
     
     # Start the server
+    app = create_app()
     app.run(
         host=host,
         port=port,
@@ -37,4 +41,5 @@ def main():
     )
 
 if __name__ == "__main__":
-    app.run(host=HOST, port=PORT, debug=DEBUG_MODE, threaded=THREADED) 
\ No newline at end of file
+    from app import create_app
+    create_app().run(host=HOST, port=PORT, debug=DEBUG_MODE, threaded=THREADED) 
\ No newline at end of file
@@ -3,32 +3,57 @@ Speech recognition service for handling audio processing and transcription
 """
 
 import whisper
-import os
-import tempfile
 import logging
+import threading
+import subprocess
 from pydub import AudioSegment
 import io
+from concurrent.futures import Future
 import numpy as np
+import torch
+from config import MAX_AUDIO_UPLOAD_MB, TRANSCRIPTION_CACHE_ENABLED
+from transcription_scheduler import TranscriptionScheduler
+from transcription_cache import TranscriptionCache, fingerprint_audio
+import metrics
 
 logger = logging.getLogger(__name__)
 
+class AudioTooLargeError(Exception):
+    """Raised when an upload exceeds the configured size limit"""
+
 class SpeechService:
     def __init__(self):
         """Initialize the speech service with Whisper model"""
         self.model = None
         self.model_loaded = False
+        self.load_lock = threading.Lock()
+        # Whisper installs per-call hooks on the model, so inference is serialized
+        self.inference_lock = threading.Lock()
+        # Concurrent requests are grouped into batched decoder calls
+        self.scheduler = TranscriptionScheduler(self.transcribe_batch)
+        self.cache = TranscriptionCache() if TRANSCRIPTION_CACHE_ENABLED else None
         
     def load_model(self, model_size="base"):
         """Load Whisper model (lazy loading)"""
-        if not self.model_loaded:
-            try:
-                logger.info(f"Loading Whisper model: {model_size}")
-                self.model = whisper.load_model(model_size)
-                self.model_loaded = True
-                logger.info("Whisper model loaded successfully")
-            except Exception as e:
-                logger.error(f"Error loading Whisper model: {e}")
-                raise
+        with self.load_lock:
+            if not self.model_loaded:
+                try:
+                    logger.info(f"Loading Whisper model: {model_size}")
+                    with metrics.stage("whisper_load"):
+                        self.model = whisper.load_model(model_size)
+                    self.model_loaded = True
+                    logger.info("Whisper model loaded successfully")
+                except Exception as e:
+                    logger.error(f"Error loading Whisper model: {e}")
+                    raise
+    
+    def warmup(self):
+        """Load the model and transcribe a second of silence to warm it up"""
+        self.load_model()
+        silence = np.zeros(whisper.audio.SAMPLE_RATE, dtype=np.float32)
+        with self.inference_lock:
+            self.model.transcribe(silence, fp16=self.model.device.type == "cuda")
+        logger.info("Whisper model warmed up")
     
     def process_audio(self, audio_data, audio_format="wav"):
         """
@@ -38,6 +63,124 @@ class SpeechService:
             audio_data: Raw audio data (bytes)
             audio_format: Audio format (wav, mp3, etc.)
             
+        Returns:
+            dict: Transcription result with text and confidence
+        """
+        try:
+            # Decode straight to samples in memory; no temp file on disk
+            audio = self.decode_audio(audio_data, audio_format)
+            return self.transcribe(audio)
+                    
+        except Exception as e:
+            logger.error(f"Error processing audio: {e}")
+            return {
+                "text": "",
+                "confidence": 0.0,
+                "language": "en",
+                "success": False,
+                "error": str(e)
+            }
+    
+    def transcribe(self, audio):
+        """Transcribe samples, serving repeats from the fingerprint cache"""
+        return self.submit(audio).result()
+    
+    def submit(self, audio):
+        """
+        Queue samples for batched transcription without blocking
+        
+        Args:
+            audio: 16 kHz mono float32 array
+            
+        Returns:
+            Future: Resolves to the transcription result dict; already done on a cache hit
+        """
+        if self.cache is None:
+            return self.scheduler.submit(audio)
+        
+        key = fingerprint_audio(audio)
+        cached = self.cache.get(key)
+        metrics.increment("cache_lookups_total", cache="transcription",
+                          result="miss" if cached is None else "hit")
+        if cached is not None:
+            cached["cached"] = True
+            future = Future()
+            future.set_result(cached)
+            return future
+        
+        future = self.scheduler.submit(audio)
+        
+        def store(done):
+            if done.exception() is None:
+                self.cache.put(key, done.result())
+        
+        future.add_done_callback(store)
+        return future
+    
+    def transcribe_batch(self, audios):
+        """
+        Transcribe several clips with one batched encoder/decoder pass
+        
+        Clips up to Whisper's 30 second window are padded into a single
+        log-mel batch. Longer clips, and clips whose greedy decode looks
+        unreliable, go through the full transcribe() path with its
+        temperature fallback.
+        
+        Args:
+            audios: List of 16 kHz mono float32 arrays
+            
+        Returns:
+            list: One transcription result dict per clip, in order
+        """
+        if not self.model_loaded:
+            self.load_model()
+        
+        results = [None] * len(audios)
+        batch_indexes = [index for index, audio in enumerate(audios)
+                         if len(audio) <= whisper.audio.N_SAMPLES]
+        
+        if batch_indexes:
+            try:
+                with self.inference_lock, metrics.stage("whisper_inference"):
+                    mels = torch.stack([
+                        whisper.log_mel_spectrogram(
+                            whisper.pad_or_trim(torch.from_numpy(audios[index])),
+                            n_mels=self.model.dims.n_mels
+                        )
+                        for index in batch_indexes
+                    ]).to(self.model.device)
+                    options = whisper.DecodingOptions(fp16=self.model.device.type == "cuda")
+                    decoded = whisper.decode(self.model, mels, options)
+                
+                for index, result in zip(batch_indexes, decoded):
+                    if result.no_speech_prob > 0.6 and result.avg_logprob < -1.0:
+                        text = ""
+                    elif result.compression_ratio > 2.4 or result.avg_logprob < -1.0:
+                        continue  # Retried below with temperature fallback
+                    else:
+                        text = result.text.strip()
+                    results[index] = {
+                        "text": text,
+                        "confidence": float(result.avg_logprob),
+                        "language": result.language,
+                        "success": True
+                    }
+            except Exception as e:
+                logger.error(f"Error in batched transcription, falling back per clip: {e}")
+        
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = self.transcribe_array(audios[index])
+        
+        return results
+    
+    def transcribe_array(self, audio):
+        """
+        Transcribe 16 kHz mono float32 samples
+        
+        Args:
+            audio: NumPy array of samples in [-1, 1] at whisper.audio.SAMPLE_RATE
+            
         Returns:
             dict: Transcription result with text and confidence
         """
@@ -46,39 +189,12 @@ class SpeechService:
             if not self.model_loaded:
                 self.load_model()
             
-            # Create temporary file for audio processing
-            with tempfile.NamedTemporaryFile(suffix=f".{audio_format}", delete=False) as temp_file:
-                temp_file.write(audio_data)
-                temp_file_path = temp_file.name
+            with self.inference_lock, metrics.stage("whisper_inference"):
+                result = self.model.transcribe(audio, fp16=self.model.device.type == "cuda")
+            return self._format_result(result)
             
-            try:
-                # Transcribe audio
-                result = self.model.transcribe(temp_file_path)
-                
-                # Extract text and confidence
-                text = result.get("text", "").strip()
-                language = result.get("language", "en")
-                
-                # Calculate confidence (average of segment confidences if available)
-                confidence = 0.0
-                if "segments" in result and result["segments"]:
-                    confidences = [seg.get("avg_logprob", 0) for seg in result["segments"]]
-                    confidence = np.mean(confidences) if confidences else 0.0
-                
-                return {
-                    "text": text,
-                    "confidence": confidence,
-                    "language": language,
-                    "success": True
-                }
-                
-            finally:
-                # Clean up temporary file
-                if os.path.exists(temp_file_path):
-                    os.unlink(temp_file_path)
-                    
         except Exception as e:
-            logger.error(f"Error processing audio: {e}")
+            logger.error(f"Error transcribing audio: {e}")
             return {
                 "text": "",
                 "confidence": 0.0,
@@ -87,6 +203,107 @@ class SpeechService:
                 "error": str(e)
             }
     
+    def _format_result(self, result):
+        """Extract text, language and confidence from a Whisper result"""
+        text = result.get("text", "").strip()
+        language = result.get("language", "en")
+        
+        # Calculate confidence (average of segment confidences if available)
+        confidence = 0.0
+        if "segments" in result and result["segments"]:
+            confidences = [seg.get("avg_logprob", 0) for seg in result["segments"]]
+            confidence = float(np.mean(confidences)) if confidences else 0.0
+        
+        return {
+            "text": text,
+            "confidence": confidence,
+            "language": language,
+            "success": True
+        }
+    
+    def read_upload(self, stream, max_size_mb=MAX_AUDIO_UPLOAD_MB, chunk_size=64 * 1024):
+        """
+        Read an upload stream, stopping as soon as it exceeds the size limit
+        
+        Args:
+            stream: File-like object to read from
+            max_size_mb: Maximum allowed size in MB
+            chunk_size: Bytes read per call
+            
+        Returns:
+            bytes: The uploaded data
+            
+        Raises:
+            AudioTooLargeError: If the upload is larger than max_size_mb
+        """
+        max_bytes = int(max_size_mb * 1024 * 1024)
+        buffer = bytearray()
+        with metrics.stage("upload_read"):
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                buffer += chunk
+                if len(buffer) > max_bytes:
+                    raise AudioTooLargeError(f"Audio file too large (max: {max_size_mb}MB)")
+        return bytes(buffer)
+    
+    def decode_audio(self, audio_data, audio_format="wav"):
+        """
+        Decode a complete audio file to 16 kHz mono float32 samples in memory
+        
+        Pipes the bytes through ffmpeg (the same conversion whisper.load_audio
+        does, minus the file on disk). Falls back to pydub when the ffmpeg
+        pipe is unavailable or cannot parse the container from a stream.
+        
+        Args:
+            audio_data: Raw audio file bytes
+            audio_format: Audio format (wav, mp3, etc.)
+            
+        Returns:
+            np.ndarray: float32 samples at whisper.audio.SAMPLE_RATE
+        """
+        cmd = [
+            "ffmpeg", "-nostdin", "-threads", "0",
+            "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le",
+            "-ar", str(whisper.audio.SAMPLE_RATE),
+            "pipe:1"
+        ]
+        with metrics.stage("audio_decode"):
+            try:
+                output = subprocess.run(cmd, input=audio_data, capture_output=True, check=True).stdout
+                return np.frombuffer(output, dtype="<i2").astype(np.float32) / 32768.0
+            except (OSError, subprocess.CalledProcessError) as e:
+                logger.info(f"ffmpeg pipe decode failed ({e}); falling back to pydub")
+                return self.decode_chunk(audio_data, audio_format)
+    
+    def decode_chunk(self, audio_data, audio_format="pcm_s16le", sample_rate=whisper.audio.SAMPLE_RATE):
+        """
+        Decode an audio chunk to 16 kHz mono float32 samples
+        
+        Args:
+            audio_data: Raw chunk bytes
+            audio_format: "pcm_s16le" for raw little-endian 16-bit mono PCM,
+                otherwise a container format pydub can decode (wav, ogg, ...)
+            sample_rate: Sample rate of raw PCM chunks
+            
+        Returns:
+            np.ndarray: float32 samples at whisper.audio.SAMPLE_RATE
+        """
+        if audio_format == "pcm_s16le":
+            samples = np.frombuffer(audio_data, dtype="<i2").astype(np.float32) / 32768.0
+            if sample_rate != whisper.audio.SAMPLE_RATE and len(samples):
+                # Linear resampling is plenty for speech recognition input
+                target_length = int(len(samples) * whisper.audio.SAMPLE_RATE / sample_rate)
+                positions = np.linspace(0, len(samples) - 1, target_length)
+                samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+            return samples
+        
+        audio = AudioSegment.from_file(io.BytesIO(audio_data), format=audio_format)
+        audio = audio.set_channels(1).set_frame_rate(whisper.audio.SAMPLE_RATE).set_sample_width(2)
+        return np.frombuffer(audio.raw_data, dtype="<i2").astype(np.float32) / 32768.0
+    
     def convert_audio_format(self, audio_data, input_format, output_format="wav"):
         """
         Convert audio format using pydub
@@ -113,7 +330,7 @@ class SpeechService:
             logger.error(f"Error converting audio format: {e}")
             raise
     
-    def validate_audio(self, audio_data, max_size_mb=10):
+    def validate_audio(self, audio_data, max_size_mb=MAX_AUDIO_UPLOAD_MB):
         """
         Validate audio data
         
@@ -0,0 +1,204 @@
+"""
+Streaming speech transcription: segment incoming audio at silence and
+transcribe each segment while the user is still speaking
+"""
+
+import logging
+import threading
+import time
+import uuid
+import numpy as np
+from config import *
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000  # Whisper's input sample rate
+FRAME_SAMPLES = SAMPLE_RATE * STREAM_FRAME_MS // 1000
+
+
+class StreamLimitError(Exception):
+    """Raised when a stream exceeds its configured duration"""
+
+
+class TranscriptionSession:
+    """Audio buffer and segment results for one streaming transcription"""
+
+    def __init__(self, transcriber):
+        self.id = uuid.uuid4().hex
+        self.transcriber = transcriber
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.buffer_offset = 0  # Absolute sample index of buffer[0]
+        self.total_samples = 0
+        self.scanned = 0  # Samples of the buffer already checked for silence
+        self.silent_frames = 0
+        self.segments = []
+        self.lock = threading.Lock()
+        self.finished = False
+        self.last_activity = time.time()
+
+    def add_audio(self, samples):
+        """Append samples and dispatch any segments that ended in silence"""
+        with self.lock:
+            if self.finished:
+                raise ValueError("Stream already finished")
+            if self.total_samples + len(samples) > STREAM_MAX_SECONDS * SAMPLE_RATE:
+                raise StreamLimitError(f"Stream exceeds {STREAM_MAX_SECONDS} seconds")
+            self.last_activity = time.time()
+            self.buffer = np.concatenate([self.buffer, samples])
+            self.total_samples += len(samples)
+            self._cut_segments()
+
+    def _cut_segments(self):
+        """Scan new frames for silence and cut segments (caller holds the lock)"""
+        min_segment = int(STREAM_MIN_SEGMENT_SECONDS * SAMPLE_RATE)
+        max_segment = int(STREAM_MAX_SEGMENT_SECONDS * SAMPLE_RATE)
+        min_silence_frames = max(1, STREAM_MIN_SILENCE_MS // STREAM_FRAME_MS)
+
+        while self.scanned + FRAME_SAMPLES <= len(self.buffer):
+            frame = self.buffer[self.scanned:self.scanned + FRAME_SAMPLES]
+            self.scanned += FRAME_SAMPLES
+            rms = float(np.sqrt(np.mean(frame * frame)))
+            self.silent_frames = self.silent_frames + 1 if rms < STREAM_SILENCE_RMS else 0
+
+            if self.scanned >= min_segment and self.silent_frames >= min_silence_frames:
+                # Cut in the middle of the silence so no word is split
+                self._dispatch(self.scanned - self.silent_frames * FRAME_SAMPLES // 2)
+            elif self.scanned >= max_segment:
+                self._dispatch(self.scanned)
+
+    def _dispatch(self, cut):
+        """Send buffer[:cut] for transcription (caller holds the lock)"""
+        audio = self.buffer[:cut]
+        start = self.buffer_offset
+        self.buffer = self.buffer[cut:]
+        self.buffer_offset += cut
+        self.scanned = max(0, self.scanned - cut)
+        self.silent_frames = 0
+
+        segment = {
+            "index": len(self.segments),
+            "start": start / SAMPLE_RATE,
+            "end": (start + len(audio)) / SAMPLE_RATE,
+            "future": None,
+        }
+        # Pure silence makes Whisper hallucinate; skip it
+        if len(audio) and float(np.sqrt(np.mean(audio * audio))) >= STREAM_SILENCE_RMS:
+            # Queued with the scheduler so segments from concurrent streams
+            # (and uploads) share batched decoder calls
+            segment["future"] = self.transcriber.speech_service.submit(audio)
+        self.segments.append(segment)
+
+    def finish(self):
+        """Flush the remaining audio and mark the stream complete"""
+        with self.lock:
+            if not self.finished:
+                self.finished = True
+                self.last_activity = time.time()
+                if len(self.buffer) >= FRAME_SAMPLES:
+                    self._dispatch(len(self.buffer))
+
+    def snapshot(self, wait=False):
+        """
+        Collect segment results
+
+        Args:
+            wait: Block until every dispatched segment is transcribed
+
+        Returns:
+            dict: Partial (or final) transcript and per-segment results
+        """
+        with self.lock:
+            segments = list(self.segments)
+
+        results = []
+        pending = 0
+        for segment in segments:
+            future = segment["future"]
+            if future is None:
+                continue
+            if not wait and not future.done():
+                pending += 1
+                continue
+            try:
+                result = future.result()
+            except Exception as e:
+                # One failed segment must not fail every later snapshot
+                logger.error(f"Error transcribing segment {segment['index']} of stream {self.id}: {e}")
+                result = {"text": "", "language": "en", "confidence": 0.0, "success": False, "error": str(e)}
+            results.append({
+                "index": segment["index"],
+                "start": segment["start"],
+                "end": segment["end"],
+                "text": result["text"],
+                "language": result["language"],
+                "confidence": result["confidence"],
+                "success": result["success"],
+            })
+            if "error" in result:
+                results[-1]["error"] = result["error"]
+
+        # Only assemble text up to the first unfinished segment so the
+        # partial transcript never has holes
+        text_parts = []
+        expected = [segment["index"] for segment in segments if segment["future"] is not None]
+        for index, result in zip(expected, results):
+            if result["index"] != index:
+                break
+            if result["text"]:
+                text_parts.append(result["text"])
+
+        languages = [result["language"] for result in results if result["text"]]
+        confidences = [result["confidence"] for result in results if result["text"]]
+        return {
+            "session_id": self.id,
+            "text": " ".join(text_parts),
+            "language": max(set(languages), key=languages.count) if languages else "en",
+            "confidence": float(np.mean(confidences)) if confidences else 0.0,
+            "segments": results,
+            "pending_segments": pending,
+            "buffered_seconds": len(self.buffer) / SAMPLE_RATE,
+            "finished": self.finished and pending == 0,
+        }
+
+
+class StreamingTranscriber:
+    def __init__(self, speech_service):
+        """
+        Initialize the streaming transcriber
+
+        Args:
+            speech_service: SpeechService whose scheduler transcribes segments
+        """
+        self.speech_service = speech_service
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def create_session(self):
+        """Start a new streaming session"""
+        session = TranscriptionSession(self)
+        with self.lock:
+            self._expire_sessions()
+            self.sessions[session.id] = session
+        return session
+
+    def get(self, session_id):
+        """Get a session by id, or None if unknown or expired"""
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def close(self, session_id):
+        """Forget a finished session"""
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def _expire_sessions(self):
+        """Drop sessions idle longer than STREAM_SESSION_TTL (caller holds the lock)"""
+        cutoff = time.time() - STREAM_SESSION_TTL
+        for session_id in [session_id for session_id, session in self.sessions.items()
+                           if session.last_activity < cutoff]:
+            del self.sessions[session_id]
+
+    def stats(self):
+        """Get streaming statistics"""
+        with self.lock:
+            return {"active_sessions": len(self.sessions)}
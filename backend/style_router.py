@@ -0,0 +1,169 @@
+"""
+Prompt-to-style routing with a precompiled multilingual keyword matcher
+"""
+
+import re
+import logging
+import torch
+from config import *
+import metrics
+
+logger = logging.getLogger(__name__)
+
+STYLE_KEYWORDS = {
+    "dreamshaper": DREAMSHAPER_KEYWORDS,
+    "realistic_vision": REALISTIC_KEYWORDS,
+}
+
+STYLE_MODEL_IDS = {
+    "dreamshaper": "Lykon/dreamshaper-8",
+    "realistic_vision": "SG161222/Realistic_Vision_V5.1_noVAE",
+}
+
+# Characters that continue a word. Indic vowel signs are combining marks,
+# which \w does not cover, so their blocks are listed explicitly
+_WORD_CHAR = r"[\w\u0300-\u036f\u0900-\u0dff]"
+
+# Hiragana, katakana and CJK ideographs: no spaces between words
+_UNSPACED_SCRIPT = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff]")
+
+
+def _normalize(keyword):
+    return " ".join(keyword.casefold().split())
+
+
+def _keyword_pattern(keyword):
+    return r"\s+".join(re.escape(word) for word in keyword.split())
+
+
+class StyleRouter:
+    def __init__(self, keyword_tables=STYLE_KEYWORDS, default_style=DEFAULT_STYLE,
+                 prototypes=STYLE_PROTOTYPES):
+        """
+        Compile the keyword tables into one matcher
+
+        Args:
+            keyword_tables: Style -> {keyword: weight}
+            default_style: Style chosen when nothing matches or scores tie
+            prototypes: Style -> description used by the embedding fallback
+        """
+        self.styles = list(keyword_tables)
+        self.default_style = default_style
+        self.prototypes = prototypes
+        self.weights = {}  # normalized keyword -> [(style, weight)]
+        for style, keywords in keyword_tables.items():
+            for keyword, weight in keywords.items():
+                self.weights.setdefault(_normalize(keyword), []).append((style, weight))
+
+        # A phrase also scores the keywords it contains ("film photography"
+        # counts "film" and "photography"), since the matcher consumes the
+        # whole phrase at once
+        self.expansions = {
+            keyword: [other for other in self.weights
+                      if other == keyword or re.search(rf"(?<!\S){re.escape(other)}(?!\S)", keyword)]
+            for keyword in self.weights
+        }
+
+        # Longest first, so phrases win over the words they contain
+        keywords = sorted(self.weights, key=len, reverse=True)
+        bounded = [_keyword_pattern(keyword) for keyword in keywords
+                   if not _UNSPACED_SCRIPT.search(keyword)]
+        unbounded = [_keyword_pattern(keyword) for keyword in keywords
+                     if _UNSPACED_SCRIPT.search(keyword)]
+        alternatives = [rf"(?<!{_WORD_CHAR})(?:{'|'.join(bounded)})(?!{_WORD_CHAR})"]
+        if unbounded:
+            alternatives.append(f"(?:{'|'.join(unbounded)})")
+        self.pattern = re.compile("|".join(alternatives))
+
+    def match(self, prompt):
+        """
+        Score a prompt against the keyword tables in a single pass
+
+        Each keyword counts once however often it appears.
+
+        Returns:
+            tuple: (style -> score, style -> ["keyword (+weight)", ...])
+        """
+        scores = {style: 0 for style in self.styles}
+        found = {style: [] for style in self.styles}
+        seen = set()
+        for match in self.pattern.finditer(prompt.casefold()):
+            for keyword in self.expansions[_normalize(match.group())]:
+                if keyword in seen:
+                    continue
+                seen.add(keyword)
+                for style, weight in self.weights[keyword]:
+                    scores[style] += weight
+                    found[style].append(f"{keyword} (+{weight})")
+        return scores, found
+
+    def classify(self, prompt, embedder=None):
+        """Route a single prompt; see classify_batch"""
+        return self.classify_batch([prompt], embedder)[0]
+
+    def classify_batch(self, prompts, embedder=None):
+        """
+        Route many prompts at once
+
+        Args:
+            prompts: Text prompts
+            embedder: Optional EmbeddingCache of a loaded model; prompts
+                without keyword matches are routed by embedding similarity
+
+        Returns:
+            list: One dict per prompt with style, model_id, scores, matches and
+            method ("keywords", "embedding" or "default")
+        """
+        decisions = []
+        unmatched = []
+        for index, prompt in enumerate(prompts):
+            scores, found = self.match(prompt)
+            best = max(scores.values())
+            leaders = [style for style, score in scores.items() if score == best]
+            if best > 0 and len(leaders) == 1:
+                style, method = leaders[0], "keywords"
+            else:
+                style, method = self.default_style, "default"
+                if best == 0:
+                    unmatched.append(index)
+            decisions.append({
+                "style": style,
+                "model_id": STYLE_MODEL_IDS.get(style),
+                "scores": scores,
+                "matches": found,
+                "method": method,
+            })
+
+        if embedder is not None and unmatched:
+            try:
+                styles = self._route_by_embedding(embedder, [prompts[index] for index in unmatched])
+                for index, style in zip(unmatched, styles):
+                    decisions[index].update(style=style, model_id=STYLE_MODEL_IDS.get(style), method="embedding")
+            except Exception as e:
+                logger.warning(f"Embedding style fallback failed, using {self.default_style}: {e}")
+
+        for decision in decisions:
+            metrics.increment("style_routes_total", style=decision["style"], method=decision["method"])
+        return decisions
+
+    def _route_by_embedding(self, embedder, prompts):
+        """Pick the style whose prototype embedding is closest to each prompt"""
+        styles = list(self.prototypes)
+        pooled = self._pooled(embedder, [self.prototypes[style] for style in styles] + list(prompts))
+        pooled = torch.nn.functional.normalize(pooled, dim=-1)
+        similarity = pooled[len(styles):] @ pooled[:len(styles)].T
+        return [styles[index] for index in similarity.argmax(dim=1).tolist()]
+
+    @staticmethod
+    def _pooled(embedder, texts):
+        """CLIP-style pooled embeddings: the hidden state at each end-of-text token"""
+        tokenizer = embedder.pipe.tokenizer
+        input_ids = tokenizer(texts, padding="max_length", max_length=tokenizer.model_max_length,
+                              truncation=True, return_tensors="pt").input_ids
+        eos_positions = (input_ids == tokenizer.eos_token_id).int().argmax(dim=1)
+        embeds = embedder.get_batch(texts).float().cpu()
+        return embeds[torch.arange(len(texts)), eos_positions]
+
+
+# Compiled once when the configuration is loaded
+router = StyleRouter()
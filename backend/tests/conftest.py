@@ -0,0 +1,65 @@
+"""
+Shared test setup
+
+Backend modules import each other by bare name, so the backend directory
+goes on sys.path. The ML stack (torch, diffusers, whisper and friends) is
+replaced by stub modules when it is not installed: the tests cover queueing,
+caching, admission and HTTP logic, never real inference.
+"""
+
+import os
+import sys
+import types
+import importlib.util
+from unittest import mock
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+class _StubModule(types.ModuleType):
+    """Module whose unknown attributes are mocks"""
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        value = mock.MagicMock(name=f"{self.__name__}.{name}")
+        setattr(self, name, value)
+        return value
+
+
+def _stub(name, **attributes):
+    module = _StubModule(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+class _Module:
+    """Stand-in for torch.nn.Module, which backend classes subclass"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+def _install_stubs():
+    if importlib.util.find_spec("torch") is None:
+        _stub("torch")
+        _stub("torch.cuda", is_available=lambda: False)
+        _stub("torch.nn", Module=_Module)
+        _stub("torch.nn.functional")
+    if importlib.util.find_spec("whisper") is None:
+        _stub("whisper")
+        _stub("whisper.audio", SAMPLE_RATE=16000, N_SAMPLES=16000 * 30)
+    for name in ("diffusers", "accelerate", "transformers"):
+        if importlib.util.find_spec(name) is None:
+            _stub(name)
+    if importlib.util.find_spec("safetensors") is None:
+        _stub("safetensors")
+        _stub("safetensors.torch")
+
+
+_install_stubs()
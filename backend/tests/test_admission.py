@@ -0,0 +1,86 @@
+from admission import AdmissionController
+
+MB = 1024 * 1024
+
+
+def job(size=512, guidance_scale=7.5):
+    return {"size": size, "guidance_scale": guidance_scale}
+
+
+def controller_fitting(params_list, sliced=False, spare=0.5):
+    """A CPU controller whose budget fits params_list with a fraction of one job to spare"""
+    probe = AdmissionController(budget_mb=1, device="cpu")
+    needed = probe.estimate(params_list, sliced) + spare * probe.estimate(params_list[:1], sliced)
+    return AdmissionController(budget_mb=needed / MB, device="cpu")
+
+
+def test_whole_batch_is_admitted_when_it_fits():
+    batch = [job() for _ in range(3)]
+    admission = controller_fitting(batch)
+
+    count, sliced, reservation = admission.admit(batch)
+
+    assert (count, sliced) == (3, False)
+    assert reservation.nbytes == admission.estimate(batch)
+    assert admission.stats()["split_batches"] == 0
+
+
+def test_batch_that_does_not_fit_is_split():
+    batch = [job() for _ in range(4)]
+    admission = controller_fitting(batch[:2])
+
+    count, sliced, _ = admission.admit(batch)
+
+    assert (count, sliced) == (2, False)
+    assert admission.stats()["split_batches"] == 1
+
+
+def test_single_job_falls_back_to_sliced_attention():
+    batch = [job(), job()]
+    admission = controller_fitting(batch[:1], sliced=True, spare=0.1)
+    assert admission.estimate(batch[:1]) > admission.budget
+
+    count, sliced, reservation = admission.admit(batch)
+
+    assert (count, sliced) == (1, True)
+    assert reservation.nbytes == admission.estimate(batch[:1], sliced=True)
+    assert admission.stats()["sliced_batches"] == 1
+
+
+def test_oversized_job_is_forced_through_when_nothing_is_running():
+    admission = AdmissionController(budget_mb=1, device="cpu")
+
+    count, sliced, reservation = admission.admit([job()])
+
+    assert (count, sliced) == (1, True)
+    assert reservation is not None
+    assert admission.stats()["oversized_batches"] == 1
+
+
+def test_job_waits_while_other_batches_hold_the_budget():
+    admission = controller_fitting([job()])
+    running = admission.admit([job()])[2]
+
+    assert admission.admit([job()]) == (0, False, None)
+
+    admission.release(running)
+    assert admission.reserved == 0
+    assert admission.admit([job()])[0] == 1
+
+
+def test_unguided_batches_need_less_memory():
+    admission = AdmissionController(device="cpu")
+
+    assert admission.estimate([job(guidance_scale=1.0)]) < admission.estimate([job()])
+
+
+def test_measured_peaks_correct_later_estimates():
+    admission = AdmissionController(budget_mb=100000, device="cpu")
+    before = admission.estimate([job()])
+    reservation = admission.admit([job()])[2]
+
+    # The batch actually peaked at twice its estimate
+    admission.release(reservation, [{"metadata": {"peak_memory_mb": 2 * before / MB}}])
+
+    assert admission.stats()["estimate_correction"] == 1.2
+    assert admission.estimate([job()]) > before
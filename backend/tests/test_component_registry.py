@@ -0,0 +1,115 @@
+import contextlib
+import json
+import sys
+import types
+
+import pytest
+
+import component_registry
+from component_registry import ComponentRegistry
+
+
+class FakeComponent:
+    """Stand-in for a diffusers/transformers class, recording how it was built"""
+
+    loads = []
+
+    def __init__(self, config=None):
+        self.config = config
+        self.state_dict = None
+
+    @classmethod
+    def load_config(cls, folder):
+        return {"folder": folder}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config)
+
+    @classmethod
+    def from_pretrained(cls, folder, **kwargs):
+        cls.loads.append((folder, kwargs))
+        return cls({"folder": folder})
+
+    def load_state_dict(self, state_dict, strict=True, assign=False):
+        self.state_dict = state_dict
+        return [] if "weight" in state_dict else ["weight"], []
+
+    def to(self, dtype=None):
+        return self
+
+    def eval(self):
+        return self
+
+
+def write_style(root, name, weights):
+    """Create a model folder; weights maps component -> safetensors bytes (None for a .bin checkpoint)"""
+    model_path = root / name
+    entries = {component: ["fake_library", "FakeComponent"]
+               for component in ("unet", "vae", "text_encoder", "tokenizer", "scheduler")}
+    model_path.mkdir()
+    (model_path / "model_index.json").write_text(json.dumps(entries))
+    for component in entries:
+        folder = model_path / component
+        folder.mkdir()
+        (folder / "config.json").write_text("{}")
+        data = weights.get(component, b"shared " + component.encode())
+        if data is None:
+            (folder / "pytorch_model.bin").write_bytes(b"legacy")
+        elif component in component_registry.WEIGHTED_COMPONENTS:
+            (folder / "model.safetensors").write_bytes(data)
+    return str(model_path)
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    FakeComponent.loads = []
+    monkeypatch.setitem(sys.modules, "fake_library", types.SimpleNamespace(FakeComponent=FakeComponent))
+    monkeypatch.setattr(component_registry, "init_empty_weights", contextlib.nullcontext)
+    monkeypatch.setattr(component_registry, "load_file", lambda path, device: {"weight": path})
+    return ComponentRegistry(index_path=str(tmp_path / "hashes.json"))
+
+
+def test_styles_with_identical_weights_share_components(registry, tmp_path, monkeypatch):
+    monkeypatch.setattr(component_registry, "MODEL_PATHS", {
+        "dreamshaper": write_style(tmp_path, "dreamshaper", {"unet": b"dreamshaper unet"}),
+        "realistic_vision": write_style(tmp_path, "realistic_vision", {"unet": b"realistic unet"}),
+    })
+
+    first = registry.acquire("dreamshaper", "cpu", dtype=None)
+    second = registry.acquire("realistic_vision", "cpu", dtype=None)
+
+    assert first["unet"] is not second["unet"]
+    assert first["unet"].state_dict["weight"].endswith("model.safetensors")
+    assert first["vae"] is second["vae"]
+    assert first["text_encoder"] is second["text_encoder"]
+    # Schedulers carry per-call state, so each pipeline gets its own
+    assert first["scheduler"] is not second["scheduler"]
+    assert len(registry.components) == 6  # Two unets plus shared vae, text_encoder, tokenizer, scheduler
+
+    registry.release("dreamshaper")
+
+    assert sorted(registry.stats().values()) == [["realistic_vision"]] * 5
+    assert json.loads((tmp_path / "hashes.json").read_text())
+
+
+def test_bin_checkpoints_fall_back_to_from_pretrained(registry, tmp_path, monkeypatch):
+    monkeypatch.setattr(component_registry, "MODEL_PATHS",
+                        {"dreamshaper": write_style(tmp_path, "dreamshaper", {"unet": None})})
+
+    components = registry.acquire("dreamshaper", "cpu", dtype=None)
+
+    legacy = [(folder, kwargs) for folder, kwargs in FakeComponent.loads if folder.endswith("unet")]
+    assert legacy == [(str(tmp_path / "dreamshaper" / "unet"),
+                       {"torch_dtype": None, "low_cpu_mem_usage": component_registry.LOW_CPU_MEM_USAGE})]
+    assert components["unet"].config == {"folder": legacy[0][0]}
+
+
+def test_weights_missing_from_the_checkpoint_fail_the_load(registry, tmp_path, monkeypatch):
+    monkeypatch.setattr(component_registry, "MODEL_PATHS",
+                        {"dreamshaper": write_style(tmp_path, "dreamshaper", {})})
+    monkeypatch.setattr(component_registry, "load_file", lambda path, device: {})
+
+    with pytest.raises(RuntimeError, match="missing weights: weight"):
+        registry.acquire("dreamshaper", "cpu", dtype=None)
+    assert registry.components == {}
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+from unittest import mock
+
+import cpu_backend
+from cpu_backend import CpuBackend, _ExportedTextEncoder, _ExportedUNet
+from tiered_model_cache import module_bytes
+
+
+def make_eager():
+    eager = mock.MagicMock(name="eager", return_value=("eager output",))
+    eager.config = SimpleNamespace(in_channels=4)
+    return eager
+
+
+def test_unet_with_timestep_conditioning_runs_eagerly():
+    eager = make_eager()
+    runtime = mock.MagicMock()
+    unet = _ExportedUNet(runtime, eager, footprint_bytes=1)
+
+    output = unet.forward("sample", 10, "embeddings", timestep_cond="cond", return_dict=False)
+
+    assert output == ("eager output",)
+    eager.assert_called_once_with("sample", 10, "embeddings", timestep_cond="cond", return_dict=False)
+    runtime.run.assert_not_called()
+    assert unet.config is eager.config
+
+
+def test_unet_with_extra_conditioning_runs_eagerly():
+    eager = make_eager()
+    unet = _ExportedUNet(mock.MagicMock(), eager, footprint_bytes=1)
+
+    unet.forward("sample", 10, "embeddings", added_cond_kwargs={"image_embeds": "ip"}, return_dict=False)
+
+    eager.assert_called_once()
+
+
+def test_text_encoder_hidden_states_request_runs_eagerly():
+    eager = make_eager()
+    runtime = mock.MagicMock()
+    encoder = _ExportedTextEncoder(runtime, eager, footprint_bytes=1)
+
+    output = encoder.forward("ids", attention_mask=None, output_hidden_states=True)
+
+    assert output == ("eager output",)
+    eager.assert_called_once_with("ids", attention_mask=None, output_hidden_states=True)
+    runtime.run.assert_not_called()
+
+
+class FakeTensor:
+    def __init__(self, numel):
+        self._numel = numel
+
+    def numel(self):
+        return self._numel
+
+    def element_size(self):
+        return 4
+
+
+def test_exported_footprint_counts_the_resident_eager_module(tmp_path, monkeypatch):
+    def export(self, name, module, fingerprint):
+        folder = tmp_path / name
+        folder.mkdir()
+        (folder / "model.onnx").write_bytes(b"x" * 1000)
+        return str(folder / "model.onnx")
+
+    monkeypatch.setattr(CpuBackend, "_export", export)
+    monkeypatch.setitem(cpu_backend.RUNTIMES, "onnx", lambda path, threads: mock.MagicMock())
+    pipe = SimpleNamespace()
+    for name in cpu_backend.EXPORTED_COMPONENTS:
+        eager = make_eager()
+        eager.parameters.return_value = [FakeTensor(250)]
+        eager.buffers.return_value = []
+        eager.footprint_bytes = None  # A torch module, not an export
+        setattr(pipe, name, eager)
+
+    CpuBackend(requested="onnx")._apply_exported(pipe, "onnx", {name: name for name in cpu_backend.EXPORTED_COMPONENTS})
+
+    assert isinstance(pipe.unet, _ExportedUNet)
+    assert module_bytes(pipe.unet) == 1000 + 250 * 4
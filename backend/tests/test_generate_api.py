@@ -0,0 +1,66 @@
+import importlib
+from unittest import mock
+
+import pytest
+
+from job_queue import JobQueue
+from rate_limiter import MemoryStore, RateLimiter
+from quality_tiers import TierPlanner
+
+
+class RecordingResultCache:
+    def __init__(self):
+        self.lookups = []
+
+    def get(self, key, images_dir, stem):
+        self.lookups.append(key)
+        return None
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    # app.py logs to a relative app.log; keep it out of the source tree
+    monkeypatch.chdir(tmp_path)
+    app = importlib.import_module("app")
+    monkeypatch.setattr(app, "rate_limiter", RateLimiter(MemoryStore(), limits={"generate": (100, 1)}))
+    monkeypatch.setattr(app, "job_queue", JobQueue(mock.MagicMock(), batch_key=app.generation_batch_key))
+    monkeypatch.setattr(app, "result_cache", RecordingResultCache())
+    monkeypatch.setattr(app, "inference_backend", mock.MagicMock())
+    monkeypatch.setattr(app, "tier_planner", TierPlanner())
+    return app
+
+
+def generate(app, **data):
+    response = app.app.test_client().post("/generate-image", json={"prompt": "a red fox",
+                                                                    "style": "dreamshaper", **data})
+    assert response.status_code == 202, response.get_json()
+    return app.job_queue.get(response.get_json()["job_id"])
+
+
+def test_unseeded_repeats_get_fresh_random_seeds(app_module):
+    first = generate(app_module)
+    second = generate(app_module)
+
+    assert first is not second
+    assert first.params["seed"] != second.params["seed"]
+    assert first.params["cache_key"] is None
+    assert app_module.result_cache.lookups == []
+
+
+def test_seeded_repeats_are_cached_and_share_a_job(app_module):
+    first = generate(app_module, seed=42)
+    second = generate(app_module, seed=42)
+
+    assert first is second
+    assert first.params["seed"] == 42
+    assert app_module.result_cache.lookups == [first.params["cache_key"]] * 2
+
+
+def test_derived_seeds_are_opt_in(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "DERIVE_UNSEEDED_SEEDS", True)
+
+    first = generate(app_module)
+    second = generate(app_module)
+
+    assert first is second
+    assert first.params["cache_key"] is not None
@@ -0,0 +1,79 @@
+import pytest
+
+from image_catalog import ImageCatalog
+
+
+@pytest.fixture
+def paths(tmp_path):
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    return images_dir, str(tmp_path / "catalog.db")
+
+
+def write_image(images_dir, name, size=10):
+    (images_dir / name).write_bytes(b"x" * size)
+    return name
+
+
+def test_added_images_page_newest_first(paths):
+    images_dir, db_path = paths
+    catalog = ImageCatalog(str(images_dir), db_path)
+    names = [write_image(images_dir, f"generated_20240101_12000{index}.png", size=index + 1)
+             for index in range(5)]
+    for name in names:
+        catalog.add(name, prompt=f"prompt {name}", style="dreamshaper", dimensions="512x512")
+
+    first, cursor = catalog.page(limit=2)
+    second, cursor = catalog.page(limit=2, cursor=cursor)
+    last, end = catalog.page(limit=2, cursor=cursor)
+
+    assert [record["filename"] for record in first + second + last] == names[::-1]
+    assert end is None
+    assert first[0]["prompt"] == f"prompt {names[-1]}"
+    assert first[0]["size_bytes"] == 5
+    assert catalog.count() == 5
+
+
+def test_trim_removes_the_oldest_images_and_their_files(paths):
+    images_dir, db_path = paths
+    catalog = ImageCatalog(str(images_dir), db_path)
+    names = [write_image(images_dir, f"generated_20240101_12000{index}.png") for index in range(3)]
+    for name in names:
+        catalog.add(name)
+
+    assert catalog.trim(2) == [names[0]]
+    assert catalog.get(names[0]) is None
+    assert not (images_dir / names[0]).exists()
+    assert catalog.count() == 2
+
+
+def test_missing_files_are_not_catalogued(paths):
+    images_dir, db_path = paths
+    catalog = ImageCatalog(str(images_dir), db_path)
+
+    catalog.add("generated_20240101_120000.png", prompt="never written")
+
+    assert catalog.count() == 0
+
+
+def test_restart_reconciles_with_the_directory(paths):
+    images_dir, db_path = paths
+    catalog = ImageCatalog(str(images_dir), db_path)
+    kept = write_image(images_dir, "generated_20240101_120000.png")
+    deleted = write_image(images_dir, "generated_20240101_120001.png")
+    catalog.add(kept, prompt="kept", style="dreamshaper")
+    catalog.add(deleted, prompt="deleted")
+    catalog.db.close()
+
+    # While the server is down one file disappears and another appears
+    (images_dir / deleted).unlink()
+    untracked = write_image(images_dir, "generated_20240101_120002.webp")
+    write_image(images_dir, "notes.txt")
+    restarted = ImageCatalog(str(images_dir), db_path)
+
+    assert restarted.get(kept)["prompt"] == "kept"
+    assert restarted.get(deleted) is None
+    assert restarted.get(untracked)["prompt"] is None
+    assert restarted.count() == 2
+    records, _ = restarted.page(limit=10)
+    assert [record["filename"] for record in records] == [untracked, kept]
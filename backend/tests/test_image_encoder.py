@@ -0,0 +1,99 @@
+import importlib
+import threading
+
+import pytest
+
+from image_encoder import ImageEncoder
+
+FILENAME = "generated_20240101_120000_test.png"
+
+
+class GatedImage:
+    """Image stand-in whose encoding blocks until released (or fails)"""
+
+    mode = "RGB"
+
+    def __init__(self, error=None):
+        self.release = threading.Event()
+        self.error = error
+
+    def save(self, buffer, pil_format, **options):
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        buffer.write(b"encoded " + pil_format.encode("ascii"))
+
+
+def test_wait_returns_once_the_file_is_written(tmp_path):
+    encoder = ImageEncoder(num_workers=1)
+    image = GatedImage()
+    path = tmp_path / FILENAME
+    encoder.submit(image, str(path), "png")
+
+    assert encoder.wait(FILENAME, timeout=0.05) is False
+    assert not path.exists()
+
+    image.release.set()
+    assert encoder.wait(FILENAME, timeout=5) is True
+    assert path.read_bytes() == b"encoded PNG"
+    assert encoder.stats() == {"pending": 0, "encoded": 1, "failed": 0}
+
+
+def test_wait_on_an_unknown_file_returns_at_once():
+    assert ImageEncoder(num_workers=1).wait("generated_20240101_120000.png", timeout=5) is True
+
+
+def test_encode_failure_is_reported_without_hanging(tmp_path):
+    encoder = ImageEncoder(num_workers=1)
+    image = GatedImage(error=OSError("disk full"))
+    written = []
+    future = encoder.submit(image, str(tmp_path / FILENAME), "png")
+    encoder.when_written(FILENAME, lambda: written.append(FILENAME))
+    image.release.set()
+
+    assert encoder.wait(FILENAME, timeout=5) is False
+    assert isinstance(future.exception(timeout=5), OSError)
+    assert written == []
+    assert encoder.stats()["failed"] == 1
+    assert not (tmp_path / FILENAME).exists()
+
+
+@pytest.fixture
+def app_with_encoder(tmp_path, monkeypatch):
+    # app.py logs to a relative app.log; keep it out of the source tree
+    monkeypatch.chdir(tmp_path)
+    app = importlib.import_module("app")
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    encoder = ImageEncoder(num_workers=1)
+    monkeypatch.setattr(app, "IMAGES_DIR", str(images_dir))
+    monkeypatch.setattr(app, "image_catalog", type("EmptyCatalog", (), {"get": lambda self, name: None})())
+    monkeypatch.setattr(app, "image_encoder", encoder)
+    return app, encoder, images_dir
+
+
+def test_image_still_encoding_is_served_once_written(app_with_encoder):
+    app, encoder, images_dir = app_with_encoder
+    image = GatedImage()
+    encoder.submit(image, str(images_dir / FILENAME), "png")
+    responses = []
+    request = threading.Thread(target=lambda: responses.append(
+        app.app.test_client().get(f"/images/{FILENAME}")))
+    request.start()
+
+    image.release.set()
+    request.join(5)
+
+    assert responses[0].status_code == 200
+    assert responses[0].data == b"encoded PNG"
+
+
+def test_image_that_failed_to_encode_is_not_found(app_with_encoder):
+    app, encoder, images_dir = app_with_encoder
+    image = GatedImage(error=OSError("disk full"))
+    encoder.submit(image, str(images_dir / FILENAME), "png")
+    image.release.set()
+
+    response = app.app.test_client().get(f"/images/{FILENAME}")
+
+    assert response.status_code == 404
@@ -0,0 +1,20 @@
+import pytest
+
+from image_service import draft_size
+
+
+@pytest.mark.parametrize("vae_scale_factor", [2, 8])
+@pytest.mark.parametrize("size", [32, 64, 100, 512, 768])
+def test_draft_size_is_whole_latent_pixels(size, vae_scale_factor):
+    draft = draft_size(size, vae_scale_factor)
+
+    assert draft % vae_scale_factor == 0
+    assert draft % 8 == 0
+    assert draft // vae_scale_factor >= 8
+
+
+def test_draft_size_scales_the_final_size():
+    assert draft_size(512) == 256
+    assert draft_size(64, vae_scale_factor=2) == 32
+    # Stable Diffusion's factor of 8 keeps drafts at 64px or more
+    assert draft_size(64) == 64
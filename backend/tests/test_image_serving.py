@@ -0,0 +1,146 @@
+import importlib
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from thumbnail_cache import ThumbnailCache
+
+FILENAME = "generated_20240101_120000_test.png"
+CONTENT = bytes(range(256)) * 4
+
+
+class FakeCatalog:
+    def __init__(self, names):
+        self.names = set(names)
+
+    def get(self, filename):
+        return {"filename": filename} if filename in self.names else None
+
+
+class FakeEncoder:
+    def wait(self, filename):
+        return False
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # app.py logs to a relative app.log; keep it out of the source tree
+    monkeypatch.chdir(tmp_path)
+    app = importlib.import_module("app")
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    (images_dir / FILENAME).write_bytes(CONTENT)
+    monkeypatch.setattr(app, "IMAGES_DIR", str(images_dir))
+    monkeypatch.setattr(app, "image_catalog", FakeCatalog([FILENAME]))
+    monkeypatch.setattr(app, "image_encoder", FakeEncoder())
+    return app.app.test_client()
+
+
+def test_image_is_served_with_immutable_caching_headers(client):
+    response = client.get(f"/images/{FILENAME}")
+
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert response.headers["ETag"]
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert "immutable" in response.headers["Cache-Control"]
+    assert "public" in response.headers["Cache-Control"]
+
+
+def test_matching_etag_gets_not_modified(client):
+    etag = client.get(f"/images/{FILENAME}").headers["ETag"]
+
+    response = client.get(f"/images/{FILENAME}", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.data == b""
+
+
+def test_range_request_gets_partial_content(client):
+    response = client.get(f"/images/{FILENAME}", headers={"Range": "bytes=100-199"})
+
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 100-199/{len(CONTENT)}"
+    assert response.data == CONTENT[100:200]
+
+
+def test_download_is_an_attachment_with_the_same_etag(client):
+    etag = client.get(f"/images/{FILENAME}").headers["ETag"]
+
+    response = client.get(f"/download/{FILENAME}")
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] == etag
+    assert response.headers["Content-Disposition"].startswith("attachment")
+
+
+def test_unknown_and_malformed_names_are_rejected(client):
+    assert client.get("/images/generated_20240101_120001.png").status_code == 404
+    assert client.get("/images/..%2Fconfig.py").status_code in (400, 404)
+    assert client.get("/images/notes.txt").status_code == 400
+
+
+@pytest.fixture
+def thumbnails(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app = importlib.import_module("app")
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    names = [f"generated_20240101_12000{index}.png" for index in range(3)]
+    for index, name in enumerate(names):
+        Image.new("RGB", (512, 384), (index * 80, 40, 200)).save(images_dir / name)
+    cache = ThumbnailCache(cache_dir=str(tmp_path / "thumbnails"))
+    monkeypatch.setattr(app, "IMAGES_DIR", str(images_dir))
+    monkeypatch.setattr(app, "image_catalog", FakeCatalog(names))
+    monkeypatch.setattr(app, "image_encoder", FakeEncoder())
+    monkeypatch.setattr(app, "thumbnail_cache", cache)
+    return app.app.test_client(), cache, names
+
+
+def test_thumbnail_size_must_be_allowed(thumbnails):
+    client, cache, names = thumbnails
+
+    assert client.get(f"/images/{names[0]}/thumbnail?size=300").status_code == 400
+    assert client.get(f"/images/{names[0]}/thumbnail?size=big").status_code == 400
+    assert cache.stats()["misses"] == 0
+
+
+def test_repeat_thumbnail_is_served_from_the_cache(thumbnails):
+    client, cache, names = thumbnails
+
+    first = client.get(f"/images/{names[0]}/thumbnail?size=128")
+    second = client.get(f"/images/{names[0]}/thumbnail?size=128")
+
+    assert first.status_code == second.status_code == 200
+    assert second.data == first.data
+    with Image.open(io.BytesIO(first.data)) as image:
+        assert max(image.size) == 128
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+def test_thumbnail_cache_evicts_within_its_budget(thumbnails):
+    client, cache, names = thumbnails
+    assert client.get(f"/images/{names[0]}/thumbnail?size=64").status_code == 200
+    # Room for two variants of roughly this size, not three
+    cache.max_bytes = cache.total_bytes * 5 // 2
+
+    for name in names[1:]:
+        assert client.get(f"/images/{name}/thumbnail?size=64").status_code == 200
+
+    assert cache.stats()["entries"] == 2
+    assert cache.total_bytes <= cache.max_bytes
+    assert not os.path.exists(os.path.join(cache.cache_dir, cache.variant_name(names[0], 64)))
+
+
+def test_matching_etag_gets_not_modified_for_thumbnails(thumbnails):
+    client, _, names = thumbnails
+    url = f"/images/{names[0]}/thumbnail?size=64"
+    first = client.get(url)
+
+    response = client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+
+    assert "immutable" in first.headers["Cache-Control"]
+    assert response.status_code == 304
+    assert response.data == b""
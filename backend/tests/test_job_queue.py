@@ -0,0 +1,168 @@
+import threading
+import time
+
+from job_queue import JobQueue
+
+
+class RecordingHandler:
+    """Job handler that records each batch and optionally blocks until released"""
+
+    def __init__(self, block=False):
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def __call__(self, batch_params, progress):
+        self.batches.append([params["prompt"] for params in batch_params])
+        self.started.set()
+        self.release.wait(5)
+        return [{"success": True, "prompt": params["prompt"]} for params in batch_params]
+
+
+def make_queue(handler, **kwargs):
+    kwargs.setdefault("batch_key", lambda params: params["style"])
+    kwargs.setdefault("num_workers", 1)
+    kwargs.setdefault("max_batch_size", 4)
+    kwargs.setdefault("batch_window_ms", 20)
+    return JobQueue(handler, **kwargs)
+
+
+def test_compatible_jobs_share_one_batch():
+    handler = RecordingHandler()
+    queue = make_queue(handler)
+    jobs = [queue.submit({"prompt": f"p{index}", "style": "a"}) for index in range(3)]
+    jobs.append(queue.submit({"prompt": "other", "style": "b"}))
+    queue.start()
+    try:
+        for job in jobs:
+            assert job.done.wait(5)
+    finally:
+        queue.stop()
+
+    assert sorted(map(sorted, handler.batches)) == [["other"], ["p0", "p1", "p2"]]
+    assert all(job.status == "completed" for job in jobs)
+    assert jobs[0].result["prompt"] == "p0"
+
+
+def test_batches_are_capped_at_max_batch_size():
+    handler = RecordingHandler()
+    queue = make_queue(handler, max_batch_size=2)
+    jobs = [queue.submit({"prompt": f"p{index}", "style": "a"}) for index in range(5)]
+    queue.start()
+    try:
+        for job in jobs:
+            assert job.done.wait(5)
+    finally:
+        queue.stop()
+
+    assert [len(batch) for batch in handler.batches] == [2, 2, 1]
+
+
+def test_jobs_arriving_within_the_window_join_the_batch():
+    handler = RecordingHandler()
+    queue = make_queue(handler, batch_window_ms=300)
+    queue.start()
+    try:
+        first = queue.submit({"prompt": "first", "style": "a"})
+        second = queue.submit({"prompt": "second", "style": "a"})
+        assert first.done.wait(5) and second.done.wait(5)
+    finally:
+        queue.stop()
+
+    assert handler.batches == [["first", "second"]]
+
+
+def test_handler_errors_fail_every_job_in_the_batch():
+    def failing_handler(batch_params, progress):
+        raise RuntimeError("boom")
+
+    queue = make_queue(failing_handler)
+    jobs = [queue.submit({"prompt": f"p{index}", "style": "a"}) for index in range(2)]
+    queue.start()
+    try:
+        for job in jobs:
+            assert job.done.wait(5)
+    finally:
+        queue.stop()
+
+    assert [job.status for job in jobs] == ["failed", "failed"]
+    assert jobs[0].error == "boom"
+
+
+def test_duplicate_submissions_share_the_in_flight_job():
+    handler = RecordingHandler()
+    queue = make_queue(handler)
+    first = queue.submit({"prompt": "same", "style": "a"}, dedup_key="key")
+    second = queue.submit({"prompt": "same", "style": "a"}, dedup_key="key")
+    assert second is first
+    assert queue.stats()["pending"] == 1
+
+    queue.start()
+    try:
+        assert first.done.wait(5)
+    finally:
+        queue.stop()
+    assert handler.batches == [["same"]]
+
+    # A finished job is no longer in flight, so the key queues a new one
+    third = queue.submit({"prompt": "same", "style": "a"}, dedup_key="key")
+    assert third is not first
+
+
+def test_shared_job_is_cancelled_only_when_every_subscriber_cancels():
+    queue = make_queue(RecordingHandler())
+    job = queue.submit({"prompt": "same", "style": "a"}, dedup_key="key")
+    queue.submit({"prompt": "same", "style": "a"}, dedup_key="key")
+
+    queue.cancel(job.id)
+    assert job.status == "queued"
+    assert not job.cancel_requested
+
+    queue.cancel(job.id)
+    assert job.status == "cancelled"
+    assert queue.stats()["pending"] == 0
+
+
+def test_jobs_can_be_cancelled_while_their_batch_is_forming():
+    handler = RecordingHandler()
+    queue = make_queue(handler, batch_window_ms=500)
+    queue.start()
+    try:
+        job = queue.submit({"prompt": "dropped", "style": "a"})
+        deadline = time.time() + 5
+        while queue.stats()["pending"] and time.time() < deadline:
+            time.sleep(0.01)
+        # Taken off the pending queue but still waiting for the window to close
+        assert job.status == "queued"
+        assert queue.position(job) == 1
+
+        queue.cancel(job.id)
+        assert job.status == "cancelled"
+        assert job.done.is_set()
+
+        other = queue.submit({"prompt": "kept", "style": "a"})
+        assert other.done.wait(5)
+    finally:
+        queue.stop()
+
+    assert handler.batches == [["kept"]]
+
+
+def test_jobs_missing_from_a_short_result_list_fail():
+    def short_handler(batch_params, progress):
+        return [{"success": True, "prompt": batch_params[0]["prompt"]}]
+
+    queue = make_queue(short_handler)
+    jobs = [queue.submit({"prompt": f"p{index}", "style": "a"}) for index in range(3)]
+    queue.start()
+    try:
+        for job in jobs:
+            assert job.done.wait(5)
+    finally:
+        queue.stop()
+
+    assert [job.status for job in jobs] == ["completed", "failed", "failed"]
+    assert jobs[1].error == "No result returned for this job"
+    assert queue.stats()["running"] == 0
@@ -0,0 +1,95 @@
+import importlib.util
+
+import pytest
+
+import cpu_backend
+import quality_tiers
+from quality_tiers import TierPlanner
+
+
+def planner_with(*observations):
+    """Planner fed (steps, batch_size, denoise_seconds, total_seconds) for guided realistic/512 calls"""
+    planner = TierPlanner(smoothing=1.0, default_tier="standard")
+    for steps, batch_size, denoise_seconds, total_seconds in observations:
+        planner.observe("realistic", 512, 7.5, steps, batch_size, denoise_seconds, total_seconds)
+    return planner
+
+
+def test_default_tier_until_anything_is_measured():
+    assert TierPlanner(default_tier="standard").choose("realistic", 512, 5.0) == ("standard", None)
+
+
+def test_batched_timings_are_normalised_to_the_requested_batch_size():
+    # One image: 0.5s per step plus 1s overhead. A batch of four: 2s per step plus 4s
+    planner = planner_with((20, 1, 10.0, 11.0), (20, 4, 40.0, 44.0))
+
+    assert planner.predict("realistic", 512, "standard") == pytest.approx(20 * 0.5 + 1.0)
+    assert planner.predict("realistic", 512, "standard", batch_size=4) == pytest.approx(20 * 2.0 + 4.0)
+    # Unmeasured sizes scale from the nearest measured batch
+    assert planner.predict("realistic", 512, "standard", batch_size=2) == pytest.approx(20 * 1.0 + 2.0)
+
+
+def test_batched_observations_do_not_inflate_single_job_predictions():
+    planner = planner_with((20, 4, 40.0, 44.0))
+
+    assert planner.predict("realistic", 512, "standard") == pytest.approx(20 * 0.5 + 1.0)
+
+
+def test_budget_picks_the_best_tier_that_fits():
+    planner = planner_with((20, 1, 10.0, 11.0))
+
+    assert planner.choose("realistic", 512, 60.0)[0] == "high"
+    assert planner.choose("realistic", 512, 12.0) == ("standard", pytest.approx(11.0))
+    assert planner.choose("realistic", 512, 1.0)[0] == "draft"
+
+
+def test_queue_wait_counts_against_the_budget():
+    planner = planner_with((20, 1, 10.0, 11.0))
+    queued = [{"style": "realistic", "size": 512, "quality": "standard"}] * 2
+
+    wait = planner.estimate_wait(queued, workers=1, max_batch_size=4)
+
+    # The two queued jobs run as one batch of two
+    assert wait == pytest.approx(20 * 1.0 + 2.0)
+    assert planner.choose("realistic", 512, 12.0, queue_wait=wait)[0] == "draft"
+    assert planner.estimate_wait(queued, workers=2, max_batch_size=4) == pytest.approx(wait / 2)
+    assert planner.estimate_wait(queued, workers=1, max_batch_size=1) == pytest.approx(2 * 11.0)
+
+
+def test_unmeasured_queued_jobs_add_no_wait():
+    planner = planner_with((20, 1, 10.0, 11.0))
+
+    assert planner.estimate_wait([{"style": "anime", "size": 512, "quality": "standard"}], workers=1) == 0.0
+
+
+@pytest.fixture
+def lcm_weights(tmp_path, monkeypatch):
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(quality_tiers, "LCM_LORA_PATH", str(tmp_path))
+    monkeypatch.setattr(quality_tiers.torch.cuda, "is_available", lambda: False)
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name, *args: object() if name == "peft"
+                        else find_spec(name, *args))
+
+
+@pytest.mark.parametrize("requested, installed, available", [
+    ("auto", (), True),  # Nothing to export to: auto runs eagerly
+    ("auto", ("onnx",), False),
+    ("eager", ("onnx", "openvino"), True),
+    ("compile", ("compile",), False),
+])
+def test_lcm_follows_the_resolved_cpu_backend(lcm_weights, monkeypatch, requested, installed, available):
+    monkeypatch.setattr(cpu_backend, "_installed", lambda backend: backend == "eager" or backend in installed)
+    monkeypatch.setattr(cpu_backend, "backend", cpu_backend.CpuBackend(requested=requested))
+
+    assert quality_tiers.lcm_available() is available
+    assert (quality_tiers.resolve_tier("draft")["scheduler"] == "lcm") is available
+
+
+def test_lcm_becomes_available_when_the_exported_backend_fails(lcm_weights, monkeypatch):
+    monkeypatch.setattr(cpu_backend, "_installed", lambda backend: backend in ("onnx", "eager"))
+    backend = cpu_backend.CpuBackend(requested="auto")
+    monkeypatch.setattr(cpu_backend, "backend", backend)
+    backend.failures["onnx"] = "export failed"
+
+    assert backend.name == "eager"
+    assert quality_tiers.lcm_available() is True
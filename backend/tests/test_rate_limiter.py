@@ -0,0 +1,61 @@
+import pytest
+
+import rate_limiter as rate_limiter_module
+from rate_limiter import MemoryStore, RateLimiter, SQLiteStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteStore(str(tmp_path / "rate_limits.db"))
+    return MemoryStore()
+
+
+def test_burst_then_reject_with_retry_after(store):
+    results = [store.consume("generate:client", 3, 0.5, now=100.0) for _ in range(4)]
+
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+    assert results[0][1] == 0.0
+    assert results[3][1] == pytest.approx(2.0)
+
+
+def test_tokens_refill_over_time(store):
+    for _ in range(2):
+        store.consume("generate:client", 2, 0.5, now=100.0)
+    assert store.consume("generate:client", 2, 0.5, now=101.0) == (False, pytest.approx(1.0))
+
+    # Rejected attempts take no token, so one full token has refilled by 102s
+    assert store.consume("generate:client", 2, 0.5, now=102.0)[0]
+    assert not store.consume("generate:client", 2, 0.5, now=102.0)[0]
+
+
+def test_buckets_are_per_key(store):
+    assert store.consume("generate:a", 1, 0.1, now=100.0)[0]
+    assert not store.consume("generate:a", 1, 0.1, now=100.0)[0]
+    assert store.consume("generate:b", 1, 0.1, now=100.0)[0]
+    assert store.consume("transcribe:a", 1, 0.1, now=100.0)[0]
+
+
+def test_refilled_buckets_are_dropped(store):
+    store.consume("generate:a", 2, 1.0, now=100.0)
+    store.consume("generate:b", 2, 1.0, now=100.0)
+    assert store.size() == 2
+
+    # Both buckets are full again by 102s; the next call forgets them
+    store.consume("generate:c", 2, 1.0, now=200.0)
+    assert store.size() == 1
+
+
+def test_limiter_counts_rejections(store, monkeypatch):
+    monkeypatch.setattr(rate_limiter_module.time, "time", lambda: 100.0)
+    limiter = RateLimiter(store=store, limits={"generate": (1, 1 / 60)})
+
+    assert limiter.check("client", "generate") == (True, 0.0)
+    allowed, retry_after = limiter.check("client", "generate")
+
+    assert not allowed
+    assert retry_after == pytest.approx(60.0)
+    stats = limiter.stats()
+    assert stats["rejections"] == 1
+    assert stats["backend"] == type(store).__name__
+    assert stats["limits"]["generate"] == {"burst": 1, "per_minute": pytest.approx(1.0)}
@@ -0,0 +1,42 @@
+from quality_tiers import resolve_tier
+from result_cache import make_cache_key, seed_from_key
+
+SETTINGS = ("a red fox", "blurry", "realistic", 20, 7.5, 512)
+
+# sha256 of the sorted-keys JSON of SETTINGS, seed 42 and format "png". Cached
+# files and derived seeds depend on it: changing the key format orphans the
+# cache and changes the images of requests without a seed.
+KNOWN_KEY = "4b2e2ccc92ca6408ce4851a2712b683774ac3eff220a722a839855dc2f48dfeb"
+
+
+def test_key_format_is_stable():
+    assert make_cache_key(*SETTINGS, 42, "png") == KNOWN_KEY
+
+
+def test_key_is_deterministic_and_covers_every_input():
+    key = make_cache_key(*SETTINGS, 42, "png")
+    assert make_cache_key(*SETTINGS, 42, "png") == key
+
+    variants = [
+        make_cache_key("a blue fox", *SETTINGS[1:], 42, "png"),
+        make_cache_key(*SETTINGS[:3], 30, *SETTINGS[4:], 42, "png"),
+        make_cache_key(*SETTINGS, 43, "png"),
+        make_cache_key(*SETTINGS, 42, "webp"),
+        make_cache_key(*SETTINGS, 42, "png", scheduler="euler_a"),
+        make_cache_key(*SETTINGS, 42, "png", refine=True),
+    ]
+    assert key not in variants
+    assert len(set(variants)) == len(variants)
+
+
+def test_default_tier_keeps_keys_and_seeds_from_before_tiers():
+    tier = resolve_tier("standard")
+
+    assert make_cache_key(*SETTINGS, 42, "png", tier["scheduler"]) == KNOWN_KEY
+    assert make_cache_key(*SETTINGS, 42, "png", refine=False) == KNOWN_KEY
+
+
+def test_derived_seed_is_stable():
+    assert seed_from_key(*SETTINGS) == seed_from_key(*SETTINGS)
+    assert seed_from_key(*SETTINGS) == int(make_cache_key(*SETTINGS, None)[:8], 16) & 0x7FFFFFFF
+    assert 0 <= seed_from_key(*SETTINGS) < 2 ** 31
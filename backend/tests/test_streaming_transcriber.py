@@ -0,0 +1,59 @@
+from concurrent.futures import Future
+
+import numpy as np
+
+from streaming_transcriber import StreamingTranscriber
+
+
+def completed(result=None, error=None):
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+    return future
+
+
+def test_failed_segment_does_not_fail_the_snapshot():
+    session = StreamingTranscriber(speech_service=None).create_session()
+    ok = {"text": "hello there", "language": "en", "confidence": 0.9, "success": True}
+    session.segments = [
+        {"index": 0, "start": 0.0, "end": 1.0, "future": completed(error=RuntimeError("decode failed"))},
+        {"index": 1, "start": 1.0, "end": 2.0, "future": completed(ok)},
+    ]
+
+    snapshot = session.snapshot(wait=True)
+
+    first, second = snapshot["segments"]
+    assert first["success"] is False
+    assert first["error"] == "decode failed"
+    assert second["success"] is True
+    assert snapshot["text"] == "hello there"
+    assert snapshot["pending_segments"] == 0
+
+
+class QueueingSpeechService:
+    """Records the segments handed to submit() and resolves them immediately"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, audio):
+        self.submitted.append(len(audio))
+        return completed({"text": f"segment {len(self.submitted)}", "language": "en",
+                          "confidence": 0.5, "success": True})
+
+
+def test_segments_are_submitted_to_the_speech_service():
+    speech_service = QueueingSpeechService()
+    session = StreamingTranscriber(speech_service).create_session()
+    speech = np.full(16000 * 2, 0.5, dtype=np.float32)
+    silence = np.zeros(16000, dtype=np.float32)
+
+    session.add_audio(np.concatenate([speech, silence, speech]))
+    session.finish()
+    snapshot = session.snapshot(wait=True)
+
+    assert len(speech_service.submitted) == 2
+    assert snapshot["text"] == "segment 1 segment 2"
+    assert snapshot["finished"]
@@ -0,0 +1,60 @@
+import pytest
+
+from config import DEFAULT_STYLE
+from style_router import StyleRouter
+
+
+@pytest.fixture
+def router():
+    return StyleRouter()
+
+
+def test_keyword_inside_another_word_does_not_match(router):
+    # "party" contains "art", which must not pull it towards dreamshaper
+    decision = router.classify("friends at a birthday party")
+
+    assert decision["scores"]["dreamshaper"] == 0
+    assert decision["style"] == DEFAULT_STYLE
+    assert decision["method"] == "default"
+
+
+def test_cartoon_routes_to_dreamshaper(router):
+    decision = router.classify("a Cartoon fox in the snow")
+
+    assert decision["style"] == "dreamshaper"
+    assert decision["method"] == "keywords"
+    assert decision["matches"]["dreamshaper"] == ["cartoon (+3)"]
+
+
+@pytest.mark.parametrize("prompt", ["一只卡通猫", "जादुई जंगल", "un dessin animé de chat"])
+def test_non_english_keywords_match(router, prompt):
+    assert router.classify(prompt)["style"] == "dreamshaper"
+
+
+def test_phrase_scores_itself_and_the_words_it_contains(router):
+    scores, found = router.match("old   film photography of a harbour")
+
+    assert scores["realistic_vision"] == 2 + 2 + 3
+    assert sorted(found["realistic_vision"]) == ["film (+2)", "film photography (+2)", "photography (+3)"]
+
+
+def test_heavier_keywords_decide_the_style(router):
+    # cartoon (+3) outweighs photo (+2)
+    decision = router.classify("a cartoon photo")
+
+    assert decision["scores"] == {"dreamshaper": 3, "realistic_vision": 2}
+    assert decision["style"] == "dreamshaper"
+
+
+@pytest.mark.parametrize("prompt", ["anime photography", "a quiet morning"])
+def test_ties_and_misses_fall_back_to_the_default(router, prompt):
+    decision = router.classify(prompt)
+
+    assert decision["style"] == DEFAULT_STYLE
+    assert decision["method"] == "default"
+
+
+def test_batch_matches_single_prompt_routing(router):
+    prompts = ["a cartoon photo", "cinematic portrait", "anime photography", "a quiet morning", "魔法の森"]
+
+    assert router.classify_batch(prompts) == [router.classify(prompt) for prompt in prompts]
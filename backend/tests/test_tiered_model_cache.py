@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+from tiered_model_cache import DEVICE_TIER, WARM_TIER, TieredModelCache
+
+# Parameter bytes of a fp32 Stable Diffusion 1.5 pipeline
+FP32_BYTES = {"unet": 859_520_964 * 4, "vae": 83_653_863 * 4, "text_encoder": 123_060_480 * 4}
+
+
+class FakeModule:
+    def __init__(self, footprint_bytes):
+        self.footprint_bytes = footprint_bytes
+        self.device = "cpu"
+
+    def to(self, device):
+        self.device = device
+        return self
+
+
+class FakeLoader:
+    def __init__(self):
+        self.loads = []
+        self.unloads = []
+
+    def load(self, style, device):
+        self.loads.append(style)
+        return SimpleNamespace(**{name: FakeModule(size) for name, size in FP32_BYTES.items()})
+
+    def unload(self, pipe, style, keep):
+        self.unloads.append(style)
+
+
+def cpu_cache(loader):
+    cache = TieredModelCache(loader.load, loader.unload, lambda style: sum(FP32_BYTES.values()),
+                             lambda style: set(), device="cpu")
+    # Run background rebalancing inline so every step settles before the next
+    cache.executor.submit = lambda fn: fn()
+    return cache
+
+
+def test_alternating_two_styles_on_cpu_loads_each_once():
+    loader = FakeLoader()
+    cache = cpu_cache(loader)
+
+    for style in ["dreamshaper", "realistic_vision"] * 3:
+        cache.get(style)
+
+    assert loader.loads == ["dreamshaper", "realistic_vision"]
+    assert loader.unloads == []
+    tiers = cache.stats()["tiers"]
+    assert tiers[DEVICE_TIER]["styles"] == ["realistic_vision"]
+    assert tiers[WARM_TIER]["styles"] == ["dreamshaper"]
+
+
+def test_third_style_on_cpu_evicts_before_loading():
+    loader = FakeLoader()
+    cache = cpu_cache(loader)
+    cache.get("dreamshaper")
+    cache.get("realistic_vision")
+
+    cache.get("anime")
+
+    assert loader.unloads == ["dreamshaper"]
+    assert set(cache.resident()) == {"realistic_vision", "anime"}
+    assert cache.tier_bytes(DEVICE_TIER) + cache.tier_bytes(WARM_TIER) <= sum(cache.budgets.values())
@@ -0,0 +1,106 @@
+import io
+import shutil
+import subprocess
+import wave
+
+import numpy as np
+import pytest
+
+from speech_service import SpeechService
+from transcription_cache import ENTRY_OVERHEAD_BYTES, TranscriptionCache, fingerprint_audio
+from transcription_scheduler import TranscriptionScheduler
+
+
+def tone(frequency=440.0, seconds=1.0):
+    times = np.arange(int(16000 * seconds)) / 16000
+    return (0.5 * np.sin(2 * np.pi * frequency * times)).astype(np.float32)
+
+
+def to_pcm16(audio):
+    return (np.clip(audio, -1, 1) * 32767).astype("<i2")
+
+
+def wav_bytes(audio):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(to_pcm16(audio).tobytes())
+    return buffer.getvalue()
+
+
+def result(text):
+    return {"text": text, "language": "en", "confidence": -0.2, "success": True}
+
+
+def test_padded_lossless_copy_has_the_same_fingerprint():
+    # Uploads are decoded from 16-bit PCM; another lossless encoder may add silent padding
+    decoded = to_pcm16(tone()).astype(np.float32) / 32768.0
+    padded = np.concatenate([np.zeros(1600, dtype=np.float32), decoded, np.zeros(800, dtype=np.float32)])
+
+    assert fingerprint_audio(padded) == fingerprint_audio(decoded)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_wav_to_flac_round_trip_hits():
+    service = SpeechService()
+    wav = wav_bytes(tone())
+    flac = subprocess.run(["ffmpeg", "-nostdin", "-f", "wav", "-i", "pipe:0", "-f", "flac", "pipe:1"],
+                          input=wav, capture_output=True, check=True).stdout
+
+    assert fingerprint_audio(service.decode_audio(flac, "flac")) == \
+        fingerprint_audio(service.decode_audio(wav, "wav"))
+
+
+def test_different_audio_misses():
+    cache = TranscriptionCache()
+    cache.put(fingerprint_audio(tone(440.0)), result("a tone"))
+
+    assert cache.get(fingerprint_audio(tone(880.0))) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entries_are_evicted_within_the_budget():
+    entry_bytes = 64 + 2 + 1 + ENTRY_OVERHEAD_BYTES  # 64 char key, "en", one char of text
+    cache = TranscriptionCache(max_bytes=2 * entry_bytes)
+    first, second, third = ("a" * 64, "b" * 64, "c" * 64)
+    cache.put(first, result("1"))
+    cache.put(second, result("2"))
+    assert cache.get(first)["text"] == "1"  # Now the most recently used
+
+    cache.put(third, result("3"))
+
+    assert cache.get(second) is None
+    assert cache.get(first)["text"] == "1"
+    assert cache.get(third)["text"] == "3"
+    assert cache.stats()["size_kb"] * 1024 <= 2 * entry_bytes
+
+
+def test_failed_transcriptions_are_not_cached():
+    cache = TranscriptionCache()
+    cache.put("key", {"text": "", "language": "en", "confidence": 0.0, "success": False})
+
+    assert cache.get("key") is None
+
+
+def test_repeated_upload_is_answered_from_the_cache(monkeypatch):
+    service = SpeechService()
+    batches = []
+
+    def transcribe_batch(audios):
+        batches.append(len(audios))
+        return [{"text": "hello world", "language": "de", "confidence": -0.3, "success": True}
+                for _ in audios]
+
+    service.scheduler = TranscriptionScheduler(transcribe_batch, batch_window_ms=0)
+    audio = tone()
+    monkeypatch.setattr(service, "decode_audio", lambda data, audio_format: audio.copy())
+
+    first = service.process_audio(b"upload", "wav")
+    second = service.process_audio(b"upload", "wav")
+
+    assert batches == [1]
+    assert (second["text"], second["language"], second["confidence"]) == ("hello world", "de", -0.3)
+    assert second["cached"] is True
+    assert "cached" not in first
@@ -0,0 +1,103 @@
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import pytest
+
+import speech_service as speech_module
+from speech_service import SpeechService
+from transcription_scheduler import TranscriptionScheduler
+
+
+def clip(value, seconds=1):
+    return np.full(16000 * seconds, value, dtype=np.float32)
+
+
+def decoded(text, avg_logprob=-0.2, compression_ratio=1.2, no_speech_prob=0.0):
+    return SimpleNamespace(text=text, avg_logprob=avg_logprob, compression_ratio=compression_ratio,
+                           no_speech_prob=no_speech_prob, language="en")
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """SpeechService with a loaded (mock) model and Whisper's batched path stubbed"""
+    service = SpeechService()
+    service.model = mock.MagicMock()
+    service.model_loaded = True
+    monkeypatch.setattr(speech_module.torch, "stack", mock.MagicMock())
+    monkeypatch.setattr(speech_module.whisper, "log_mel_spectrogram", mock.MagicMock())
+    monkeypatch.setattr(speech_module.whisper, "pad_or_trim", mock.MagicMock())
+    monkeypatch.setattr(speech_module.whisper, "DecodingOptions", mock.MagicMock())
+    monkeypatch.setattr(speech_module.torch, "from_numpy", mock.MagicMock())
+    fallback_calls = []
+
+    def transcribe_array(audio):
+        fallback_calls.append(float(audio[0]))
+        return {"text": f"fallback {audio[0]:.1f}", "confidence": -0.1, "language": "en", "success": True}
+
+    monkeypatch.setattr(service, "transcribe_array", transcribe_array)
+    service.fallback_calls = fallback_calls
+    return service
+
+
+def test_scheduler_groups_concurrent_requests():
+    batches = []
+    release = threading.Event()
+
+    def handler(audios):
+        release.wait(5)
+        batches.append(len(audios))
+        return [{"text": str(audio), "success": True} for audio in audios]
+
+    scheduler = TranscriptionScheduler(handler, max_batch_size=4, batch_window_ms=200)
+    futures = [scheduler.submit(index) for index in range(3)]
+    release.set()
+
+    assert [future.result(5)["text"] for future in futures] == ["0", "1", "2"]
+    assert batches == [3]
+    assert scheduler.stats()["average_batch_size"] == 3
+
+
+def test_scheduler_fails_every_request_in_a_failed_batch():
+    def handler(audios):
+        raise RuntimeError("model crashed")
+
+    scheduler = TranscriptionScheduler(handler, max_batch_size=4, batch_window_ms=50)
+    futures = [scheduler.submit(index) for index in range(2)]
+
+    for future in futures:
+        with pytest.raises(RuntimeError, match="model crashed"):
+            future.result(5)
+
+
+def test_batch_decode_failure_falls_back_per_clip(service, monkeypatch):
+    monkeypatch.setattr(speech_module.whisper, "decode", mock.MagicMock(side_effect=RuntimeError("oom")))
+
+    results = service.transcribe_batch([clip(0.1), clip(0.2)])
+
+    assert [result["text"] for result in results] == ["fallback 0.1", "fallback 0.2"]
+    assert service.fallback_calls == pytest.approx([0.1, 0.2])
+
+
+def test_unreliable_clips_are_retried_individually(service, monkeypatch):
+    monkeypatch.setattr(speech_module.whisper, "decode", mock.MagicMock(return_value=[
+        decoded(" hello "),
+        decoded("la la la la", compression_ratio=3.0),
+        decoded("", avg_logprob=-1.5, no_speech_prob=0.9),
+    ]))
+
+    results = service.transcribe_batch([clip(0.1), clip(0.2), clip(0.3)])
+
+    assert [result["text"] for result in results] == ["hello", "fallback 0.2", ""]
+    assert service.fallback_calls == pytest.approx([0.2])
+
+
+def test_clips_longer_than_the_window_skip_the_batch(service, monkeypatch):
+    decode = mock.MagicMock(return_value=[decoded("short")])
+    monkeypatch.setattr(speech_module.whisper, "decode", decode)
+
+    results = service.transcribe_batch([clip(0.1), clip(0.4, seconds=31)])
+
+    assert [result["text"] for result in results] == ["short", "fallback 0.4"]
+    assert decode.call_count == 1
@@ -0,0 +1,55 @@
+import queue
+
+from worker_pool import InferenceWorkerPool
+
+
+class FakeProcess:
+    pid = 1
+
+    def is_alive(self):
+        return True
+
+
+def make_pool(num_workers=2):
+    """A pool whose workers are never spawned; tasks stay in plain queues"""
+    pool = InferenceWorkerPool(num_workers=num_workers, threads_per_worker=1)
+    for handle in pool.workers:
+        handle.process = FakeProcess()
+        handle.task_queue = queue.Queue()
+    return pool
+
+
+def sent_tasks(handle):
+    return [task[1:] for task in list(handle.task_queue.queue)]
+
+
+def test_prefetch_goes_to_the_next_idle_worker():
+    pool = make_pool()
+    pool.idle.put(1)
+    pool.idle.put(0)
+
+    pool.prefetch("anime")
+
+    assert sent_tasks(pool.workers[1]) == [("prefetch", {"style": "anime"})]
+    assert sent_tasks(pool.workers[0]) == []
+
+
+def test_prefetch_skips_a_worker_that_has_the_style():
+    pool = make_pool()
+    pool.idle.put(0)
+    pool.workers[0].info = {"models_loaded": ["anime"]}
+
+    pool.prefetch("anime")
+
+    assert sent_tasks(pool.workers[0]) == []
+
+
+def test_prefetch_with_every_worker_busy_picks_the_longest_running():
+    pool = make_pool()
+    pool.workers[0].busy_since = 200.0
+    pool.workers[1].busy_since = 100.0
+
+    pool.prefetch("anime")
+
+    assert sent_tasks(pool.workers[1]) == [("prefetch", {"style": "anime"})]
+    assert sent_tasks(pool.workers[0]) == []
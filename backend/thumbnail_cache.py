@@ -0,0 +1,124 @@
+"""
+Bounded on-disk LRU cache of resized variants of generated images
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+from PIL import Image
+from config import *
+from image_encoder import file_extension, save_image
+
+logger = logging.getLogger(__name__)
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir=THUMBNAIL_CACHE_DIR, max_bytes=THUMBNAIL_CACHE_MAX_BYTES,
+                 output_format=THUMBNAIL_FORMAT):
+        """
+        Initialize the cache and index any variants already on disk
+
+        Args:
+            cache_dir: Directory holding the resized variants
+            max_bytes: Byte budget for variants before LRU eviction
+            output_format: Image format variants are encoded in (see image_encoder.OUTPUT_FORMATS)
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.output_format = output_format
+        self.entries = OrderedDict()  # variant filename -> size in bytes, oldest first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.variant_locks = {}  # variant filename -> lock held while it is rendered
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the in-memory LRU order from the files on disk"""
+        extension = f".{file_extension(self.output_format)}"
+        found = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(extension):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, name))
+            found.append((stat.st_mtime, name, stat.st_size))
+
+        for _, name, size in sorted(found):
+            self.entries[name] = size
+            self.total_bytes += size
+
+    def variant_name(self, filename, size):
+        """Filename of the size-pixel variant of filename"""
+        stem = os.path.splitext(filename)[0]
+        return f"{stem}_{size}.{file_extension(self.output_format)}"
+
+    def get(self, source_path, size):
+        """
+        Get the path of a variant, rendering it on a miss
+
+        Args:
+            source_path: Full-size image to resize
+            size: Longest side of the variant in pixels
+
+        Returns:
+            str: Path of the variant inside cache_dir
+        """
+        name = self.variant_name(os.path.basename(source_path), size)
+        path = os.path.join(self.cache_dir, name)
+        with self.lock:
+            if name in self.entries:
+                self.entries.move_to_end(name)
+                self.hits += 1
+                return path
+            # Concurrent requests for the same variant render it once
+            variant_lock = self.variant_locks.setdefault(name, threading.Lock())
+
+        with variant_lock:
+            with self.lock:
+                if name in self.entries:
+                    self.hits += 1
+                    return path
+                self.misses += 1
+
+            try:
+                with Image.open(source_path) as image:
+                    image.thumbnail((size, size), Image.LANCZOS)
+                    written = save_image(image, path, self.output_format)
+            except Exception:
+                with self.lock:
+                    self.variant_locks.pop(name, None)
+                raise
+
+            with self.lock:
+                self.variant_locks.pop(name, None)
+                self.entries[name] = written
+                self.total_bytes += written
+                while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                    oldest = next(iter(self.entries))
+                    self._remove(oldest)
+                    logger.info(f"Evicted thumbnail: {oldest}")
+        return path
+
+    def _remove(self, name):
+        """Delete a variant from the index and disk (caller holds the lock)"""
+        self.total_bytes -= self.entries.pop(name, 0)
+        try:
+            os.remove(os.path.join(self.cache_dir, name))
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        """Get cache statistics"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self.entries),
+                "size_mb": self.total_bytes / 1024 / 1024,
+                "max_size_mb": self.max_bytes / 1024 / 1024,
+            }
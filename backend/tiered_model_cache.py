@@ -0,0 +1,281 @@
+"""
+Tiered residency cache for image pipelines: device, warm CPU RAM, disk
+
+The device tier holds pipelines ready to run. Pipelines demoted from it are
+parked in CPU RAM (the warm tier), so switching back costs a tensor copy
+instead of a load from disk. Each tier has a byte budget measured from the
+pipelines' actual parameters; components shared between styles are counted
+once. Without a GPU both tiers are the same RAM and share one combined budget. Demotions that are not needed to make room run on a background thread,
+and prefetch() loads a style into the warm tier ahead of its first request.
+"""
+
+import gc
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import torch
+from config import *
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEVICE_TIER = "device"
+WARM_TIER = "warm"
+
+# Pipeline components that hold weights and move between tiers
+MOVABLE_COMPONENTS = ("unet", "vae", "text_encoder")
+
+
+def module_bytes(module):
+    """Bytes of a module's parameters and buffers"""
+    # Modules running in an exported runtime report the size of their export
+    footprint = getattr(module, "footprint_bytes", None)
+    if footprint is not None:
+        return footprint
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+def _modules(pipe):
+    return [getattr(pipe, name) for name in MOVABLE_COMPONENTS if getattr(pipe, name, None) is not None]
+
+
+class _Entry:
+    def __init__(self, pipe, tier):
+        self.pipe = pipe
+        self.tier = tier
+        self.last_used = time.time()
+
+
+class TieredModelCache:
+    def __init__(self, loader, unloader, estimate_bytes, component_keys, device=None,
+                 device_budget_mb=DEVICE_TIER_MAX_MB, warm_budget_mb=WARM_TIER_MAX_MB,
+                 idle_timeout=MODEL_TIMEOUT, pinned=PRELOAD_MODELS):
+        """
+        Initialize an empty cache
+
+        Args:
+            loader: loader(style, device) -> pipeline, loading from disk
+            unloader: unloader(pipe, style, keep) dropping a pipeline (keep: components to retain)
+            estimate_bytes: estimate_bytes(style) -> expected footprint of a style not yet measured
+            component_keys: component_keys(style) -> components to keep while evicting to make room for it
+            device: Inference device (defaults to cuda when available)
+            device_budget_mb: Budget for pipelines in the device tier
+            warm_budget_mb: Budget for pipelines parked in CPU RAM
+            idle_timeout: Seconds before an idle pipeline is demoted from the device tier
+            pinned: Styles never demoted for being idle
+        """
+        self.loader = loader
+        self.unloader = unloader
+        self.estimate_bytes = estimate_bytes
+        self.component_keys = component_keys
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.budgets = {DEVICE_TIER: device_budget_mb * 1024 * 1024, WARM_TIER: warm_budget_mb * 1024 * 1024}
+        self.idle_timeout = idle_timeout
+        self.pinned = set(pinned)
+        self.entries = OrderedDict()  # style -> _Entry, least recently used first
+        self.measured = {}  # style -> footprint in bytes from its last load
+        self.pending = {}  # style -> Future of a background prefetch
+        self.lock = threading.RLock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-tiers")
+
+    def _tier_modules(self, tier):
+        """Unique modules held by a tier; modules shared with the device tier count there"""
+        device_modules = {id(module): module for entry in self.entries.values() if entry.tier == DEVICE_TIER
+                          for module in _modules(entry.pipe)}
+        if tier == DEVICE_TIER:
+            return device_modules
+        return {id(module): module for entry in self.entries.values() if entry.tier == WARM_TIER
+                for module in _modules(entry.pipe) if id(module) not in device_modules}
+
+    def tier_bytes(self, tier):
+        """Bytes used by a tier"""
+        with self.lock:
+            return sum(module_bytes(module) for module in self._tier_modules(tier).values())
+
+    def _footprint(self, style):
+        """Bytes a style would add to a tier (its modules not already resident there)"""
+        entry = self.entries.get(style)
+        if entry is None:
+            return self.measured.get(style) or self.estimate_bytes(style)
+        resident = self._tier_modules(DEVICE_TIER)
+        return sum(module_bytes(module) for module in _modules(entry.pipe) if id(module) not in resident)
+
+    def _move(self, entry, style, tier):
+        """Move a pipeline's modules between the device and CPU RAM (caller holds the lock)"""
+        if tier == DEVICE_TIER:
+            for module in _modules(entry.pipe):
+                module.to(self.device)
+        else:
+            # Modules shared with another pipeline on the device stay there
+            shared = {id(module) for other_style, other in self.entries.items()
+                      if other_style != style and other.tier == DEVICE_TIER for module in _modules(other.pipe)}
+            for module in _modules(entry.pipe):
+                if id(module) not in shared:
+                    module.to("cpu")
+        entry.tier = tier
+
+    def _demote(self, style, keep=()):
+        """Move a device-tier pipeline to the warm tier, evicting warm pipelines over budget"""
+        entry = self.entries[style]
+        start_time = time.perf_counter()
+        self._move(entry, style, WARM_TIER)
+        metrics.increment("model_swaps_total", model=style, action="demote")
+        logger.info(f"Demoted {style} to CPU RAM in {time.perf_counter() - start_time:.2f}s")
+        if self.device == "cuda":
+            torch.cuda.empty_cache()
+        self._enforce_warm_budget(keep)
+
+    def _warm_over_budget(self, incoming=0):
+        """Whether the warm tier, plus incoming bytes, is over its budget"""
+        if self.device == "cpu":
+            # Demoting frees no memory on CPU, so both tiers count against one budget
+            used = self.tier_bytes(DEVICE_TIER) + self.tier_bytes(WARM_TIER)
+            return used + incoming > self.budgets[DEVICE_TIER] + self.budgets[WARM_TIER]
+        return self.tier_bytes(WARM_TIER) + incoming > self.budgets[WARM_TIER]
+
+    def _evict(self, style, keep=()):
+        """Drop a pipeline entirely; its next use loads it from disk"""
+        entry = self.entries.pop(style)
+        metrics.increment("model_swaps_total", model=style, action="evict")
+        logger.info(f"Evicting {style} from memory")
+        self.unloader(entry.pipe, style, keep)
+
+    def _enforce_warm_budget(self, keep=(), incoming=0):
+        while self._warm_over_budget(incoming):
+            warm = [style for style, entry in self.entries.items() if entry.tier == WARM_TIER]
+            if not warm:
+                break
+            self._evict(warm[0], keep)
+
+    def _make_room(self, style, needed, keep=()):
+        """Synchronously demote least recently used device pipelines until needed bytes fit"""
+        while self.tier_bytes(DEVICE_TIER) + needed > self.budgets[DEVICE_TIER]:
+            candidates = [other for other, entry in self.entries.items()
+                          if other != style and entry.tier == DEVICE_TIER]
+            if not candidates:
+                break
+            self._demote(candidates[0], keep)
+
+    def get(self, style):
+        """
+        Get a pipeline on the inference device, promoting or loading it as needed
+
+        Callers are expected to serialize get() (ImageService holds its
+        generation lock); loads from disk run without the cache lock so
+        stats() stays responsive.
+
+        Returns:
+            StableDiffusionPipeline: Pipeline in the device tier
+        """
+        pending = self.pending.get(style)
+        if pending is not None:
+            pending.result()
+
+        with self.lock:
+            entry = self.entries.get(style)
+            if entry is not None and entry.tier == DEVICE_TIER:
+                self._touch(style)
+                return entry.pipe
+
+            keep = self.component_keys(style) if entry is None else ()
+            needed = self._footprint(style)
+            self._make_room(style, needed, keep)
+            if entry is None and self.device == "cpu":
+                # The load lands in the same RAM the warm tier uses
+                self._enforce_warm_budget(keep, needed)
+            if entry is not None:
+                start_time = time.perf_counter()
+                self._move(entry, style, DEVICE_TIER)
+                metrics.increment("model_swaps_total", model=style, action="promote")
+                logger.info(f"Promoted {style} from CPU RAM in {time.perf_counter() - start_time:.2f}s")
+                self._touch(style)
+
+        if entry is None:
+            metrics.increment("model_swaps_total", model=style, action="load")
+            with metrics.stage("model_load"):
+                pipe = self.loader(style, self.device)
+            with self.lock:
+                entry = self.entries[style] = _Entry(pipe, DEVICE_TIER)
+                self.measured[style] = sum(module_bytes(module) for module in _modules(pipe))
+                self._touch(style)
+
+        # Estimates can be off; settle budgets without holding up this request
+        self.executor.submit(self.rebalance)
+        return entry.pipe
+
+    def _touch(self, style):
+        self.entries[style].last_used = time.time()
+        self.entries.move_to_end(style)
+
+    def prefetch(self, style):
+        """Load a style into the warm tier in the background, if it is not resident"""
+        with self.lock:
+            if style in self.entries or style in self.pending:
+                return
+            self.pending[style] = self.executor.submit(self._prefetch, style)
+
+    def _prefetch(self, style):
+        try:
+            with self.lock:
+                if style in self.entries:
+                    return
+            metrics.increment("model_swaps_total", model=style, action="prefetch")
+            with metrics.stage("model_load"):
+                pipe = self.loader(style, "cpu")
+            with self.lock:
+                self.entries[style] = _Entry(pipe, WARM_TIER)
+                self.measured[style] = sum(module_bytes(module) for module in _modules(pipe))
+                # Never evict what was just fetched for an upcoming request
+                warm = [other for other, entry in self.entries.items()
+                        if other != style and entry.tier == WARM_TIER]
+                while warm and self._warm_over_budget():
+                    self._evict(warm.pop(0))
+        except Exception as e:
+            logger.error(f"Error prefetching {style}: {e}")
+        finally:
+            with self.lock:
+                self.pending.pop(style, None)
+
+    def rebalance(self):
+        """Demote idle or over-budget device pipelines and evict warm ones over budget"""
+        with self.lock:
+            now = time.time()
+            device_styles = [style for style, entry in self.entries.items() if entry.tier == DEVICE_TIER]
+            # The most recently used pipeline may be running; it is never demoted here
+            for style in device_styles[:-1]:
+                entry = self.entries[style]
+                over_budget = self.tier_bytes(DEVICE_TIER) > self.budgets[DEVICE_TIER]
+                idle = style not in self.pinned and now - entry.last_used > self.idle_timeout
+                if over_budget or idle:
+                    self._demote(style)
+            self._enforce_warm_budget()
+        gc.collect()
+
+    def discard(self, style):
+        """Drop a style from every tier (e.g. after a failed generation)"""
+        with self.lock:
+            if style in self.entries:
+                self._evict(style)
+
+    def resident(self):
+        """Pipelines in memory, by style"""
+        with self.lock:
+            return {style: entry.pipe for style, entry in self.entries.items()}
+
+    def stats(self):
+        """Get tier usage and the tier of each resident style"""
+        with self.lock:
+            return {
+                "device": self.device,
+                "tiers": {
+                    tier: {
+                        "used_mb": self.tier_bytes(tier) / 1024 / 1024,
+                        "budget_mb": budget / 1024 / 1024,
+                        "styles": [style for style, entry in self.entries.items() if entry.tier == tier],
+                    } for tier, budget in self.budgets.items()
+                },
+                "footprint_mb": {style: size / 1024 / 1024 for style, size in self.measured.items()},
+            }
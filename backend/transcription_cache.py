@@ -0,0 +1,98 @@
+"""
+LRU cache of transcriptions keyed by a fingerprint of the decoded audio
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import *
+
+logger = logging.getLogger(__name__)
+
+# Approximate per-entry bookkeeping cost on top of the stored strings
+ENTRY_OVERHEAD_BYTES = 256
+
+
+def fingerprint_audio(audio):
+    """
+    Hash decoded PCM rather than container bytes
+
+    Samples are trimmed of near-silent edges (encoder padding differs between
+    containers) and quantized to 12 bits before hashing, so lossless copies of
+    the same recording (e.g. WAV and FLAC, with or without padding) map to the
+    same key. Lossy re-encodes (MP3, Opus) and resampled copies change the
+    samples themselves and miss.
+
+    Args:
+        audio: 16 kHz mono float32 samples
+
+    Returns:
+        str: Hex digest identifying the audio content
+    """
+    loud = np.flatnonzero(np.abs(audio) > TRANSCRIPTION_CACHE_TRIM_LEVEL)
+    if len(loud):
+        audio = audio[loud[0]:loud[-1] + 1]
+    quantized = np.round(np.clip(audio, -1.0, 1.0) * 2047).astype("<i2")
+    return hashlib.sha256(quantized.tobytes()).hexdigest()
+
+
+class TranscriptionCache:
+    def __init__(self, max_bytes=TRANSCRIPTION_CACHE_MAX_BYTES):
+        """
+        Initialize the cache
+
+        Args:
+            max_bytes: Memory budget for cached entries before LRU eviction
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # fingerprint -> (result, size in bytes)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Get a cached result (text, language, confidence), or None on a miss"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[0])
+
+    def put(self, key, result):
+        """Store a successful transcription result"""
+        if not result.get("success"):
+            return
+        cached = {
+            "text": result["text"],
+            "language": result["language"],
+            "confidence": result["confidence"],
+            "success": True,
+        }
+        size = len(cached["text"].encode("utf-8")) + len(cached["language"]) + len(key) + ENTRY_OVERHEAD_BYTES
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (cached, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and self.entries:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def stats(self):
+        """Get cache statistics"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self.entries),
+                "size_kb": self.total_bytes / 1024,
+                "max_size_kb": self.max_bytes / 1024,
+            }
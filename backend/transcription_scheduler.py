@@ -0,0 +1,93 @@
+"""
+Scheduler that groups concurrent transcription requests into batched Whisper calls
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from config import *
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionScheduler:
+    def __init__(self, batch_handler, max_batch_size=TRANSCRIBE_MAX_BATCH_SIZE,
+                 batch_window_ms=TRANSCRIBE_BATCH_WINDOW_MS):
+        """
+        Initialize the scheduler
+
+        Args:
+            batch_handler: Callable taking a list of audio arrays and returning one result dict each
+            max_batch_size: Maximum number of requests decoded together
+            batch_window_ms: How long to wait for more requests before running a partial batch
+        """
+        self.batch_handler = batch_handler
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window_ms / 1000.0
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.batches = 0
+        self.requests = 0
+
+    def _ensure_started(self):
+        """Start the scheduler thread on first use (caller holds the lock)"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="transcription-scheduler", daemon=True)
+            self.thread.start()
+
+    def submit(self, audio):
+        """
+        Queue audio for transcription
+
+        Returns:
+            Future: Resolves to the transcription result dict
+        """
+        future = Future()
+        with self.condition:
+            self._ensure_started()
+            self.pending.append((audio, future))
+            self.condition.notify()
+        return future
+
+    def transcribe(self, audio):
+        """Queue audio and block until its transcription is ready"""
+        return self.submit(audio).result()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                # Give concurrent requests a short window to join the batch
+                deadline = time.time() + self.batch_window
+                while len(self.pending) < self.max_batch_size:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch = [self.pending.popleft()
+                         for _ in range(min(self.max_batch_size, len(self.pending)))]
+                self.batches += 1
+                self.requests += len(batch)
+
+            try:
+                results = self.batch_handler([audio for audio, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Error transcribing batch of {len(batch)}: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def stats(self):
+        """Get scheduler statistics"""
+        with self.condition:
+            return {
+                "pending": len(self.pending),
+                "batches": self.batches,
+                "requests": self.requests,
+                "average_batch_size": self.requests / self.batches if self.batches else 0.0,
+            }
@@ -0,0 +1,360 @@
+"""
+Process pool of inference workers, each owning its own pipelines
+"""
+
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+from config import *
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerCrashedError(Exception):
+    """Raised when an inference worker dies while handling a task"""
+
+
+class _RemoteProgress:
+    """Worker-side progress sink that forwards reports to the parent process"""
+
+    def __init__(self, result_queue, worker_id, task_id, cancel_flags, preview_mask):
+        self.result_queue = result_queue
+        self.worker_id = worker_id
+        self.task_id = task_id
+        self.cancel_flags = cancel_flags
+        self.mask = preview_mask
+
+    def preview_mask(self):
+        return self.mask
+
+    def cancelled(self):
+        return [bool(self.cancel_flags[index]) for index in range(len(self.mask))]
+
+    def report(self, step, total_steps, eta_seconds, previews=None, phase=None):
+        self.result_queue.put(("progress", self.worker_id, self.task_id,
+                               (step, total_steps, eta_seconds, previews, phase)))
+
+    def publish_drafts(self, drafts):
+        self.result_queue.put(("draft", self.worker_id, self.task_id, drafts))
+
+
+def _worker_main(worker_id, task_queue, result_queue, cancel_flags, num_threads, warm_styles):
+    """Entry point of an inference worker process"""
+    from cpu_backend import configure_threads
+    configure_threads(num_threads, CPU_INTER_OP_THREADS)
+
+    import metrics
+    from image_service import ImageService
+    service = ImageService()
+    
+    def ship_metrics():
+        # Observations recorded here are merged into the parent's registry
+        if metrics.enabled:
+            result_queue.put(("metrics", worker_id, None, metrics.registry.drain()))
+
+    def heartbeat():
+        while True:
+            try:
+                result_queue.put(("heartbeat", worker_id, None, {
+                    "memory": service.get_memory_usage(),
+                    "models_loaded": service.get_loaded_models(),
+                    "embedding_cache": service.get_embedding_cache_stats(),
+                    "model_tiers": service.get_model_tier_stats(),
+                    "inference_backend": service.get_inference_backend_stats(),
+                }))
+                ship_metrics()
+            except Exception as e:
+                logger.error(f"Worker {worker_id} heartbeat failed: {e}")
+            time.sleep(WORKER_HEARTBEAT_INTERVAL)
+
+    threading.Thread(target=heartbeat, name="worker-heartbeat", daemon=True).start()
+
+    # Restarted workers warm their preloaded models before taking traffic
+    for style in warm_styles:
+        try:
+            service.warmup(style)
+        except Exception as e:
+            logger.error(f"Worker {worker_id} failed to warm {style}: {e}")
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, method, kwargs = task
+        preview_mask = kwargs.pop("progress_preview_mask", None)
+        if preview_mask is not None:
+            kwargs["progress"] = _RemoteProgress(result_queue, worker_id, task_id, cancel_flags, preview_mask)
+        try:
+            result = getattr(service, method)(**kwargs)
+            ship_metrics()
+            result_queue.put(("result", worker_id, task_id, result))
+        except Exception as e:
+            ship_metrics()
+            result_queue.put(("error", worker_id, task_id, str(e)))
+
+
+class _WorkerHandle:
+    """Parent-side state for one worker slot"""
+
+    def __init__(self, worker_id, cancel_flags):
+        self.worker_id = worker_id
+        self.cancel_flags = cancel_flags
+        self.process = None
+        self.task_queue = None
+        self.current_task = None
+        self.busy_since = None
+        self.last_heartbeat = 0
+        self.info = {}
+        self.restarts = 0
+
+
+class InferenceWorkerPool:
+    def __init__(self, num_workers=INFERENCE_WORKERS, threads_per_worker=TORCH_THREADS_PER_WORKER):
+        """
+        Initialize the pool (processes are started by start())
+
+        Args:
+            num_workers: Number of inference processes
+            threads_per_worker: torch intra-op threads pinned in each process
+        """
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        self.context = multiprocessing.get_context("spawn")
+        self.result_queue = self.context.Queue()
+        self.workers = [
+            _WorkerHandle(index, self.context.Array("b", MAX_BATCH_SIZE, lock=False))
+            for index in range(num_workers)
+        ]
+        self.idle = queue.Queue()
+        self.tasks = {}
+        self.lock = threading.Lock()
+        self.running = False
+
+    def start(self):
+        """Start the worker processes and the dispatcher/monitor threads"""
+        if self.running:
+            return
+        self.running = True
+        for handle in self.workers:
+            self._spawn(handle, warm_styles=[])
+            self.idle.put(handle.worker_id)
+        threading.Thread(target=self._dispatch_results, name="pool-dispatcher", daemon=True).start()
+        threading.Thread(target=self._monitor, name="pool-monitor", daemon=True).start()
+        logger.info(f"Started {self.num_workers} inference worker(s) with "
+                    f"{self.threads_per_worker} torch thread(s) each")
+
+    def stop(self):
+        """Ask every worker to exit and wait for them"""
+        self.running = False
+        for handle in self.workers:
+            if handle.process is not None and handle.process.is_alive():
+                handle.task_queue.put(None)
+        for handle in self.workers:
+            if handle.process is not None:
+                handle.process.join(timeout=10)
+
+    def _spawn(self, handle, warm_styles):
+        handle.task_queue = self.context.Queue()
+        handle.process = self.context.Process(
+            target=_worker_main,
+            args=(handle.worker_id, handle.task_queue, self.result_queue, handle.cancel_flags,
+                  self.threads_per_worker, warm_styles),
+            name=f"inference-worker-{handle.worker_id}",
+            daemon=True
+        )
+        handle.process.start()
+        handle.last_heartbeat = time.time()
+        logger.info(f"Inference worker {handle.worker_id} started (pid {handle.process.pid})")
+
+    def _call_on(self, worker_id, method, progress=None, **kwargs):
+        """Run a method on a specific worker and block for its result"""
+        handle = self.workers[worker_id]
+        task_id = uuid.uuid4().hex
+        task = {"event": threading.Event(), "result": None, "error": None, "progress": progress}
+        if progress is not None:
+            # The progress sink stays in this process; the worker reports
+            # over the result queue and reads cancellations from shared flags
+            for index in range(len(handle.cancel_flags)):
+                handle.cancel_flags[index] = 0
+            kwargs["progress_preview_mask"] = progress.preview_mask()
+        with self.lock:
+            self.tasks[task_id] = task
+            handle.current_task = task_id
+            handle.busy_since = time.time()
+        handle.task_queue.put((task_id, method, kwargs))
+        task["event"].wait()
+        with self.lock:
+            self.tasks.pop(task_id, None)
+            if handle.current_task == task_id:
+                handle.current_task = None
+                handle.busy_since = None
+        if task["error"] is not None:
+            raise task["error"]
+        return task["result"]
+
+    def call(self, method, progress=None, **kwargs):
+        """Run an ImageService method on the next free worker"""
+        worker_id = self.idle.get()
+        try:
+            return self._call_on(worker_id, method, progress=progress, **kwargs)
+        finally:
+            self.idle.put(worker_id)
+
+    def _dispatch_results(self):
+        while self.running:
+            try:
+                kind, worker_id, task_id, payload = self.result_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            handle = self.workers[worker_id]
+            if kind == "metrics":
+                metrics.registry.merge(payload)
+                continue
+            if kind == "heartbeat":
+                handle.last_heartbeat = time.time()
+                handle.info = payload
+                continue
+
+            with self.lock:
+                task = self.tasks.get(task_id)
+            if task is None:
+                continue
+            if kind == "progress":
+                task["progress"].report(*payload)
+                for index, cancelled in enumerate(task["progress"].cancelled()):
+                    handle.cancel_flags[index] = int(cancelled)
+                continue
+            if kind == "draft":
+                task["progress"].publish_drafts(payload)
+                continue
+            if kind == "result":
+                task["result"] = payload
+            else:
+                task["error"] = RuntimeError(payload)
+            task["event"].set()
+
+    def _monitor(self):
+        while self.running:
+            time.sleep(WORKER_HEARTBEAT_INTERVAL)
+            for handle in self.workers:
+                alive = handle.process.is_alive()
+                stale = time.time() - handle.last_heartbeat > WORKER_HEARTBEAT_TIMEOUT
+                if alive and not stale:
+                    continue
+
+                reason = "exited" if not alive else "stopped sending heartbeats"
+                logger.error(f"Inference worker {handle.worker_id} {reason}; restarting")
+                if alive:
+                    handle.process.kill()
+                handle.process.join(timeout=5)
+
+                # Fail the task it was running so the caller can report the error
+                with self.lock:
+                    task = self.tasks.get(handle.current_task)
+                if task is not None:
+                    task["error"] = WorkerCrashedError(f"Inference worker {handle.worker_id} crashed")
+                    task["event"].set()
+
+                handle.restarts += 1
+                handle.info = {}
+                self._spawn(handle, warm_styles=PRELOAD_MODELS)
+
+    def generate_batch(self, prompts, style, steps=DEFAULT_INFERENCE_STEPS, size=IMAGE_SIZE,
+                       seeds=None, images_dir=IMAGES_DIR, progress=None, output_formats=None,
+                       sliced=False, scheduler=None, guidance_scale=DEFAULT_GUIDANCE_SCALE, refine=False):
+        """Run ImageService.generate_batch on a free worker"""
+        try:
+            return self.call("generate_batch", progress=progress, prompts=prompts, style=style,
+                             steps=steps, size=size, seeds=seeds, images_dir=images_dir,
+                             output_formats=output_formats, sliced=sliced, scheduler=scheduler,
+                             guidance_scale=guidance_scale, refine=refine)
+        except WorkerCrashedError as e:
+            return [{"success": False, "error": str(e)} for _ in prompts]
+
+    def warmup(self, style):
+        """Warm a model on every worker"""
+        worker_ids = [self.idle.get() for _ in self.workers]
+        try:
+            for worker_id in worker_ids:
+                self._call_on(worker_id, "warmup", style=style)
+        finally:
+            for worker_id in worker_ids:
+                self.idle.put(worker_id)
+
+    def get_memory_usage(self):
+        """Total memory usage across workers, as last reported by their heartbeats"""
+        usage = {"cpu_memory_mb": 0, "gpu_memory_mb": 0, "models_loaded": 0}
+        for handle in self.workers:
+            for key in usage:
+                usage[key] += handle.info.get("memory", {}).get(key, 0)
+        return usage
+
+    def get_loaded_models(self):
+        """Styles loaded in any worker"""
+        styles = set()
+        for handle in self.workers:
+            styles.update(handle.info.get("models_loaded", []))
+        return sorted(styles)
+
+    def prefetch(self, style):
+        """
+        Start loading a style in the worker most likely to run the next job
+        
+        That is the next idle worker, or if all are busy the one busy the
+        longest. The task is fire-and-forget: the worker's prefetch returns
+        at once and loads in the background, and the dispatcher drops its
+        result since no caller waits on the task id.
+        """
+        with self.idle.mutex:
+            next_idle = self.idle.queue[0] if self.idle.queue else None
+        if next_idle is not None:
+            handle = self.workers[next_idle]
+        else:
+            busy = [handle for handle in self.workers if handle.busy_since is not None]
+            if not busy:
+                return
+            handle = min(busy, key=lambda handle: handle.busy_since)
+        if style in handle.info.get("models_loaded", []):
+            return
+        if handle.process is None or not handle.process.is_alive():
+            return
+        handle.task_queue.put((uuid.uuid4().hex, "prefetch", {"style": style}))
+    
+    def get_model_tier_stats(self):
+        """Model residency per worker"""
+        return {f"worker-{handle.worker_id}": handle.info.get("model_tiers", {})
+                for handle in self.workers}
+
+    def get_inference_backend_stats(self):
+        """Inference backend per worker"""
+        return {f"worker-{handle.worker_id}": handle.info.get("inference_backend", {})
+                for handle in self.workers}
+
+    def get_embedding_cache_stats(self):
+        """Embedding cache statistics per worker"""
+        return {f"worker-{handle.worker_id}": handle.info.get("embedding_cache", {})
+                for handle in self.workers}
+
+    def is_generating(self):
+        """Check whether any worker is running a task"""
+        return any(handle.current_task is not None for handle in self.workers)
+
+    def status(self):
+        """Per-worker health information"""
+        now = time.time()
+        return [{
+            "worker_id": handle.worker_id,
+            "pid": handle.process.pid if handle.process is not None else None,
+            "alive": handle.process is not None and handle.process.is_alive(),
+            "busy": handle.current_task is not None,
+            "seconds_since_heartbeat": now - handle.last_heartbeat,
+            "restarts": handle.restarts,
+            "models_loaded": handle.info.get("models_loaded", []),
+        } for handle in self.workers]
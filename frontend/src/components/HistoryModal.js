@@ -26,8 +26,9 @@ export const HistoryModal = ({
         {imageHistory.map((item) => (
           <div key={item.id} className="bg-white/80 rounded-xl p-4 border border-amber-200 hover:shadow-lg transition-shadow">
             <img 
-              src={item.image} 
+              src={item.thumbnail || item.image} 
               alt={item.prompt} 
+              loading="lazy"
               className="w-full h-32 object-cover rounded-lg mb-3" 
             />
             <p className="text-sm text-stone-700 mb-2 truncate">{item.prompt}</p>
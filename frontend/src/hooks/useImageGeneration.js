@@ -1,5 +1,5 @@
-import { useState, useCallback } from 'react';
-import { generateImage } from '../services/api';
+import { useState, useCallback, useRef } from 'react';
+import { generateImage, cancelJob } from '../services/api';
 
 /**
  * Custom hook for managing image generation state and API calls
@@ -9,21 +9,38 @@ export const useImageGeneration = () => {
   const [isGenerating, setIsGenerating] = useState(false);
   const [generatedImage, setGeneratedImage] = useState(null);
   const [error, setError] = useState(null);
+  const [progress, setProgress] = useState(null);
+  const jobIdRef = useRef(null);
 
   const generateImageHandler = useCallback(async (request) => {
     setIsGenerating(true);
     setError(null);
+    setProgress(null);
     
     try {
-      const response = await generateImage(request);
+      const response = await generateImage(
+        request,
+        (job) => setProgress(job.progress || null),
+        (jobId) => {
+          jobIdRef.current = jobId;
+        }
+      );
       setGeneratedImage(response);
     } catch (err) {
       setError(err instanceof Error ? err.message : 'Failed to generate image');
     } finally {
+      jobIdRef.current = null;
+      setProgress(null);
       setIsGenerating(false);
     }
   }, []);
 
+  const cancelGeneration = useCallback(async () => {
+    if (jobIdRef.current) {
+      await cancelJob(jobIdRef.current);
+    }
+  }, []);
+
   const clearError = useCallback(() => {
     setError(null);
   }, []);
@@ -36,7 +53,9 @@ export const useImageGeneration = () => {
     isGenerating,
     generatedImage,
     error,
+    progress,
     generateImage: generateImageHandler,
+    cancelGeneration,
     clearError,
     clearGeneratedImage,
   };
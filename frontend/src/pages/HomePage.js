@@ -183,6 +183,7 @@ export const HomePage = () => {
         id: Date.now(),
         prompt: transcribedText || textInput || 'Generated artwork',
         image: `${API_BASE}/${generatedImage.image_path}`,
+        thumbnail: `${API_BASE}${generatedImage.thumbnail_url}`,
         created: 'Just now',
         model_name: generatedImage.model_name,
         selected_style: generatedImage.selected_style,
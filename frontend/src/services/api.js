@@ -54,17 +54,106 @@ api.interceptors.response.use(
   }
 );
 
+/**
+ * Get generation job status
+ * @param {string} jobId - The job id returned by /generate-image
+ * @param {number} wait - Seconds the server may hold the request until the job finishes
+ * @returns {Promise<Object>} The job status
+ */
+export const getJob = async (jobId, wait = 0) => {
+  const response = await api.get(`/jobs/${jobId}`, { params: { wait } });
+  return response.data;
+};
+
+/**
+ * Cancel a queued or running generation job
+ * @param {string} jobId - The job id returned by /generate-image
+ * @returns {Promise<Object>} The job status after cancellation
+ */
+export const cancelJob = async (jobId) => {
+  const response = await api.post(`/jobs/${jobId}/cancel`);
+  return response.data;
+};
+
+/**
+ * Follow a job over server-sent events until it finishes
+ * @param {string} jobId - The job id returned by /generate-image
+ * @param {Function} onProgress - Called with each progress update
+ * @returns {Promise<Object>} The finished job
+ */
+const watchJobEvents = (jobId, onProgress) =>
+  new Promise((resolve, reject) => {
+    const source = new EventSource(`${API_BASE}/jobs/${jobId}/events`);
+    source.addEventListener('progress', (event) => {
+      onProgress(JSON.parse(event.data));
+    });
+    ['completed', 'failed', 'cancelled'].forEach((type) => {
+      source.addEventListener(type, (event) => {
+        source.close();
+        resolve(JSON.parse(event.data));
+      });
+    });
+    source.onerror = () => {
+      source.close();
+      reject(new Error('Event stream closed'));
+    };
+  });
+
+/**
+ * Follow a job by long-polling until it finishes
+ * @param {string} jobId - The job id returned by /generate-image
+ * @returns {Promise<Object>} The finished job
+ */
+const pollJob = async (jobId) => {
+  for (;;) {
+    const job = await getJob(jobId, 25);
+    if (['completed', 'failed', 'cancelled'].includes(job.status)) {
+      return job;
+    }
+  }
+};
+
 /**
  * Generate image from text prompt
  * @param {Object} request - The image generation request
  * @param {string} request.prompt - The text prompt
+ * @param {Function} [onProgress] - Called with job progress (step, ETA, preview)
+ * @param {Function} [onQueued] - Called with the job id once the job is queued
  * @returns {Promise<Object>} The generated image response
  */
-export const generateImage = async (request) => {
+export const generateImage = async (request, onProgress, onQueued) => {
   const response = await api.post('/generate-image', {
     prompt: request.prompt,
+    preview: Boolean(onProgress),
   });
-  return response.data;
+
+  // Cached results come back finished; otherwise follow the queued job
+  if (response.data.status === 'completed') {
+    return response.data.result;
+  }
+  const { job_id: jobId } = response.data;
+  if (onQueued) {
+    onQueued(jobId);
+  }
+
+  let job;
+  if (onProgress && typeof EventSource !== 'undefined') {
+    try {
+      job = await watchJobEvents(jobId, onProgress);
+    } catch (err) {
+      job = await pollJob(jobId);
+    }
+  } else {
+    job = await pollJob(jobId);
+  }
+
+  if (job.status === 'completed') {
+    return job.result;
+  }
+  if (job.status === 'cancelled') {
+    throw new Error('Generation cancelled');
+  }
+  throw new Error(job.error || 'Failed to generate image');
 };
 
 /**
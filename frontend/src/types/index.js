@@ -13,6 +13,7 @@
  * @property {number} id - Unique identifier
  * @property {string} prompt - The prompt used to generate the image
  * @property {string} image - URL to the generated image
+ * @property {string} [thumbnail] - URL to a small variant shown in the history
  * @property {string} created - When the image was created
  * @property {string} [model_name] - Name of the model used
  * @property {string} [selected_style] - Style that was selected
@@ -30,6 +31,7 @@
 /**
  * @typedef {Object} ImageGenerationResponse
  * @property {string} image_path - Path to the generated image
+ * @property {string} thumbnail_url - Path to a 256px thumbnail of the generated image
  * @property {string} selected_style - Style that was selected
  * @property {string} model_name - Name of the model used
  * @property {number} dreamshaper_score - Score for dreamshaper model